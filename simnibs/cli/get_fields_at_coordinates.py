@@ -98,7 +98,8 @@ def parse_arguments(argv):
 
 def main():
     args = parse_arguments(sys.argv[1:])
-    msh = mesh_io.read_msh(os.path.abspath(os.path.realpath(os.path.expanduser(args.mesh))))
+    msh = mesh_io.read_msh(
+        os.path.abspath(os.path.realpath(os.path.expanduser(args.mesh))), mmap=True)
     fn_csv = os.path.expanduser(args.csv)
     if args.l is not None:
         labels = [int(n) for n in args.l[0].split(',')]
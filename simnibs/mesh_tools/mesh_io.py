@@ -30,7 +30,8 @@ import gc
 import hashlib
 import subprocess
 import threading
-from itertools import combinations
+import weakref
+from itertools import combinations, islice
 from typing import Union
 from functools import partial
 
@@ -728,6 +729,192 @@ def make_surface_mesh(vertices, faces):
     return Msh(Nodes(vertices), Elements(faces))
 
 
+def grid_distance_function(grid, affine, order=3):
+    """Interpolating function of a signed distance field stored on a grid
+
+    Points outside the grid are assigned the value of the closest grid point
+    plus the distance to the grid border.
+
+    Parameters
+    ----------
+    grid : npt.NDArray[np.float_]
+        The voxelized distance field
+    affine : npt.NDArray[np.float_]
+        The affine transformation from voxel to world coordinates
+    order : int
+        The order of the interpolation, by default 3
+
+    Returns
+    -------
+    min_distance_on_grid : Callable
+        Function evaluating the distance field at (N x 3) world coordinates
+    """
+    iM = np.linalg.inv(affine)
+
+    def min_distance_on_grid(x):
+        x_coords, y_coords, z_coords = iM[:3, :3] @ x.T + iM[:3, 3, None]
+        width, height, depth = grid.shape
+
+        # Filter coordinates that are outside the image boundaries
+        outside_image_mask = ~(
+                (x_coords >= 0)
+                & (x_coords < width)
+                & (y_coords >= 0)
+                & (y_coords < height)
+                & (z_coords >= 0)
+                & (z_coords < depth)
+        )
+
+        mapped_values = scipy.ndimage.map_coordinates(
+            grid,
+            (
+                x_coords,
+                y_coords,
+                z_coords,
+            ),
+            order=order, mode='nearest', prefilter=False
+        )
+
+        mapped_values[outside_image_mask] += np.sqrt(
+            np.maximum(x_coords[outside_image_mask] - width, 0)**2 +
+            np.maximum(y_coords[outside_image_mask] - height, 0)**2 +
+            np.maximum(z_coords[outside_image_mask] - depth, 0)**2
+        )
+
+        return mapped_values
+
+    return min_distance_on_grid
+
+
+class _PointLocationIndex:
+    ''' Data structures for locating points in the tetrahedra of a mesh
+
+    Holds the tetrahedra nodes, the face adjacency and a KD-tree over the
+    tetrahedra baricenters, used by the walking algorithm in
+    Msh.find_tetrahedron_with_points
+
+    Parameters
+    -----------
+    msh: simnibs.msh.Msh
+        Mesh structure
+    '''
+    def __init__(self, msh):
+        self._mesh_refs = [self._ref(a) for a in self.mesh_arrays(msh)]
+        self.th_indices = msh.elm.tetrahedra
+        if len(self.th_indices) == 0:
+            self.th_nodes = self.th_faces = self.adjacency_list = self.kdtree = None
+            return
+        th_nodes = msh.nodes[msh.elm[self.th_indices]]
+        self.th_nodes = np.array(th_nodes, dtype=float)
+        _, th_faces, adjacency_list = msh.elm.get_faces(self.th_indices)
+        self.th_faces = np.array(th_faces, dtype=int)
+        self.adjacency_list = np.array(adjacency_list, dtype=int)
+        self.kdtree = scipy.spatial.cKDTree(np.average(self.th_nodes, axis=1))
+
+    @staticmethod
+    def mesh_arrays(msh):
+        ''' Arrays defining the geometry of the mesh '''
+        return [msh.nodes.node_coord, msh.elm.node_number_list, msh.elm.elm_type]
+
+    @staticmethod
+    def _ref(a):
+        try:
+            return weakref.ref(a)
+        except TypeError:
+            return None
+
+    def is_valid(self, msh):
+        ''' Whether the index was built for the current nodes and elements
+
+        The arrays are compared by identity, so the index is invalidated when
+        they are assigned to, without reading them. Methods changing the arrays
+        in-place call Msh.clear_point_location_index
+        '''
+        return all(
+            r is not None and r() is a
+            for r, a in zip(self._mesh_refs, self.mesh_arrays(msh))
+        )
+
+
+class InterpolationOperator:
+    ''' Sparse linear operator interpolating mesh fields to points or to a grid
+
+    The geometry (point location and, for element data, the patch recovery) is
+    done once when building the operator, with Msh.interpolation_operator.
+    Applying it to a field, or to several fields stacked in the last axis, is
+    then a single sparse matrix product
+
+    Parameters
+    -----------
+    matrix: scipy.sparse.csr_matrix
+        (N_out x N_in) matrix. N_in is the number of nodes for node data or the
+        number of elements for element data
+    out_shape: tuple
+        Shape of the output, (N,) for points and (nx, ny, nz) for grids
+    outside: ndarray of bool
+        Output positions which are outside the volume mesh
+    out_fill: float
+        Value given to the output positions outside the volume mesh
+    '''
+    def __init__(self, matrix, out_shape, outside, out_fill=0.):
+        self.matrix = scipy.sparse.csr_matrix(matrix)
+        self.out_shape = tuple(int(s) for s in out_shape)
+        self.outside = np.asarray(outside, dtype=bool)
+        self.out_fill = out_fill
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    def apply(self, values):
+        ''' Interpolates fields
+
+        Parameters
+        -----------
+        values: ndarray, Data or list
+            Values in the nodes (or elements), with shape (N_in,) or
+            (N_in, n_comp), or a list of those. Lists are stacked in a last
+            axis and interpolated together
+
+        Returns
+        --------
+        out: ndarray
+            Interpolated values, with shape out_shape + values.shape[1:]
+        '''
+        if isinstance(values, (list, tuple)):
+            values = np.stack(
+                [v.value if isinstance(v, Data) else np.asarray(v) for v in values],
+                axis=-1)
+        elif isinstance(values, Data):
+            values = values.value
+        values = np.asarray(values)
+        if values.shape[0] != self.matrix.shape[1]:
+            raise ValueError(
+                f'Expected {self.matrix.shape[1]} values, got {values.shape[0]}')
+        out = self.matrix @ values.reshape(values.shape[0], -1)
+        if self.out_fill != 0 and np.any(self.outside):
+            out = out.astype(np.result_type(out, self.out_fill))
+            out[self.outside] = self.out_fill
+        return out.reshape(self.out_shape + values.shape[1:])
+
+    def save(self, fn):
+        ''' Saves the operator to a ".npz" file '''
+        M = self.matrix
+        np.savez(fn, data=M.data, indices=M.indices, indptr=M.indptr,
+                 shape=np.array(M.shape), out_shape=np.array(self.out_shape),
+                 outside=np.packbits(self.outside), out_fill=self.out_fill)
+
+    @classmethod
+    def load(cls, fn):
+        ''' Loads an operator saved with InterpolationOperator.save '''
+        with np.load(fn) as f:
+            shape = tuple(f['shape'])
+            M = scipy.sparse.csr_matrix(
+                (f['data'], f['indices'], f['indptr']), shape=shape)
+            outside = np.unpackbits(f['outside'], count=shape[0]).astype(bool)
+            return cls(M, f['out_shape'], outside, f['out_fill'].item())
+
+
 class Msh:
     """class to handle the meshes.
     Gathers Nodes, Elements and Data
@@ -775,6 +962,12 @@ class Msh:
         if fn is not None:
             self = read_msh(fn, m=self)
 
+    def __getstate__(self):
+        # the point location index is rebuilt when needed
+        state = self.__dict__.copy()
+        state.pop('_point_location', None)
+        return state
+
     @property
     def field(self):
         '''Dictionary of fields indexed by their name'''
@@ -784,12 +977,19 @@ class Msh:
     def write(self, out_fn):
         ''' Writes out the mesh as a ".msh" file
 
+        If the file name ends with ".hdf5" or ".h5", the mesh is written as
+        uncompressed HDF5 instead, which read_msh can memory-map. If the file
+        exists, only the mesh is replaced
+
         Parameters
         ---------------
         out_fn: str
             Name of output file
         '''
-        write_msh(self, out_fn)
+        if os.path.splitext(out_fn)[1].lower() in ['.hdf5', '.h5']:
+            self.write_hdf5(out_fn)
+        else:
+            write_msh(self, out_fn)
 
     def crop_mesh(self, tags=None, elm_type=None, nodes=None, elements=None):
         """ Crops the specified tags from the mesh
@@ -1192,6 +1392,13 @@ class Msh:
             compression strategy: "gzip", "lzf", "szip", None
 
         """
+        # arrays memory-mapped from the file are read before their datasets
+        # are replaced
+        fn = os.path.abspath(os.path.expanduser(hdf5_fn))
+        for obj in [self.elm, self.nodes] + self.elmdata + self.nodedata:
+            for key, value in vars(obj).items():
+                if isinstance(value, np.memmap) and value.filename == fn:
+                    setattr(obj, key, np.array(value))
         with h5py.File(hdf5_fn, 'a') as f:
             try:
                 g = f.create_group(path)
@@ -1203,6 +1410,10 @@ class Msh:
                 del g['nodes']
             if 'fields' in g.keys():
                 del g['fields']
+            if 'elmdata' in g.keys():
+                del g['elmdata']
+            if 'nodedata' in g.keys():
+                del g['nodedata']
             g.attrs['fn'] = self.fn
             elm = g.create_group('elm')
             for key, value in vars(self.elm).items():
@@ -1247,7 +1458,7 @@ class Msh:
         return shared_nodes
 
     @classmethod
-    def read_hdf5(self, hdf5_fn, path='./', load_data=True):
+    def read_hdf5(self, hdf5_fn, path='./', load_data=True, mmap=False):
         """ Reads mesh information from an hdf5 file
 
         Parameters
@@ -1256,37 +1467,16 @@ class Msh:
             file name of hdf5 file
         path: str
             path in the hdf5 file where the mesh is saved
+        load_data: bool
+            Wether to read the node and element data. Default: True
+        mmap: bool
+            Wether to memory-map the arrays stored without compression instead
+            of loading them. The data is then only read from disk when accessed,
+            and changes to the arrays are not written back to the file.
+            Default: False
         """
-        import h5py
         self = self()
-        with h5py.File(hdf5_fn, 'r') as f:
-            g = f[path]
-            try:
-                self.fn = g.attrs['fn']
-            except KeyError:
-                pass
-            for key, value in self.elm.__dict__.items():
-                setattr(self.elm, key, np.squeeze(np.array(g['elm'][key])))
-            for key, value in self.nodes.__dict__.items():
-                try:
-                    setattr(self.nodes, key, np.squeeze(np.array(g['nodes'][key])))
-                except KeyError:
-                    pass
-            if load_data:
-                try:
-                    for field_name, field in g['elmdata'].items():
-                        self.elmdata.append(
-                            ElementData(np.squeeze(np.array(field)), field_name, mesh=self))
-                except KeyError:
-                    pass
-
-                try:
-                    for field_name, field in g['nodedata'].items():
-                        self.nodedata.append(
-                            NodeData(np.squeeze(np.array(field)), field_name, mesh=self))
-                except KeyError:
-                    pass
-
+        _read_hdf5(self, hdf5_fn, path, load_data, mmap)
         return self
 
     def open_in_gmsh(self):
@@ -1547,6 +1737,34 @@ class Msh:
 
 
 
+    def get_point_location_index(self):
+        ''' Index used to locate points in the tetrahedra of the mesh
+
+        The index is built on the first call and kept with the mesh. It is
+        rebuilt when the node coordinates or the elements are assigned to, so
+        that repeated interpolations in the same mesh do not redo the geometry
+        work. Code changing these arrays in-place needs to call
+        clear_point_location_index
+
+        Returns
+        ----------
+        index: _PointLocationIndex
+            Tetrahedra nodes, face adjacency and KD-tree of the baricenters
+        '''
+        index = getattr(self, '_point_location', None)
+        if index is None or not index.is_valid(self):
+            index = _PointLocationIndex(self)
+            self._point_location = index
+        return index
+
+    def clear_point_location_index(self):
+        ''' Removes the index used to locate points in the tetrahedra
+
+        Needs to be called after changing the node coordinates or the elements
+        in-place. Can also be used to release the memory of the index
+        '''
+        self._point_location = None
+
     def find_tetrahedron_with_points(self, points, compute_baricentric=True):
         ''' Finds the tetrahedron that contains each of the described points using a
         stochastic walk algorithm
@@ -1573,57 +1791,38 @@ class Msh:
         triangulation." International Journal of Foundations of Computer Science 13.02
         (2002): 181-199.
         '''
-        #
-        th_indices = self.elm.tetrahedra
-        th_nodes = self.nodes[self.elm[th_indices]]
-        # Reduce the number of elements
-        points_max = np.max(points, axis=0)
-        points_min = np.min(points, axis=0)
-        th_max = np.max(th_nodes, axis=1)
-        th_min = np.min(th_nodes, axis=1)
-        slack = (points_max - points_min) * .05
-        th_in_box = np.where(
-            np.all(
-                (th_min <= points_max + slack) * (th_max >= points_min - slack), axis=1))[0]
-        th_indices = th_indices[th_in_box]
-        # if all the points are outside the bounding box
+        index = self.get_point_location_index()
+        th_indices = index.th_indices
+        th_nodes = index.th_nodes
+        # if the mesh has no tetrahedra
         if len(th_indices) == 0:
             if compute_baricentric:
-                return -np.ones(len(points), dtype=int), np.zeros_like(points)
+                return -np.ones(len(points), dtype=int), np.zeros((len(points), 4))
             else:
                 return -np.ones(len(points), dtype=int)
-        th_nodes = th_nodes[th_in_box]
-
-        # Calculate a few things we will use later
-        faces, th_faces, adjacency_list = self.elm.get_faces(th_indices)
-        # Find initial positions
-        th_baricenters = np.average(th_nodes, axis=1)
-        kdtree = scipy.spatial.cKDTree(th_baricenters)
 
         # Starting position for walking algorithm: the closest baricenter
-        _, closest_th = kdtree.query(points)
+        _, closest_th = index.kdtree.query(points)
         pts = np.array(points, dtype=float)
-        th_nodes = np.array(th_nodes, dtype=float)
         closest_th = np.array(closest_th, dtype=int)
-        th_faces = np.array(th_faces, dtype=int)
-        adjacency_list = np.array(adjacency_list, dtype=int)
         th_with_points = cython_msh.find_tetrahedron_with_points(
-            pts, th_nodes, closest_th, th_faces, adjacency_list)
+            pts, th_nodes, closest_th, index.th_faces, index.adjacency_list)
 
-        # calculate baricentric coordinates
+        # Return indices
         inside = th_with_points != -1
+        th_with_points[inside] = \
+            th_indices[th_with_points[inside]]
+
+        # calculate baricentric coordinates, with the current nodes and
+        # ordering of the tetrahedra
         if compute_baricentric:
-            M = np.transpose(th_nodes[th_with_points[inside], :3, :3] -
-                             th_nodes[th_with_points[inside], 3, None, :], (0, 2, 1))
+            th_coords = self.nodes[self.elm[th_with_points[inside]]]
+            M = np.transpose(th_coords[:, :3, :3] - th_coords[:, 3, None, :], (0, 2, 1))
             baricentric = np.zeros((len(points), 4), dtype=float)
             baricentric[inside, :3] = np.linalg.solve(
-                M, points[inside] - th_nodes[th_with_points[inside], 3, :])
+                M, points[inside] - th_coords[:, 3, :])
             baricentric[inside, 3] = 1 - np.sum(baricentric[inside], axis=1)
 
-        # Return indices
-        th_with_points[inside] = \
-            th_indices[th_with_points[inside]]
-
         if compute_baricentric:
             return th_with_points, baricentric
         else:
@@ -1697,6 +1896,7 @@ class Msh:
         self.elm.node_number_list[switch, 1] = self.elm.node_number_list[switch, 0]
         self.elm.node_number_list[switch, 0] = tmp
         del tmp
+        self.clear_point_location_index()
         gc.collect()
 
     def fix_tr_node_ordering(self):
@@ -1718,6 +1918,7 @@ class Msh:
         self.elm.node_number_list[switch, 1] = self.elm.node_number_list[switch, 0]
         self.elm.node_number_list[switch, 0] = tmp
         del tmp
+        self.clear_point_location_index()
         gc.collect()
 
 
@@ -1745,6 +1946,7 @@ class Msh:
             buffer = self.elm.node_number_list[idx_tr, 1].copy()
             self.elm.node_number_list[idx_tr, 1] = self.elm.node_number_list[idx_tr, 2]
             self.elm.node_number_list[idx_tr, 2] = buffer
+            self.clear_point_location_index()
 
 
     def compact_ordering(self, node_number):
@@ -2187,6 +2389,102 @@ class Msh:
 
         return M
 
+    def interpolation_operator(self, pos=None, n_voxels=None, affine=None,
+                               element_wise=False, continuous=True, out_fill=None):
+        ''' Builds a reusable operator interpolating fields to points or to a grid
+
+        Locates the target positions and, for element-wise data, performs the
+        superconvergent patch recovery only once, so that many fields in the
+        same mesh can be interpolated with a single sparse product
+
+        Parameters
+        ----------
+        pos: (N x 3) np.ndarray (optional)
+            Positions where interpolation is to be performed
+        n_voxels: list or tuple (optional)
+            number of voxels in x, y, and z directions. Used with "affine"
+            instead of "pos"
+        affine: ndarray (optional)
+            A 4x4 matrix specifying the transformation from voxels to xyz
+        element_wise: bool (optional)
+            Wether to interpolate element-wise data. Default: False
+        continuous: bool (optional)
+            Wether element-wise fields are continuous across tissue boundaries.
+            If False, the patch recovery is done separately for each tissue, as
+            in ElementData.interpolate_to_grid. Only used with
+            element_wise=True. Default: True
+        out_fill: float (optional)
+            Value for positions outside the volume. Default: NaN for
+            positions and 0 for grids
+
+        Returns
+        -------
+        op: simnibs.msh.InterpolationOperator
+            Interpolation operator. op.apply(values) interpolates the values
+        '''
+        if len(self.elm.tetrahedra) == 0:
+            raise InvalidMeshError('Mesh has no volume elements')
+        if pos is not None:
+            pos = np.asarray(pos, dtype=float)
+            out_shape = (len(pos),)
+            target = np.arange(len(pos))
+            if out_fill is None:
+                out_fill = np.nan
+        else:
+            if n_voxels is None or affine is None:
+                raise ValueError('Either pos or n_voxels and affine need to be set')
+            if len(n_voxels) != 3:
+                raise ValueError('n_voxels should have length = 3')
+            affine = np.asarray(affine, dtype=float)
+            if affine.shape != (4, 4):
+                raise ValueError('Affine should be a 4x4 matrix')
+            out_shape = tuple(int(n) for n in n_voxels)
+            # Only voxels in the bounding box of the volume mesh are located
+            th_nodes = np.unique(self.elm[self.elm.tetrahedra])
+            nd = np.hstack([self.nodes[th_nodes], np.ones((len(th_nodes), 1))])
+            nd = np.linalg.inv(affine).dot(nd.T).T[:, :3]
+            lower = np.maximum(np.floor(nd.min(axis=0)), 0).astype(int)
+            upper = np.minimum(np.ceil(nd.max(axis=0)) + 1, out_shape).astype(int)
+            if np.any(upper <= lower):
+                ijk = np.zeros((0, 3), dtype=int)
+            else:
+                ijk = np.mgrid[lower[0]:upper[0], lower[1]:upper[1],
+                               lower[2]:upper[2]].reshape(3, -1).T
+            target = np.ravel_multi_index(ijk.T, out_shape)
+            pos = ijk.dot(affine[:3, :3].T) + affine[:3, 3]
+            if out_fill is None:
+                out_fill = 0.
+
+        n_out = int(np.prod(out_shape))
+        th_with_points, bar = self.find_tetrahedron_with_points(
+            pos, compute_baricentric=True)
+        inside = th_with_points != -1
+
+        def barycentric_matrix(mask):
+            return scipy.sparse.csr_matrix(
+                (bar[mask].reshape(-1),
+                 (np.repeat(target[mask], 4),
+                  (self.elm[th_with_points[mask]] - 1).reshape(-1))),
+                shape=(n_out, self.nodes.nr))
+
+        if not element_wise:
+            M = barycentric_matrix(inside)
+        elif continuous:
+            M = barycentric_matrix(inside) @ self.elm2node_matrix(self.elm.tetrahedra)
+        else:
+            M = scipy.sparse.csr_matrix((n_out, self.elm.nr))
+            point_tags = np.zeros(len(pos), dtype=self.elm.tag1.dtype)
+            point_tags[inside] = self.elm.tag1[th_with_points[inside] - 1]
+            for t in np.unique(point_tags[inside]):
+                th_tag = self.elm.elm_number[
+                    (self.elm.tag1 == t) * (self.elm.elm_type == 4)]
+                M += barycentric_matrix(inside * (point_tags == t)) @ \
+                    self.elm2node_matrix(th_tag)
+
+        outside = np.ones(n_out, dtype=bool)
+        outside[target[inside]] = False
+        return InterpolationOperator(M.tocsr(), out_shape, outside, out_fill)
+
 
     def intersect_segment(self, near, far):
         ''' Finds the triangle (if any) that intersects a line segment
@@ -2390,7 +2688,6 @@ class Msh:
         M = np.identity(4) * resolution
         M[3, 3] = 1
         M[:3, 3] = np.floor(xmin - 5)
-        iM = np.linalg.inv(M)
 
         grid = np.zeros(xyz[0].shape, dtype="bool")
 
@@ -2401,37 +2698,7 @@ class Msh:
         grid = -inside + outside
         grid = (grid * resolution) - distance_offset
 
-        def min_distance_on_grid(x):
-            x_coords, y_coords, z_coords = iM[:3, :3] @ x.T + iM[:3, 3, None]
-            width, height, depth = grid.shape
-
-            # Filter coordinates that are outside the image boundaries
-            outside_image_mask = ~(
-                    (x_coords >= 0)
-                    & (x_coords < width)
-                    & (y_coords >= 0)
-                    & (y_coords < height)
-                    & (z_coords >= 0)
-                    & (z_coords < depth)
-            )
-
-            mapped_values = scipy.ndimage.map_coordinates(
-                grid,
-                (
-                    x_coords,
-                    y_coords,
-                    z_coords,
-                ),
-                order=order, mode='nearest', prefilter=False
-            )
-
-            mapped_values[outside_image_mask] += np.sqrt(
-                np.maximum(x_coords[outside_image_mask] - width, 0)**2 +
-                np.maximum(y_coords[outside_image_mask] - height, 0)**2 +
-                np.maximum(z_coords[outside_image_mask] - depth, 0)**2
-            )
-
-            return mapped_values
+        min_distance_on_grid = grid_distance_function(grid, M, order=order)
 
         return min_distance_on_grid, grid, M, AABBTree
 
@@ -4203,7 +4470,10 @@ class ElementData(Data):
 
         self._test_msh()
 
-        msh = copy.deepcopy(self.mesh)
+        # shallow copy, the fields below are added to the copy only
+        msh = copy.copy(self.mesh)
+        msh.nodedata = []
+        msh.elmdata = []
 
         if len(msh.elm.tetrahedra) == 0:
             raise InvalidMeshError('Mesh has no volume elements')
@@ -4215,7 +4485,7 @@ class ElementData(Data):
         if method == 'assign':
 
             th_with_points = \
-                msh.find_tetrahedron_with_points(points, compute_baricentric=False)
+                self.mesh.find_tetrahedron_with_points(points, compute_baricentric=False)
 
             if th_indices is not None:
                 th_with_points[~np.isin(th_with_points, th_indices)] = -1
@@ -4235,7 +4505,7 @@ class ElementData(Data):
 
             else:
 
-                th_with_points, bar = msh.find_tetrahedron_with_points(points, compute_baricentric=True)
+                th_with_points, bar = self.mesh.find_tetrahedron_with_points(points, compute_baricentric=True)
 
                 if th_indices is not None:
                     th_with_points[~np.isin(th_with_points, th_indices)] = -1
@@ -4521,45 +4791,29 @@ class ElementData(Data):
                 mode in which to write
         """
         with open(fn, 'ab') as f:
-            f.write(b'$ElementData\n')
-            # string tags
-            f.write((str(1) + '\n').encode('ascii'))
-            f.write(('"' + self.field_name + '"\n').encode('ascii'))
+            self._write_to_msh(f, mode)
 
-            f.write((str(1) + '\n').encode('ascii'))
-            f.write((str(0) + '\n').encode('ascii'))
+    def _write_to_msh(self, f, mode='binary'):
+        """Writes this ElementData field to an open ".msh" file"""
+        if mode not in ['ascii', 'binary']:
+            raise IOError("invalid mode:", mode)
+        f.write(b'$ElementData\n')
+        # string tags
+        f.write((str(1) + '\n').encode('ascii'))
+        f.write(('"' + self.field_name + '"\n').encode('ascii'))
 
-            f.write((str(4) + '\n').encode('ascii'))
-            f.write((str(0) + '\n').encode('ascii'))
-            f.write((str(self.nr_comp) + '\n').encode('ascii'))
-            f.write((str(self.nr) + '\n').encode('ascii'))
-            f.write((str(0) + '\n').encode('ascii'))
+        f.write((str(1) + '\n').encode('ascii'))
+        f.write((str(0) + '\n').encode('ascii'))
 
-            if mode == 'ascii':
-                for ii in range(self.nr):
-                    f.write((str(self.elm_number[ii]) + ' ' +
-                             str(self.value[ii]).translate(None, '[](),') +
-                             '\n').encode('ascii'))
-
-            elif mode == 'binary':
-
-                elm_number = self.elm_number.astype('int32')
-                value = self.value.astype('float64')
-                try:
-                    value.shape[1]
-                except IndexError:
-                    value = value[:, np.newaxis]
-                m = elm_number[:, np.newaxis]
-                for i in range(self.nr_comp):
-                    m = np.concatenate((m,
-                                        value[:, i].astype('float64').view('int32').reshape(-1, 2)),
-                                       axis=1)
-                f.write(m.tobytes())
+        f.write((str(4) + '\n').encode('ascii'))
+        f.write((str(0) + '\n').encode('ascii'))
+        f.write((str(self.nr_comp) + '\n').encode('ascii'))
+        f.write((str(self.nr) + '\n').encode('ascii'))
+        f.write((str(0) + '\n').encode('ascii'))
 
-            else:
-                raise IOError("invalid mode:", mode)
+        _write_msh_data_rows(f, self.elm_number, self.value, mode)
 
-            f.write(b'$EndElementData\n')
+        f.write(b'$EndElementData\n')
 
     def write(self, fn):
         """Writes this ElementData fields to a file with field information only
@@ -4778,7 +5032,10 @@ class NodeData(Data):
         '''
         self._test_msh()
 
-        msh = copy.deepcopy(self.mesh)
+        # shallow copy, the fields below are added to the copy only
+        msh = copy.copy(self.mesh)
+        msh.nodedata = []
+        msh.elmdata = []
 
         if len(msh.elm.tetrahedra) == 0:
             raise InvalidMeshError('Mesh has no volume elements')
@@ -4788,7 +5045,7 @@ class NodeData(Data):
             f = np.zeros((points.shape[0], ), self.value.dtype)
 
         th_with_points, bar = \
-            msh.find_tetrahedron_with_points(points, compute_baricentric=True)
+            self.mesh.find_tetrahedron_with_points(points, compute_baricentric=True)
 
         if th_indices is not None:
             th_with_points[~np.isin(th_with_points, th_indices)] = -1
@@ -5125,51 +5382,35 @@ class NodeData(Data):
                 mode in which to write
         """
         with open(fn, 'ab') as f:
-            f.write(b'$NodeData\n')
-            # string tags
-            f.write((str(1) + '\n').encode('ascii'))
-            f.write(('"' + self.field_name + '"\n').encode('ascii'))
-
-            f.write((str(1) + '\n').encode('ascii'))
+            self._write_to_msh(f, mode, mmg_fix)
+
+    def _write_to_msh(self, f, mode='binary', mmg_fix=False):
+        """Writes this NodeData field to an open ".msh" file"""
+        if mode not in ['ascii', 'binary']:
+            raise IOError("invalid mode:", mode)
+        f.write(b'$NodeData\n')
+        # string tags
+        f.write((str(1) + '\n').encode('ascii'))
+        f.write(('"' + self.field_name + '"\n').encode('ascii'))
+
+        f.write((str(1) + '\n').encode('ascii'))
+        f.write((str(0) + '\n').encode('ascii'))
+
+        if mmg_fix:
+            f.write((str(3) + '\n').encode('ascii'))
+            f.write((str(0) + '\n').encode('ascii'))
+            f.write((str(self.nr_comp) + '\n').encode('ascii'))
+            f.write((str(self.nr) + '\n').encode('ascii'))
+        else:
+            f.write((str(4) + '\n').encode('ascii'))
+            f.write((str(0) + '\n').encode('ascii'))
+            f.write((str(self.nr_comp) + '\n').encode('ascii'))
+            f.write((str(self.nr) + '\n').encode('ascii'))
             f.write((str(0) + '\n').encode('ascii'))
 
-            if mmg_fix:
-                f.write((str(3) + '\n').encode('ascii'))
-                f.write((str(0) + '\n').encode('ascii'))
-                f.write((str(self.nr_comp) + '\n').encode('ascii'))
-                f.write((str(self.nr) + '\n').encode('ascii'))
-            else:
-                f.write((str(4) + '\n').encode('ascii'))
-                f.write((str(0) + '\n').encode('ascii'))
-                f.write((str(self.nr_comp) + '\n').encode('ascii'))
-                f.write((str(self.nr) + '\n').encode('ascii'))
-                f.write((str(0) + '\n').encode('ascii'))
-
-            if mode == 'ascii':
-                for ii in range(self.nr):
-                    f.write((
-                        str(self.node_number[ii]) + ' ' +
-                        str(self.value[ii]).translate(None, '[](),') +
-                        '\n').encode('ascii'))
-
-            elif mode == 'binary':
-                value = self.value.astype('float64')
-                try:
-                    value.shape[1]
-                except IndexError:
-                    value = value[:, np.newaxis]
-
-                m = self.node_number[:, np.newaxis].astype('int32')
-                for i in range(self.nr_comp):
-                    m = np.concatenate((m,
-                                        value[:, i].astype('float64').view('int32').reshape(-1, 2)),
-                                       axis=1)
-
-                f.write(m.tobytes())
-            else:
-                raise IOError("invalid mode:", mode)
+        _write_msh_data_rows(f, self.node_number, self.value, mode)
 
-            f.write(b'$EndNodeData\n')
+        f.write(b'$EndNodeData\n')
 
 
     def write(self, fn):
@@ -5215,9 +5456,12 @@ class NodeData(Data):
             f.write(b'$EndNodeData\n')
 
 
-def read_msh(fn, m=None, skip_data=False):
+def read_msh(fn, m=None, skip_data=False, mmap=False):
     ''' Reads a gmsh '.msh' file
 
+    Meshes in HDF5 files written with Msh.write_hdf5 (for example with
+    Msh.write('mesh.hdf5')) are also accepted
+
     Parameters
     ------------
     fn: str
@@ -5226,6 +5470,11 @@ def read_msh(fn, m=None, skip_data=False):
         Mesh structure to be overwritten. If unset, will create a new structure
     skip_data: bool (optional)
         If True, reading of NodeData and ElementData will be skipped (Default: False)
+    mmap: bool (optional)
+        If True, the arrays of HDF5 meshes are memory-mapped (copy-on-write),
+        so that they are only read from disk when accessed. The file must
+        not be modified while the mesh is in use. Ignored for '.msh'
+        files (Default: False)
 
     Returns
     --------
@@ -5240,6 +5489,11 @@ def read_msh(fn, m=None, skip_data=False):
     if not os.path.isfile(fn):
         raise IOError(fn + ' not found')
 
+    if h5py.is_hdf5(fn):
+        m = _read_hdf5(m, fn, load_data=not skip_data, mmap=mmap)
+        m.fn = fn
+        return m
+
     version_number = _find_mesh_version(fn)
     if version_number == 2:
         m = _read_msh_2(fn, m, skip_data)
@@ -5253,6 +5507,52 @@ def read_msh(fn, m=None, skip_data=False):
     return m
 
 
+def _hdf5_to_array(dataset, fn, mmap=False):
+    ''' Reads a HDF5 dataset. Contiguous, uncompressed, datasets are
+    memory-mapped (copy-on-write) if mmap is set '''
+    if mmap and dataset.chunks is None and dataset.size > 0 and \
+            dataset.dtype.kind in 'biuf':
+        offset = dataset.id.get_offset()
+        if offset is not None:
+            return np.memmap(fn, dtype=dataset.dtype, mode='c',
+                             offset=offset, shape=dataset.shape)
+    return np.array(dataset)
+
+
+def _read_hdf5(m, fn, path='./', load_data=True, mmap=False):
+    ''' Fills the mesh m with the mesh stored in a HDF5 file '''
+    with h5py.File(fn, 'r') as f:
+        g = f[path]
+        if 'elm' not in g or 'nodes' not in g:
+            raise IOError(f'{fn} does not contain a mesh (no "elm" and "nodes" groups in {path})')
+        try:
+            m.fn = g.attrs['fn']
+        except KeyError:
+            pass
+        for key, value in m.elm.__dict__.items():
+            setattr(m.elm, key, np.squeeze(_hdf5_to_array(g['elm'][key], fn, mmap)))
+        for key, value in m.nodes.__dict__.items():
+            try:
+                setattr(m.nodes, key, np.squeeze(_hdf5_to_array(g['nodes'][key], fn, mmap)))
+            except KeyError:
+                pass
+        if load_data:
+            try:
+                for field_name, field in g['elmdata'].items():
+                    m.elmdata.append(ElementData(
+                        np.squeeze(_hdf5_to_array(field, fn, mmap)), field_name, mesh=m))
+            except KeyError:
+                pass
+
+            try:
+                for field_name, field in g['nodedata'].items():
+                    m.nodedata.append(NodeData(
+                        np.squeeze(_hdf5_to_array(field, fn, mmap)), field_name, mesh=m))
+            except KeyError:
+                pass
+    return m
+
+
 def _find_mesh_version(fn):
     if not os.path.isfile(fn):
         raise IOError(fn + ' not found')
@@ -5272,6 +5572,47 @@ def _find_mesh_version(fn):
     return version_number
 
 
+def _read_ascii_lines(f, nr):
+    ''' Reads nr lines of a file opened in binary mode as a single buffer '''
+    return b''.join(islice(f, nr))
+
+
+def _parse_ascii_table(data, nr, nr_columns, dtype=np.float64):
+    ''' Parses nr lines with nr_columns whitespace-separated numbers in a
+    single call, returning a (nr x nr_columns) array '''
+    values = np.fromstring(data, dtype=dtype, sep=' ')
+    if values.size != nr * nr_columns:
+        raise IOError('Expected {0} lines with {1} values each'.format(nr, nr_columns))
+    return values.reshape(nr, nr_columns)
+
+
+def _parse_ascii_rows(data, nr):
+    ''' Parses nr lines of whitespace-separated integers, which can have a
+    different number of values per line
+
+    Returns
+    --------
+    values: ndarray
+        All values, in order
+    first: ndarray
+        Index in values of the first value in each line
+    nr_values: ndarray
+        Number of values in each line
+    '''
+    values = np.fromstring(data, dtype=np.int64, sep=' ')
+    # find the line of each value from the position of the line breaks
+    b = np.frombuffer(data, dtype=np.uint8)
+    space = np.isin(b, np.frombuffer(b' \t\r\n', dtype=np.uint8))
+    value_start = ~space
+    value_start[1:] *= space[:-1]
+    line = np.cumsum(b == ord('\n'))[value_start]
+    if len(line) != len(values) or (len(line) > 0 and line[-1] >= nr):
+        raise IOError('Could not parse {0} lines of integers'.format(nr))
+    nr_values = np.bincount(line, minlength=nr)
+    first = np.cumsum(nr_values) - nr_values
+    return values, first, nr_values
+
+
 def _read_msh_2(fn, m, skip_data=False):
     m.fn = fn
 
@@ -5345,17 +5686,11 @@ def _read_msh_2(fn, m, skip_data=False):
 
         else:
             # nodes has 4 entries: [node_ID x y z]
-            node_number = np.empty(node_nr, dtype='int32')
+            table = _parse_ascii_table(_read_ascii_lines(f, node_nr), node_nr, 4)
+            node_number = table[:, 0].astype('int32')
             # array Nx3 for (x,y,z) coordinates of the nodes
-            node_coord = np.empty(3 * node_nr, dtype='float64')
-            for ii in range(node_nr):
-                line = f.readline().decode().strip().split()
-                node_number[ii] = line[0]
-                # it's faster to use a linear array and than reshape
-                node_coord[3 * ii] = line[1]
-                node_coord[3 * ii + 1] = line[2]
-                node_coord[3 * ii + 2] = line[3]
-            node_coord = node_coord.reshape((node_nr, 3))
+            node_coord = np.ascontiguousarray(table[:, 1:])
+            del table
 
         if not np.all(node_number == np.arange(1, node_nr + 1)):
             warnings.warn("Mesh file with discontinuos nodes, things can fail"
@@ -5456,36 +5791,28 @@ def _read_msh_2(fn, m, skip_data=False):
             m.elm.node_number_list = -np.ones((elm_nr, 4), dtype='int32')
             read = np.ones(elm_nr, dtype=bool)
 
-            for ii in range(elm_nr):
-                line = f.readline().decode().strip().split()
-                if line[1] == '1':
-                    elm_number[ii] = line[0]
-                    m.elm.elm_type[ii] = line[1]
-                    m.elm.tag1[ii] = line[3]
-                    m.elm.tag2[ii] = line[4]
-                    m.elm.node_number_list[ii, :2] = [int(i) for i in line[5:]]
-                elif line[1] == '2':
-                    elm_number[ii] = line[0]
-                    m.elm.elm_type[ii] = line[1]
-                    m.elm.tag1[ii] = line[3]
-                    m.elm.tag2[ii] = line[4]
-                    m.elm.node_number_list[ii, :3] = [int(i) for i in line[5:]]
-                elif line[1] == '4':
-                    elm_number[ii] = line[0]
-                    m.elm.elm_type[ii] = line[1]
-                    m.elm.tag1[ii] = line[3]
-                    m.elm.tag2[ii] = line[4]
-                    m.elm.node_number_list[ii] = [int(i) for i in line[5:]]
-                elif line[1] == '15':
-                    elm_number[ii] = line[0]
-                    m.elm.elm_type[ii] = line[1]
-                    m.elm.tag1[ii] = line[3]
-                    m.elm.tag2[ii] = line[4]
-                    m.elm.node_number_list[ii, :1] = [int(i) for i in line[5:]]
-                else:
-                    read[ii] = 0
+            # lines have [elm_ID elm_type nr_tags tag1 tag2 ... node_IDs]
+            values, first, nr_values = _parse_ascii_rows(
+                _read_ascii_lines(f, elm_nr), elm_nr)
+            elm_number[:] = values[first]
+            m.elm.elm_type[:] = values[first + 1]
+            m.elm.tag1[:] = values[first + 3]
+            m.elm.tag2[:] = values[first + 4]
+            nodes_start = first + 3 + values[first + 2]
+            for elm_type in np.unique(m.elm.elm_type):
+                in_type = np.where(m.elm.elm_type == elm_type)[0]
+                nr_nodes = {1: 2, 2: 3, 4: 4, 15: 1}.get(elm_type)
+                if nr_nodes is None:
+                    read[in_type] = 0
                     warnings.warn('element of type {0} '
-                                  'cannot be read, ignoring it'.format(line[1]))
+                                  'cannot be read, ignoring it'.format(elm_type))
+                    continue
+                if np.any(nr_values[in_type] != nodes_start[in_type] - first[in_type] + nr_nodes):
+                    raise IOError(fn + " invalid number of nodes in elements "
+                                  "of type " + str(elm_type))
+                m.elm.node_number_list[in_type, :nr_nodes] = values[
+                    nodes_start[in_type, None] + np.arange(nr_nodes)]
+            del values, first, nr_values, nodes_start
 
             elm_number = elm_number[read]
             m.elm.elm_type = m.elm.elm_type[read]
@@ -5539,12 +5866,9 @@ def _read_msh_2(fn, m, skip_data=False):
                 node_number = np.copy(temp['id'])
                 data.value = np.copy(temp['values'])
             else:
-                node_number = np.empty(nr, dtype='int32')
-                data.value = np.empty((nr, nr_comp), dtype='float64')
-                for ii in range(nr):
-                    line = f.readline().decode().strip().split()
-                    node_number[ii] = int(line[0])
-                    data.value[ii, :] = [float(v) for v in line[1:]]
+                table = _parse_ascii_table(_read_ascii_lines(f, nr), nr, 1 + nr_comp)
+                node_number = table[:, 0].astype('int32')
+                data.value = np.ascontiguousarray(table[:, 1:])
 
             if not f.readline().startswith(b'$EndNodeData'):
                 raise IOError(fn + " expected $EndNodeData after reading " +
@@ -5572,13 +5896,9 @@ def _read_msh_2(fn, m, skip_data=False):
                 data.value = np.copy(temp['values'])
 
             else:
-                elm_number = np.empty(nr, dtype='int32')
-                data.value = np.empty([nr, nr_comp], dtype='float64')
-
-                for ii in range(nr):
-                    line = f.readline().decode().strip().split()
-                    elm_number[ii] = int(line[0])
-                    data.value[ii, :] = [float(jj) for jj in line[1:]]
+                table = _parse_ascii_table(_read_ascii_lines(f, nr), nr, 1 + nr_comp)
+                elm_number = table[:, 0].astype('int32')
+                data.value = np.ascontiguousarray(table[:, 1:])
 
             if not f.readline().startswith(b'$EndElementData'):
                 raise IOError(fn + " expected $EndElementData after reading " +
@@ -5688,15 +6008,10 @@ def _read_msh_4(fn, m, skip_data=False):
                 node_nbr_block = temp['id']
                 node_coord_block = temp['coord']
             else:
-                node_nbr_block = np.zeros(n_in_block, dtype=int)
-                node_coord_block = np.zeros(3 * n_in_block, dtype=float)
-                for i in range(n_in_block):
-                    line = f.readline().decode().strip().split()
-                    node_nbr_block[i] = line[0]
-                    node_coord_block[3*i] = line[1]
-                    node_coord_block[3*i + 1] = line[2]
-                    node_coord_block[3*i + 2] = line[3]
-                node_coord_block = node_coord_block.reshape(-1, 3)
+                table = _parse_ascii_table(
+                    _read_ascii_lines(f, n_in_block), n_in_block, 4)
+                node_nbr_block = table[:, 0].astype(int)
+                node_coord_block = table[:, 1:]
 
             node_number[n_read:n_read+n_in_block] = node_nbr_block
             node_coord[n_read:n_read+n_in_block, :] = node_coord_block
@@ -5745,6 +6060,8 @@ def _read_msh_4(fn, m, skip_data=False):
             else:
                 warnings.warn(
                     "Can't read element type: {}. Ignoring it".format(elm_type))
+                if not binary:
+                    _read_ascii_lines(f, n_in_block)
                 continue
 
             if binary:
@@ -5756,13 +6073,11 @@ def _read_msh_4(fn, m, skip_data=False):
                 elm_node_block = temp['nodes']
 
             else:
-                elm_nbr_block = np.zeros(n_in_block, dtype=np.int32)
-                elm_node_block = -np.ones(nr_nodes_elm * n_in_block, dtype=np.int32)
-                for i in range(n_in_block):
-                    line = f.readline().decode().strip().split()
-                    elm_nbr_block[i] = int(line[0])
-                    elm_node_block[nr_nodes_elm*i:nr_nodes_elm*(i+1)] = [int(l) for l in line[1:]]
-                elm_node_block = elm_node_block.reshape(-1, nr_nodes_elm)
+                table = _parse_ascii_table(
+                    _read_ascii_lines(f, n_in_block), n_in_block,
+                    1 + nr_nodes_elm, dtype=np.int64)
+                elm_nbr_block = table[:, 0]
+                elm_node_block = table[:, 1:]
 
             elm_number[n_read:n_read+n_in_block] = elm_nbr_block
             m.elm.node_number_list[n_read:n_read+n_in_block, :nr_nodes_elm] = elm_node_block
@@ -5770,6 +6085,8 @@ def _read_msh_4(fn, m, skip_data=False):
             m.elm.elm_type[n_read:n_read+n_in_block] = elm_type
             read[n_read:n_read+n_in_block] = True
             n_read += n_in_block
+        # slots of the element types which could not be read
+        read[n_read:] = False
 
         elm_number = elm_number[read]
         m.elm.node_number_list = m.elm.node_number_list[read]
@@ -5822,12 +6139,9 @@ def _read_msh_4(fn, m, skip_data=False):
                 node_number = np.copy(temp['id'])
                 data.value = np.copy(temp['values'])
             else:
-                node_number = np.empty(nr, dtype='int32')
-                data.value = np.empty((nr, nr_comp), dtype='float64')
-                for ii in range(nr):
-                    line = f.readline().decode('ascii').split()
-                    node_number[ii] = int(line[0])
-                    data.value[ii, :] = [float(v) for v in line[1:]]
+                table = _parse_ascii_table(_read_ascii_lines(f, nr), nr, 1 + nr_comp)
+                node_number = table[:, 0].astype('int32')
+                data.value = np.ascontiguousarray(table[:, 1:])
 
             if not f.readline().startswith(b'$EndNodeData'):
                 raise IOError(fn + " expected $EndNodeData after reading " +
@@ -5854,13 +6168,9 @@ def _read_msh_4(fn, m, skip_data=False):
                 data.value = np.copy(temp['values'])
 
             else:
-                elm_number = np.empty(nr, dtype='int32')
-                data.value = np.empty([nr, nr_comp], dtype='float64')
-
-                for ii in range(nr):
-                    line = f.readline().decode('ascii').split()
-                    elm_number[ii] = int(line[0])
-                    data.value[ii, :] = [float(jj) for jj in line[1:]]
+                table = _parse_ascii_table(_read_ascii_lines(f, nr), nr, 1 + nr_comp)
+                elm_number = table[:, 0].astype('int32')
+                data.value = np.ascontiguousarray(table[:, 1:])
 
             if not f.readline().startswith(b'$EndElementData'):
                 raise IOError(fn + " expected $EndElementData after reading " +
@@ -5929,116 +6239,82 @@ def write_msh(msh, file_name=None, mode='binary', mmg_fix=False):
         # write nodes
         f.write(b'$Nodes\n')
         f.write('{0}\n'.format(msh.nodes.nr).encode('ascii'))
-
-        if mode == 'ascii':
-            for ii in range(msh.nodes.nr):
-                f.write((str(msh.nodes.node_number[ii]) + ' ' +
-                         str(msh.nodes.node_coord[ii][0]) + ' ' +
-                         str(msh.nodes.node_coord[ii][1]) + ' ' +
-                         str(msh.nodes.node_coord[ii][2]) + '\n').encode('ascii'))
-
-        elif mode == 'binary':
-            node_number = msh.nodes.node_number.astype('int32')
-            node_coord = msh.nodes.node_coord.astype('float64')
-            m = node_number[:, np.newaxis]
-            for i in range(3):
-                nc = node_coord[:, i].astype('float64')
-                m = np.concatenate((m,
-                                    nc.view('int32').reshape(-1, 2)), axis=1)
-            f.write(m.tobytes())
+        _write_msh_data_rows(f, msh.nodes.node_number, msh.nodes.node_coord, mode)
         f.write(b'$EndNodes\n')
-        # write elements
+
+        # write elements, grouped by type
         f.write(b'$Elements\n')
         f.write((str(msh.elm.nr) + '\n').encode('ascii'))
-
         if mode == 'ascii':
-            for ii in range(msh.elm.nr):
-                line = str(msh.elm.elm_number[ii]) + ' ' + \
-                    str(msh.elm.elm_type[ii]) + ' ' + str(2) + ' ' +\
-                    str(msh.elm.tag1[ii]) + ' ' + str(msh.elm.tag2[ii]) + ' '
-
-                if msh.elm.elm_type[ii] == 2:
-                    line += str(msh.elm.node_number_list[ii, :3]
-                                ).translate(None, '[](),') + '\n'
-                elif msh.elm.elm_type[ii] == 4:
-                    line += str(msh.elm.node_number_list[ii, :]
-                                ).translate(None, '[](),') + '\n'
-                elif msh.elm.elm_type[ii] == 15:
-                    line += str(msh.elm.node_number_list[ii, :1]
-                                ).translate(None, '[](),') + '\n'
-                elif msh.elm.elm_type[ii] == 1:
-                    line += str(msh.elm.node_number_list[ii, :2]
-                                ).translate(None, '[](),') + '\n'
-                else:
-                    raise IOError(
-                        "ERROR: cant write meshes with elements of type",
-                        msh.elm.elm_type[ii])
+            unsupported = ~np.isin(msh.elm.elm_type, list(_MSH_ELM_NODES))
+            if np.any(unsupported):
+                raise IOError(
+                    "ERROR: cant write meshes with elements of type",
+                    msh.elm.elm_type[unsupported][0])
+        for elm_type, nr_nodes in _MSH_ELM_NODES.items():
+            elm = np.where(msh.elm.elm_type == elm_type)[0]
+            if len(elm) == 0:
+                continue
+            if mode == 'ascii':
+                rows = np.empty((len(elm), 5 + nr_nodes), dtype=np.int64)
+                rows[:, 0] = msh.elm.elm_number[elm]
+                rows[:, 1] = elm_type
+                rows[:, 2] = 2
+                rows[:, 3] = msh.elm.tag1[elm]
+                rows[:, 4] = msh.elm.tag2[elm]
+                rows[:, 5:] = msh.elm.node_number_list[elm, :nr_nodes]
+                _write_ascii_rows(f, rows, ['%d'] * rows.shape[1])
+            else:
+                f.write(np.array((elm_type, len(elm), 2), 'int32').tobytes())
+                rows = np.empty((len(elm), 3 + nr_nodes), dtype='int32')
+                rows[:, 0] = msh.elm.elm_number[elm]
+                rows[:, 1] = msh.elm.tag1[elm]
+                rows[:, 2] = msh.elm.tag2[elm]
+                rows[:, 3:] = msh.elm.node_number_list[elm, :nr_nodes]
+                f.write(rows.data)
+            del rows
+        f.write(b'$EndElements\n')
 
-                f.write(line.encode('ascii'))
+        # write nodeData and elementData, if existent
+        for nd in msh.nodedata:
+            nd._write_to_msh(f, mode, mmg_fix)
 
-        elif mode == 'binary':
-            points = np.where(msh.elm.elm_type == 15)[0]
-            if len(points > 0):
-                points_header = np.array((15, len(points), 2), 'int32')
-                points_number = msh.elm.elm_number[points].astype('int32')
-                points_tag1 = msh.elm.tag1[points].astype('int32')
-                points_tag2 = msh.elm.tag2[points].astype('int32')
-                points_node_list = msh.elm.node_number_list[
-                    points, :1].astype('int32')
-                f.write(points_header.tobytes())
-                f.write(np.concatenate((points_number[:, np.newaxis],
-                                        points_tag1[:, np.newaxis],
-                                        points_tag2[:, np.newaxis],
-                                        points_node_list), axis=1).tobytes())
-            lines = np.where(msh.elm.elm_type == 1)[0]
-            if len(lines > 0):
-                lines_header = np.array((1, len(lines), 2), 'int32')
-                lines_number = msh.elm.elm_number[lines].astype('int32')
-                lines_tag1 = msh.elm.tag1[lines].astype('int32')
-                lines_tag2 = msh.elm.tag2[lines].astype('int32')
-                lines_node_list = msh.elm.node_number_list[
-                    lines, :2].astype('int32')
-                f.write(lines_header.tobytes())
-                f.write(np.concatenate((lines_number[:, np.newaxis],
-                                        lines_tag1[:, np.newaxis],
-                                        lines_tag2[:, np.newaxis],
-                                        lines_node_list), axis=1).tobytes())
-            triangles = np.where(msh.elm.elm_type == 2)[0]
-            if len(triangles > 0):
-                triangles_header = np.array((2, len(triangles), 2), 'int32')
-                triangles_number = msh.elm.elm_number[triangles].astype('int32')
-                triangles_tag1 = msh.elm.tag1[triangles].astype('int32')
-                triangles_tag2 = msh.elm.tag2[triangles].astype('int32')
-                triangles_node_list = msh.elm.node_number_list[
-                    triangles, :3].astype('int32')
-                f.write(triangles_header.tobytes())
-                f.write(np.concatenate((triangles_number[:, np.newaxis],
-                                        triangles_tag1[:, np.newaxis],
-                                        triangles_tag2[:, np.newaxis],
-                                        triangles_node_list), axis=1).tobytes())
-
-            tetra = np.where(msh.elm.elm_type == 4)[0]
-            if len(tetra > 0):
-                tetra_header = np.array((4, len(tetra), 2), 'int32')
-                tetra_number = msh.elm.elm_number[tetra].astype('int32')
-                tetra_tag1 = msh.elm.tag1[tetra].astype('int32')
-                tetra_tag2 = msh.elm.tag2[tetra].astype('int32')
-                tetra_node_list = msh.elm.node_number_list[tetra].astype('int32')
-
-                f.write(tetra_header.tobytes())
-                f.write(np.concatenate((tetra_number[:, np.newaxis],
-                                        tetra_tag1[:, np.newaxis],
-                                        tetra_tag2[:, np.newaxis],
-                                        tetra_node_list), axis=1).tobytes())
+        for eD in msh.elmdata:
+            eD._write_to_msh(f, mode)
 
-        f.write(b'$EndElements\n')
 
-    # write nodeData, if existent
-    for nd in msh.nodedata:
-        nd.append_to_mesh(fn, mode, mmg_fix)
+# Number of nodes of the element types written to ".msh" files, in the
+# order they are written
+_MSH_ELM_NODES = {15: 1, 1: 2, 2: 3, 4: 4}
+
 
-    for eD in msh.elmdata:
-        eD.append_to_mesh(fn, mode)
+def _write_ascii_rows(f, rows, fmt, chunk_size=100000):
+    ''' Writes the rows of a 2D array as lines of text, with one format per
+    column. Rows are formatted in chunks with a single string operation '''
+    line = ' '.join(fmt) + '\n'
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        f.write(((line * len(chunk)) % tuple(chunk.ravel().tolist())).encode('ascii'))
+
+
+def _write_msh_data_rows(f, number, value, mode):
+    ''' Writes the node or element numbers followed by the values, as in the
+    $Nodes, $NodeData and $ElementData sections '''
+    value = np.asarray(value)
+    if value.ndim == 1:
+        value = value[:, np.newaxis]
+    if mode == 'ascii':
+        rows = np.empty((len(number), 1 + value.shape[1]), dtype=float)
+        rows[:, 0] = number
+        rows[:, 1:] = value
+        _write_ascii_rows(f, rows, ['%d'] + ['%.17g'] * value.shape[1])
+    else:
+        rows = np.empty(
+            len(number),
+            dtype=[('number', 'int32'), ('value', 'float64', (value.shape[1],))])
+        rows['number'] = number
+        rows['value'] = value
+        f.write(rows.data)
 
 
 '''
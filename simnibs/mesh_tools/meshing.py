@@ -245,6 +245,7 @@ def image2mesh(image, affine, facet_angle=30,
     mesh.nodes.node_coord = rot.dot(mesh.nodes.node_coord.T).T
     # Translate nodes
     mesh.nodes.node_coord += affine[:3, 3]
+    mesh.clear_point_location_index()
     # Fix node orderings
     if np.linalg.det(rot) < 0:
         mesh.elm.node_number_list = mesh.elm.node_number_list[:, [1, 0, 2, 3]]
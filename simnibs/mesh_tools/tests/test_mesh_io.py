@@ -135,6 +135,27 @@ class TestGmshRead:
         np.testing.assert_array_equal(sphere3_msh.elm.node_number_list[-1, :],
                                       np.array([31, 4149, 4272, 1118]))
 
+    def test_read_msh_4_ascii(self, tmp_path):
+        fn = tmp_path / 'mesh.msh'
+        fn.write_text('\n'.join([
+            '$MeshFormat', '4 0 8', '$EndMeshFormat',
+            '$Nodes', '2 5',
+            '1 3 0 2', '1 0 0 0', '2 1 0 0',
+            '2 3 0 3', '3 0 1 0', '4 0 0 1', '5 1 1 1.5',
+            '$EndNodes',
+            '$Elements', '3 4',
+            '1 1 1 1', '1 1 2',
+            '1 2 2 1', '2 1 2 3',
+            '2 3 4 2', '3 1 2 3 4', '4 2 3 4 5',
+            '$EndElements', '']))
+        with pytest.warns(UserWarning):
+            m = mesh_io.read_msh(str(fn))
+        np.testing.assert_equal(m.nodes.node_coord[-1], [1, 1, 1.5])
+        np.testing.assert_equal(m.elm.elm_type, [2, 4, 4])
+        np.testing.assert_equal(m.elm.tag1, [1, 2, 2])
+        np.testing.assert_equal(
+            m.elm.node_number_list, [[1, 2, 3, -1], [1, 2, 3, 4], [2, 3, 4, 5]])
+
 
 class TestNodes:
 
@@ -587,6 +608,64 @@ class TestMsh:
         sphere3_msh.nodedata = []
         os.remove('tmp.hdf5')
 
+    def test_read_msh_hdf5_mmap(self, sphere3_msh, tmp_path):
+        m = copy.deepcopy(sphere3_msh)
+        m.elmdata.append(mesh_io.ElementData(m.elm.tag1.astype(float), 'elm'))
+        m.nodedata.append(mesh_io.NodeData(m.nodes.node_coord, 'nd'))
+        fn = str(tmp_path / 'mesh.hdf5')
+        with h5py.File(fn, 'w') as f:
+            f.create_dataset('other', data=np.arange(3))
+        m.write(fn)
+        # writing again replaces the mesh and keeps the other datasets
+        m.write(fn)
+        with h5py.File(fn, 'r') as f:
+            np.testing.assert_equal(f['other'][:], np.arange(3))
+        assert not isinstance(mesh_io.read_msh(fn).nodes.node_coord, np.memmap)
+        m2 = mesh_io.read_msh(fn, mmap=True)
+        assert m2.fn == fn
+        assert isinstance(m2.nodes.node_coord, np.memmap)
+        assert isinstance(m2.field['nd'].value, np.memmap)
+        np.testing.assert_equal(m.elm.tag1, m2.elm.tag1)
+        np.testing.assert_equal(m.elm.node_number_list, m2.elm.node_number_list)
+        np.testing.assert_equal(m.nodes.node_coord, m2.nodes.node_coord)
+        np.testing.assert_equal(m.field['elm'].value, m2.field['elm'].value)
+        np.testing.assert_equal(m.field['nd'].value, m2.field['nd'].value)
+        # changes are not written to the file
+        m2.nodes.node_coord[:] = 0
+        np.testing.assert_equal(m.nodes.node_coord, mesh_io.read_msh(fn).nodes.node_coord)
+        assert len(mesh_io.read_msh(fn, skip_data=True).elmdata) == 0
+        # a memory-mapped mesh can be written back to its own file
+        m3 = mesh_io.read_msh(fn, mmap=True)
+        m3.write(fn)
+        np.testing.assert_equal(m.nodes.node_coord, mesh_io.read_msh(fn).nodes.node_coord)
+        np.testing.assert_equal(m.field['nd'].value, mesh_io.read_msh(fn).field['nd'].value)
+
+    def test_read_msh_hdf5_not_mesh(self, tmp_path):
+        fn = str(tmp_path / 'leadfield.hdf5')
+        with h5py.File(fn, 'w') as f:
+            f.create_dataset('mesh_leadfield/leadfields/tdcs_leadfield', data=np.zeros((2, 3)))
+        with pytest.raises(IOError):
+            mesh_io.read_msh(fn)
+
+    @pytest.mark.parametrize('mode', ['binary', 'ascii'])
+    def test_write_read_msh(self, mode, sphere3_msh, tmp_path):
+        m = copy.deepcopy(sphere3_msh)
+        m.nodedata.append(mesh_io.NodeData(m.nodes.node_coord, 'nd'))
+        m.elmdata.append(mesh_io.ElementData(m.elm.tag1, 'tag'))
+        m.elmdata.append(mesh_io.ElementData(m.elements_volumes_and_areas().value, 'vol'))
+        fn = str(tmp_path / 'mesh.msh')
+        mesh_io.write_msh(m, fn, mode=mode)
+        m2 = mesh_io.read_msh(fn)
+        np.testing.assert_equal(m.nodes.node_coord, m2.nodes.node_coord)
+        np.testing.assert_equal(m.elm.elm_type, m2.elm.elm_type)
+        np.testing.assert_equal(m.elm.tag1, m2.elm.tag1)
+        np.testing.assert_equal(m.elm.node_number_list, m2.elm.node_number_list)
+        np.testing.assert_equal(m.field['nd'].value, m2.field['nd'].value)
+        np.testing.assert_equal(
+            m.field['tag'].value, np.squeeze(m2.field['tag'].value))
+        np.testing.assert_equal(
+            m.field['vol'].value, np.squeeze(m2.field['vol'].value))
+
     def test_quality_parameters(self):
         # define mesh with a single regular tetrahedron
         msh = mesh_io.Msh()
@@ -723,6 +802,45 @@ class TestMsh:
             msh.nodes[msh.elm[th_with_points]]
         assert np.allclose(np.einsum('ikj, ik -> ij', th_coords, bar), points_inside)
 
+    def test_point_location_index(self, sphere3_msh):
+        msh = copy.deepcopy(sphere3_msh)
+        index = msh.get_point_location_index()
+        assert msh.get_point_location_index() is index
+        th = msh.find_tetrahedron_with_points(np.array([[0., 0., 0.]]), compute_baricentric=False)
+        assert msh.get_point_location_index() is index
+        assert th[0] != -1
+        # the index is not copied and is rebuilt when the nodes or the
+        # elements are assigned to
+        assert not hasattr(copy.deepcopy(msh), '_point_location')
+        msh.elm.node_number_list = msh.elm.node_number_list.copy()
+        index = msh.get_point_location_index()
+        assert msh.get_point_location_index() is index
+        msh.nodes.node_coord = msh.nodes.node_coord + 200
+        assert msh.get_point_location_index() is not index
+        assert msh.find_tetrahedron_with_points(
+            np.array([[0., 0., 0.]]), compute_baricentric=False)[0] == -1
+        th_moved = msh.find_tetrahedron_with_points(
+            np.array([[200., 200., 200.]]), compute_baricentric=False)
+        assert th_moved[0] != -1
+        # methods changing the mesh in-place drop the index
+        msh.get_point_location_index()
+        msh.fix_th_node_ordering()
+        assert msh._point_location is None
+        msh.get_point_location_index()
+        msh.clear_point_location_index()
+        assert msh._point_location is None
+
+    def test_point_location_baricentric_current_nodes(self, sphere3_msh):
+        msh = copy.deepcopy(sphere3_msh)
+        points = np.array([[0., 0., 0.], [10., 20., -5.]])
+        msh.find_tetrahedron_with_points(points)
+        # swap the first two nodes of the tetrahedra in-place
+        th = msh.elm.elm_type == 4
+        msh.elm.node_number_list[th, :2] = msh.elm.node_number_list[th, 1::-1]
+        th_with_points, bar = msh.find_tetrahedron_with_points(points)
+        th_coords = msh.nodes[msh.elm[th_with_points]]
+        assert np.allclose(np.einsum('ikj, ik -> ij', th_coords, bar), points)
+
     def test_inside_volume(self, sphere3_msh):
         X, Y, Z = np.meshgrid(np.linspace(-100, 100, 100),
                               np.linspace(-40, 40, 10), [0])
@@ -1010,6 +1128,62 @@ class TestMsh:
             x = m.nodes.node_coord[:, 0]
         assert np.allclose(M.dot(x), interp_points[:, 0], atol=1, rtol=1e-1)
 
+    def test_interpolation_operator_points(self, sphere3_msh, tmp_path):
+        m = sphere3_msh.crop_mesh(elm_type=4)
+        m_out = sphere3_msh.crop_mesh(1005)
+        interp_points = np.vstack([
+            m_out.elements_baricenters().value / 95. * 51.2,
+            m_out.elements_baricenters().value * 1.01])
+        op = m.interpolation_operator(interp_points)
+        assert op.shape == (len(interp_points), m.nodes.nr)
+        x = m.nodes.node_coord
+        # Several fields in a single product
+        y = op.apply([x[:, 0], 2 * x[:, 0]])
+        assert y.shape == (len(interp_points), 2)
+        n_in = m_out.elm.nr
+        assert np.allclose(y[:n_in, 0], interp_points[:n_in, 0], rtol=1e-3)
+        assert np.allclose(y[:n_in, 1], 2 * interp_points[:n_in, 0], rtol=1e-3)
+        assert np.all(np.isnan(y[n_in:]))
+        assert np.allclose(
+            op.apply(mesh_io.NodeData(x, mesh=m))[:n_in], interp_points[:n_in], rtol=1e-3)
+        fn = str(tmp_path / 'op.npz')
+        op.save(fn)
+        op2 = mesh_io.InterpolationOperator.load(fn)
+        assert np.allclose(op2.apply(x[:, 0]), y[:, 0], equal_nan=True)
+
+    def test_interpolation_operator_grid(self, sphere3_msh):
+        data = sphere3_msh.elements_baricenters().value[:, 0]
+        n = (130, 130, 1)
+        affine = np.array([[1, 0, 0, -65],
+                           [0, 1, 0, -65],
+                           [0, 0, 1, 0],
+                           [0, 0, 0, 1]], dtype=float)
+        X, _ = np.meshgrid(np.arange(130), np.arange(130), indexing='ij')
+        op = sphere3_msh.interpolation_operator(
+            n_voxels=n, affine=affine, element_wise=True)
+        interp = op.apply(data)
+        assert interp.shape == n
+        assert np.allclose(interp[:, :, 0], X - 64.5, atol=1)
+        nd = mesh_io.NodeData(sphere3_msh.nodes.node_coord[:, 0], mesh=sphere3_msh)
+        op = sphere3_msh.interpolation_operator(n_voxels=n, affine=affine)
+        inside = ~op.outside.reshape(n)
+        assert np.allclose(
+            op.apply(nd)[inside], nd.interpolate_to_grid(n, affine)[inside])
+
+    def test_interpolation_operator_discontinuous(self, sphere3_msh):
+        data = sphere3_msh.elm.tag1
+        n = (200, 130, 1)
+        affine = np.array([[1, 0, 0, -100.1],
+                           [0,-1, 0, 65.1],
+                           [0, 0, 1, 0],
+                           [0, 0, 0, 1]], dtype=float)
+        op = sphere3_msh.interpolation_operator(
+            n_voxels=n, affine=affine, element_wise=True, continuous=False)
+        interp = op.apply(data)
+        assert np.allclose(interp[6:10, 65, 0], 5, atol=1e-1)
+        assert np.allclose(interp[11:15, 65, 0], 4, atol=1e-1)
+        assert np.allclose(interp[16:100, 65, 0], 3, atol=1e-1)
+
     def test_find_shared_nodes(self, sphere3_msh):
         shared_nodes = sphere3_msh.find_shared_nodes([3, 4])
         surf_nodes = np.unique(sphere3_msh.elm[sphere3_msh.elm.tag1==1003, :3])
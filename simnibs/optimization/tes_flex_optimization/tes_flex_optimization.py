@@ -1,5 +1,8 @@
+import collections
 import copy
 import csv
+import hashlib
+import multiprocessing
 import os
 import time
 import h5py
@@ -114,6 +117,15 @@ class TesFlexOptimization:
     polish : bool, optional, default: False
             If True, then scipy.optimize.minimize with the L-BFGS-B method is used to polish the best
             population member at the end, which can improve the minimization.
+    n_workers : int, optional, default: 1
+        Number of processes evaluating the population of the differential evolution in parallel.
+        Each process holds its own copy of the optimization and of the FEM system and
+        solves it with cpus // n_workers threads.
+        The direct optimizer always evaluates the goal function serially.
+    field_cache_size : int, optional, default: 8
+        Number of electric fields kept in memory, keyed by the skin nodes and the currents of the electrodes.
+        Electrode positions mapping to the same nodes as a cached one are not simulated again. Each entry holds
+        the fields of all stimulation channels in all ROIs, so large ROIs need a small cache. Use 0 to disable.
     run_final_electrode_simulation : bool, optional, default: True
            Runs final simulation with optimized parameters using real electrode model including remeshing.
            Note: This is required to get final e-fields for visualization
@@ -191,6 +203,8 @@ class TesFlexOptimization:
         self.constrain_electrode_locations = False
         self.overlap_factor = None
         self.polish = False
+        self.n_workers = 1
+        self.field_cache_size = 8
         self.n_test = 0  # number of tries to place the electrodes
         self.n_sim = 0  # number of final simulations carried out (only valid electrode positions)
         self.optimize_init_vals = True
@@ -226,6 +240,11 @@ class TesFlexOptimization:
         self.solver_options = "pardiso"
         self._ofem = None
 
+        # electric fields of previously simulated electrode node sets (see update_field)
+        self._field_cache = collections.OrderedDict()
+        self._field_cache_hits = 0
+        self._field_cache_misses = 0
+
         # number of CPU cores (set by run(cpus=NN) )
         self._n_cpu = None
         self._log_handlers = []
@@ -515,6 +534,13 @@ class TesFlexOptimization:
         self.dirichlet_node = get_dirichlet_node_index_cog(mesh=self._mesh, roi=self._roi)
 
         # prepare FEM
+        self._set_up_fem()
+        self._prepared = True
+
+    def _set_up_fem(self):
+        """
+        Sets up the OnlineFEM used to evaluate the goal function
+        """
         self._ofem = OnlineFEM(
             mesh=self._mesh,
             electrode=self.electrode,
@@ -528,7 +554,36 @@ class TesFlexOptimization:
             dirichlet_node=self.dirichlet_node,
             cpus=self._n_cpu
         )
-        self._prepared = True
+
+    def __getstate__(self):
+        # the FEM solver and the log handlers can not be pickled,
+        # worker processes set up their own FEM (see _set_up_global_optimization)
+        state = self.__dict__.copy()
+        state["_ofem"] = None
+        state["_log_handlers"] = []
+        state["_field_cache"] = collections.OrderedDict()
+        return state
+
+    def _worker_copy(self):
+        """
+        Shallow copy of the optimization sent to the worker processes. The ROI definitions
+        and the relabeled mesh are only needed to prepare the optimization, the workers get
+        the head mesh, the skin surface, the ROI point clouds and the electrodes to set up
+        their own FEM and evaluate the goal function.
+
+        The threads available to the optimization are split between the workers.
+
+        Returns
+        -------
+        optimization : TesFlexOptimization
+            Copy without the FEM, the ROI definitions and the relabeled mesh
+        """
+        worker = copy.copy(self)
+        worker.roi = None
+        worker._mesh_relabel = None
+        cpus = self._n_cpu if self._n_cpu is not None else multiprocessing.cpu_count()
+        worker._n_cpu = max(1, int(cpus) // self.n_workers)
+        return worker
         
     def _set_logger(self, fname_prefix='simnibs_optimization', summary=True):
         """
@@ -1183,6 +1238,8 @@ class TesFlexOptimization:
         # run global optimization
         ######################################################################################################
         if self.optimizer == "direct":
+            if self.n_workers > 1:
+                logger.warning("The direct optimizer evaluates the goal function serially, ignoring n_workers")
             result = direct(
                 self.goal_fun,
                 bounds=self._optimizer_options_std["bounds"],
@@ -1194,20 +1251,42 @@ class TesFlexOptimization:
             )
 
         elif self.optimizer == "differential_evolution":
-            result = differential_evolution(
-                self.goal_fun,
-                x0=self._optimizer_options_std["init_vals"],
-                strategy="best1bin",
-                recombination=self._optimizer_options_std["recombination"],
-                mutation=tuple(self._optimizer_options_std["mutation"]),
-                tol=self._optimizer_options_std["tol"],
-                maxiter=self._optimizer_options_std["maxiter"],
-                popsize=self._optimizer_options_std["popsize"],
-                bounds=self._optimizer_options_std["bounds"],
-                disp=self._optimizer_options_std["disp"],
-                polish=False,
-                seed=self.seed
-            )  # we will decide if to polish afterwards
+            pool = None
+            parallel_args = {}
+            if self.n_workers > 1:
+                logger.info(f"Evaluating the population in {self.n_workers} processes")
+                # the workers set up their own FEM, free the one of the main process meanwhile
+                self._ofem = None
+                pool = multiprocessing.Pool(
+                    processes=self.n_workers,
+                    initializer=_set_up_global_optimization,
+                    initargs=(self._worker_copy(),),
+                )
+                parallel_args = {
+                    "workers": _PopulationEvaluator(self, pool),
+                    "updating": "deferred",
+                }
+            try:
+                result = differential_evolution(
+                    self.goal_fun,
+                    x0=self._optimizer_options_std["init_vals"],
+                    strategy="best1bin",
+                    recombination=self._optimizer_options_std["recombination"],
+                    mutation=tuple(self._optimizer_options_std["mutation"]),
+                    tol=self._optimizer_options_std["tol"],
+                    maxiter=self._optimizer_options_std["maxiter"],
+                    popsize=self._optimizer_options_std["popsize"],
+                    bounds=self._optimizer_options_std["bounds"],
+                    disp=self._optimizer_options_std["disp"],
+                    polish=False,
+                    seed=self.seed,
+                    **parallel_args
+                )  # we will decide if to polish afterwards
+            finally:
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+                    self._set_up_fem()
 
         else:
             raise NotImplementedError(
@@ -1250,6 +1329,8 @@ class TesFlexOptimization:
         
         logger.log(26, f"Total number of function evaluations:                   {self.n_test}")
         logger.log(26, f"Total number of FEM evaluations:                        {self.n_sim}")
+        logger.log(26, f"Field cache hits / misses:                              "
+                       f"{self._field_cache_hits} / {self._field_cache_misses}")
         logger.log(26, f"Final goal function value:                              {self.optim_funvalue}")
         logger.log(26, f"Duration (setup and optimization):                      {time.time() - start}")
                     
@@ -1474,6 +1555,7 @@ class TesFlexOptimization:
         self.electrode_pos = self.get_electrode_pos_from_array(parameters)
 
         # update field, returns list of list e[n_channel_stim][n_roi] (None if position is not applicable)
+        field_cache_hits = self._field_cache_hits
         e = self.update_field(electrode_pos=self.electrode_pos, plot=False)
 
         if e is None:
@@ -1482,8 +1564,10 @@ class TesFlexOptimization:
             logger.info( "-" * len(parameters_str))
             return 2.0
         
-        self.n_sim += 1
-        
+        # only count actual FEM simulations
+        if self._field_cache_hits == field_cache_hits:
+            self.n_sim += 1
+
         # post-process raw electric field (components Ex, Ey, Ez)
         if np.array(["TI" in _t for _t in self.e_postproc]).any():
             e_pp = [[0 for _ in range(self._n_roi)]]
@@ -1512,7 +1596,8 @@ class TesFlexOptimization:
             goal_fun_value = self.compute_goal(e_pp)
 
         logger.info(
-            f"Goal ({self.goal}): {goal_fun_value:.3f} (n_sim: {self.n_sim}, n_test: {self.n_test})",
+            f"Goal ({self.goal}): {goal_fun_value:.3f} (n_sim: {self.n_sim}, n_test: {self.n_test}, "
+            f"cache hits: {self._field_cache_hits}, cache misses: {self._field_cache_misses})",
         )
         logger.info( "-" * len(parameters_str))
 
@@ -2297,8 +2382,30 @@ class TesFlexOptimization:
             logger.info( node_idx_dict[0] )
             return None
             
-        # perform one electric field calculation for every stimulation condition (one at a time is on)
         logger.info("Electrode positions valid")
+
+        # reuse the fields if the electrodes map to the same nodes as in a previous simulation
+        key = None
+        if not plot and self.field_cache_size > 0:
+            key = self._field_cache_key()
+            if key in self._field_cache:
+                self._field_cache.move_to_end(key)
+                self._field_cache_hits += 1
+                logger.info("Electrode nodes and currents already simulated, using cached fields")
+                cached = self._field_cache[key]
+                # restore the state left by the Dirichlet correction of the cached simulation
+                for i_channel_stim in range(self.n_channel_stim):
+                    if cached["node_current"][i_channel_stim] is not None:
+                        electrode = self.electrode[i_channel_stim]
+                        electrode._node_current[:] = cached["node_current"][i_channel_stim]
+                        electrode.update_electrode_from_node_arrays()
+                        self.n_iter_dirichlet_correction[i_channel_stim].append(
+                            cached["n_iter"][i_channel_stim]
+                        )
+                return cached["e"]
+            self._field_cache_misses += 1
+
+        # perform one electric field calculation for every stimulation condition (one at a time is on)
         e = [[] for _ in range(self.n_channel_stim)]
         for i_channel_stim in range(self.n_channel_stim):
             
@@ -2321,9 +2428,108 @@ class TesFlexOptimization:
                 self.n_iter_dirichlet_correction[i_channel_stim].append(
                     self._ofem.n_iter_dirichlet_correction
                 )
-                
+
+        if key is not None:
+            dirichlet = [electrode.dirichlet_correction for electrode in self.electrode]
+            self._field_cache[key] = {
+                "e": e,
+                "node_current": [
+                    self.electrode[i]._node_current.copy() if dirichlet[i] else None
+                    for i in range(self.n_channel_stim)
+                ],
+                "n_iter": [
+                    self.n_iter_dirichlet_correction[i][-1] if dirichlet[i] else None
+                    for i in range(self.n_channel_stim)
+                ],
+            }
+            while len(self._field_cache) > self.field_cache_size:
+                self._field_cache.popitem(last=False)
+
         return e
 
+    def _field_cache_key(self):
+        """
+        Hash of the skin nodes and currents of all electrodes, defining the electric fields.
+        With Dirichlet correction, the prescribed currents are used, as the estimated currents are
+        only the initial guess of the correction.
+
+        Returns
+        -------
+        key : str
+            Hexadecimal hash
+        """
+        h = hashlib.blake2b(digest_size=20)
+        for electrode in self.electrode:
+            h.update(str(electrode.dirichlet_correction).encode())
+            for _electrode_array in electrode._electrode_arrays:
+                for _ele in _electrode_array.electrodes:
+                    if electrode.dirichlet_correction:
+                        current = _ele.ele_current_init
+                    elif _ele.node_current is not None:
+                        current = _ele.node_current
+                    else:
+                        current = _ele.ele_current
+                    h.update(np.ascontiguousarray(_ele.channel_id, dtype=np.int64))
+                    h.update(np.ascontiguousarray(_ele.node_idx, dtype=np.int64))
+                    h.update(np.ascontiguousarray(current, dtype=float))
+                h.update(b"|")
+        return h.hexdigest()
+
+
+class _PopulationEvaluator:
+    """
+    Map-like callable passed as "workers" to scipy's differential_evolution. Evaluates the
+    goal function of all candidates in a process pool and adds the evaluation and field cache
+    counters and the number of Dirichlet correction iterations of the workers to the optimization.
+
+    Parameters
+    ----------
+    optimization : TesFlexOptimization
+        Optimization in the main process
+    pool : multiprocessing.Pool
+        Pool set up with _set_up_global_optimization
+    """
+    def __init__(self, optimization, pool):
+        self.optimization = optimization
+        self.pool = pool
+
+    def __call__(self, func, population):
+        results = self.pool.map(_run_goal_fun, population)
+        for _, n_sim, cache_hits, cache_misses, n_iter_dirichlet_correction in results:
+            self.optimization.n_test += 1
+            self.optimization.n_sim += n_sim
+            self.optimization._field_cache_hits += cache_hits
+            self.optimization._field_cache_misses += cache_misses
+            for n_iter, n_iter_worker in zip(self.optimization.n_iter_dirichlet_correction,
+                                             n_iter_dirichlet_correction):
+                n_iter.extend(n_iter_worker)
+        return [result[0] for result in results]
+
+
+def _set_up_global_optimization(optimization):
+    global tes_flex_global_optimization
+    optimization._set_up_fem()
+    tes_flex_global_optimization = optimization
+
+
+def _run_goal_fun(parameters):
+    global tes_flex_global_optimization
+    optimization = tes_flex_global_optimization
+    n_sim = optimization.n_sim
+    cache_hits = optimization._field_cache_hits
+    cache_misses = optimization._field_cache_misses
+    optimization.n_iter_dirichlet_correction = [
+        [] for _ in optimization.n_iter_dirichlet_correction
+    ]
+    y = optimization.goal_fun(parameters)
+    return (
+        y,
+        optimization.n_sim - n_sim,
+        optimization._field_cache_hits - cache_hits,
+        optimization._field_cache_misses - cache_misses,
+        optimization.n_iter_dirichlet_correction,
+    )
+
 
 def valid_skin_region(skin_surface, mesh, fn_electrode_mask, additional_distance=0.0):
     """
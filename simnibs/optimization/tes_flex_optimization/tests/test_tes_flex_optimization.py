@@ -1,12 +1,18 @@
+import logging
+import multiprocessing
 import os
+import pickle
+import types
 import numpy as np
 import pytest
 import scipy
 import random
+import sys
 
 from pathlib import Path
 from copy import deepcopy
 
+from simnibs.optimization.tes_flex_optimization import tes_flex_optimization
 from simnibs.optimization.tes_flex_optimization.tes_flex_optimization import TesFlexOptimization
 from simnibs.utils.matlab_read import dict_from_matlab
 from simnibs.mesh_tools.mesh_io import read_msh
@@ -339,6 +345,196 @@ class TestToFromDict:
                                                                [ 0.63254309, -0.77368676,  0.03602824]]), rtol=1e-6)
 
 
+class TestParallelEvaluation:
+    def test_pickle(self):
+        opt = TesFlexOptimization()
+        opt.n_workers = 2
+        opt._ofem = object()
+        opt._log_handlers = [logging.StreamHandler()]
+        opt_loaded = pickle.loads(pickle.dumps(opt))
+        assert opt_loaded._ofem is None
+        assert opt_loaded._log_handlers == []
+        assert opt_loaded.n_workers == 2
+
+    def test_population_evaluator(self, monkeypatch):
+        class Optimization:
+            n_sim = 0
+            n_test = 0
+            _field_cache_hits = 0
+            _field_cache_misses = 0
+
+            def __init__(self):
+                self.n_iter_dirichlet_correction = [[], []]
+
+            def goal_fun(self, parameters):
+                if parameters[0] > 0:
+                    self.n_sim += 1
+                    self._field_cache_misses += 1
+                    self.n_iter_dirichlet_correction[1].append(int(10 * parameters[0]))
+                    return parameters[0]
+                return 2.0
+
+        monkeypatch.setattr(
+            tes_flex_optimization, "tes_flex_global_optimization", Optimization(), raising=False
+        )
+
+        class Pool:
+            map = staticmethod(lambda func, iterable: list(map(func, iterable)))
+
+        opt = Optimization()
+        evaluator = tes_flex_optimization._PopulationEvaluator(opt, Pool())
+        y = evaluator(None, np.array([[1.0], [-1.0], [0.5]]))
+        assert y == [1.0, 2.0, 0.5]
+        assert opt.n_test == 3
+        assert opt.n_sim == 2
+        assert opt._field_cache_misses == 2
+        assert opt.n_iter_dirichlet_correction == [[], [10, 5]]
+
+    def test_worker_copy(self):
+        opt = TesFlexOptimization()
+        opt.roi = [RegionOfInterest()]
+        opt._mesh_relabel = object()
+        opt._ofem = object()
+        opt.n_workers = 2
+        opt._n_cpu = 5
+        worker = opt._worker_copy()
+        assert worker.roi is None
+        assert worker._mesh_relabel is None
+        assert worker._ofem is None
+        assert worker._n_cpu == 2
+        assert len(opt.roi) == 1
+        assert opt._ofem is not None
+        assert opt._n_cpu == 5
+        opt.n_workers = 8
+        assert opt._worker_copy()._n_cpu == 1
+
+    @pytest.mark.skipif(sys.platform in ['win32', 'darwin'],
+                        reason='The test classes are not importable by spawned processes')
+    def test_population_evaluator_pool(self):
+        opt = _PoolOptimization()
+        ele = types.SimpleNamespace(
+            channel_id=1, node_idx=np.arange(1), node_current=None, ele_current=1.0
+        )
+        opt.electrode = [types.SimpleNamespace(
+            dirichlet_correction=False,
+            _electrode_arrays=[types.SimpleNamespace(electrodes=[ele])],
+        )]
+        opt.n_channel_stim = 1
+        opt._n_roi = 1
+        opt._goal_dir = [None]
+        opt.e_postproc = ["magn"]
+        opt.goal = [_goal_mean]
+        opt.n_iter_dirichlet_correction = [[]]
+        population = np.array([[1.0], [1.0], [2.0], [-1.0], [1.0], [2.0]])
+        with multiprocessing.Pool(
+                processes=2,
+                initializer=tes_flex_optimization._set_up_global_optimization,
+                initargs=(opt._worker_copy(),)) as pool:
+            evaluator = tes_flex_optimization._PopulationEvaluator(opt, pool)
+            y = evaluator(None, population)
+        np.testing.assert_allclose(y, [np.sqrt(3), np.sqrt(3), 2 * np.sqrt(3), 2.0, np.sqrt(3), 2 * np.sqrt(3)])
+        assert opt.n_test == 6
+        # each worker simulates each position at most once
+        assert opt._field_cache_hits + opt._field_cache_misses == 5
+        assert 2 <= opt._field_cache_misses <= 4
+        assert opt.n_sim == opt._field_cache_misses
+        assert opt.n_iter_dirichlet_correction == [[]]
+
+
+def _goal_mean(e):
+    return float(np.mean(e[0][0]))
+
+
+class _PoolOptimization(TesFlexOptimization):
+    """Optimization with a stand-in FEM, the field is the node index of the electrode"""
+    def _set_up_fem(self):
+        self._ofem = types.SimpleNamespace(
+            update_field=lambda electrode, dirichlet_correction, fn_electrode_txt: [[np.full(
+                (3, 3), float(electrode._electrode_arrays[0].electrodes[0].node_idx[0])
+            )]]
+        )
+
+    def get_electrode_pos_from_array(self, parameters):
+        return parameters
+
+    def get_nodes_electrode(self, electrode_pos, plot=False):
+        if electrode_pos[0] < 0:
+            return ["Electrodes overlap"]
+        self.electrode[0]._electrode_arrays[0].electrodes[0].node_idx = np.array(
+            [int(electrode_pos[0])]
+        )
+        return [{}]
+
+
+class TestFieldCache:
+    def test_update_field_cached(self, monkeypatch):
+        opt = TesFlexOptimization()
+        opt.field_cache_size = 2
+        opt.n_channel_stim = 1
+        ele = types.SimpleNamespace(
+            channel_id=1, node_idx=np.arange(3), node_current=None, ele_current=1.0
+        )
+        opt.electrode = [types.SimpleNamespace(
+            dirichlet_correction=False,
+            _electrode_arrays=[types.SimpleNamespace(electrodes=[ele])],
+        )]
+        monkeypatch.setattr(opt, "get_nodes_electrode", lambda electrode_pos, plot: [{}])
+        n_solves = []
+
+        def update_field(electrode, dirichlet_correction, fn_electrode_txt):
+            n_solves.append(1)
+            return [[np.full((3, 3), len(n_solves))]]
+
+        opt._ofem = types.SimpleNamespace(update_field=update_field)
+
+        e1 = opt.update_field(electrode_pos=None)
+        e2 = opt.update_field(electrode_pos=None)
+        assert len(n_solves) == 1
+        assert e1 is e2
+        assert opt._field_cache_hits == 1
+        assert opt._field_cache_misses == 1
+
+        for node_idx in [np.arange(1, 4), np.arange(2, 5)]:
+            ele.node_idx = node_idx
+            opt.update_field(electrode_pos=None)
+        assert len(n_solves) == 3
+        assert len(opt._field_cache) == 2
+
+        ele.node_idx = np.arange(3)
+        opt.update_field(electrode_pos=None)
+        assert len(n_solves) == 4
+
+    def test_update_field_cached_dirichlet(self, monkeypatch):
+        opt = TesFlexOptimization()
+        opt.n_channel_stim = 1
+        opt.n_iter_dirichlet_correction = [[]]
+        ele = types.SimpleNamespace(channel_id=1, node_idx=np.arange(3), ele_current_init=1.0)
+        n_updates = []
+        electrode = types.SimpleNamespace(
+            dirichlet_correction=True,
+            _electrode_arrays=[types.SimpleNamespace(electrodes=[ele])],
+            _node_current=np.ones(3),
+            update_electrode_from_node_arrays=lambda: n_updates.append(1),
+        )
+        opt.electrode = [electrode]
+        monkeypatch.setattr(opt, "get_nodes_electrode", lambda electrode_pos, plot: [{}])
+
+        def update_field(electrode, dirichlet_correction, fn_electrode_txt):
+            electrode._node_current[:] = [0.5, 0.3, 0.2]
+            opt._ofem.n_iter_dirichlet_correction = 4
+            return [[np.zeros((3, 3))]]
+
+        opt._ofem = types.SimpleNamespace(update_field=update_field)
+
+        opt.update_field(electrode_pos=None)
+        electrode._node_current[:] = 1.0
+        opt.update_field(electrode_pos=None)
+        assert opt._field_cache_hits == 1
+        assert np.allclose(electrode._node_current, [0.5, 0.3, 0.2])
+        assert len(n_updates) == 1
+        assert opt.n_iter_dirichlet_correction == [[4, 4]]
+
+
 class Test_Write_Visualization:
     def test_volume_rois(self, sphere3_msh: mesh_io.Msh, tmp_path):
         input_mesh = deepcopy(sphere3_msh)
@@ -7,11 +7,14 @@ import pytest
 import scipy
 
 from simnibs.mesh_tools.mesh_io import Msh
+from simnibs.simulation.fem_cache import FEMCache
 from simnibs.simulation.onlinefem import FemTargetPointCloud
 from simnibs.simulation.tms_coil.tms_coil import TmsCoil
 
 from simnibs.optimization.tms_flex_optimization import (
     auto_init_position_from_roi,
+    get_skin_distance_on_grid,
+    get_voxel_volume,
     optimize_distance,
     optimize_e_mag,
     TmsFlexOptimization,
@@ -336,6 +339,98 @@ class TestEMagOptimization:
         assert before > after
         np.testing.assert_allclose(coil_affine, affine_after)
 
+    @pytest.mark.slow
+    def test_batched_gradient(
+        self,
+        small_functional_3_element_coil: TmsCoil,
+        sphere3_msh: Msh,
+        tmp_path: Path,
+        monkeypatch,
+    ):
+        mesh = deepcopy(sphere3_msh)
+        sphere_path = tmp_path.joinpath("sphere.msh")
+        mesh.write(str(sphere_path.absolute()))
+        mesh.fn = str(sphere_path.absolute())
+        coil_affine = np.array(
+            [[1, 0, 0, 0], [0, 1, 0, 0], [0, 0, 1, 100], [0, 0, 0, 1]]
+        )
+        roi = FemTargetPointCloud(
+            mesh,
+            center=mesh.elements_baricenters()[mesh.elm.tag1 == 4],
+        )
+        gradients = {}
+
+        def minimize(fun, x0, bounds, jac=None, options=None, **kwargs):
+            if jac is True:
+                f, gradients["batched"] = fun(x0)
+            else:
+                # forward differences with one FEM solve per position
+                f = fun(x0)
+                gradient = np.empty(len(x0))
+                for i, (_, upper) in enumerate(bounds):
+                    x = np.array(x0, dtype=float)
+                    step = options["eps"] if x[i] + options["eps"] <= upper else -options["eps"]
+                    x[i] += step
+                    gradient[i] = (fun(x) - f) / step
+                gradients["per_position"] = gradient
+            return scipy.optimize.OptimizeResult(x=x0, fun=f, message="")
+
+        monkeypatch.setattr(scipy.optimize, "minimize", minimize)
+        for jac in [None, "2-point"]:
+            optimize_e_mag(
+                small_functional_3_element_coil,
+                mesh,
+                roi,
+                coil_affine,
+                global_optimization=False,
+                l_bfgs_b_args={"jac": jac, "options": {"eps": 1e-3}},
+            )
+
+        assert np.any(gradients["per_position"] != 0)
+        np.testing.assert_allclose(
+            gradients["batched"], gradients["per_position"], rtol=1e-5, atol=1e-8
+        )
+
+
+
+class TestGeometryCache:
+    def test_voxel_volume_cached(
+        self, small_functional_3_element_coil: TmsCoil, tmp_path: Path
+    ):
+        cache = FEMCache(str(tmp_path))
+        reference = get_voxel_volume(small_functional_3_element_coil, [], dither_skip=2)
+        get_voxel_volume(small_functional_3_element_coil, [], dither_skip=2, cache=cache)
+        assert cache.hits == 0
+        cached = get_voxel_volume(
+            small_functional_3_element_coil, [], dither_skip=2, cache=cache
+        )
+        assert cache.hits == cache.misses
+        for ref, res in zip(reference[:4], cached[:4]):
+            for ref_element, res_element in zip(ref.values(), res.values()):
+                np.testing.assert_array_equal(ref_element, res_element)
+
+    def test_skin_distance_cached(self, sphere3_msh: Msh, tmp_path: Path):
+        cache = FEMCache(str(tmp_path))
+        func, grid, affine = get_skin_distance_on_grid(sphere3_msh, 1.5)
+        get_skin_distance_on_grid(sphere3_msh, 3.5, cache=cache)
+        func_c, grid_c, affine_c = get_skin_distance_on_grid(
+            sphere3_msh, 1.5, cache=cache
+        )
+        assert cache.hits == 1
+        np.testing.assert_allclose(grid, grid_c)
+        np.testing.assert_allclose(affine, affine_c)
+        points = np.array([[0, 0, 0], [0, 0, 100], [200, 0, 0]])
+        np.testing.assert_allclose(func(points), func_c(points))
+
+    def test_skin_distance_cache_resolution(self, sphere3_msh: Msh, tmp_path: Path):
+        cache = FEMCache(str(tmp_path))
+        _, grid, _ = get_skin_distance_on_grid(sphere3_msh, cache=cache)
+        _, grid_coarse, _ = get_skin_distance_on_grid(
+            sphere3_msh, cache=cache, resolution=2.0
+        )
+        assert cache.hits == 0
+        assert cache.misses == 2
+        assert grid_coarse.shape != grid.shape
 
 
 class TestAutoInit:
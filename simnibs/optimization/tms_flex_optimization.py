@@ -26,6 +26,7 @@ from simnibs.simulation.tms_coil.tms_coil_deformation import (
 )
 
 from simnibs.simulation import sim_struct
+from simnibs.simulation.fem_cache import FEM_CACHE_DIRNAME, FEMCache
 from simnibs.simulation.tms_coil.tms_coil_element import DipoleElements, TmsCoilElements
 from simnibs.mesh_tools.mesh_io import Msh
 from simnibs.utils import file_finder
@@ -91,6 +92,9 @@ class TmsFlexOptimization:
     fem_evaluation_cutoff: float
         If the penalty from the intersection and self intersection is greater than this cutoff value, the fem will not be evaluated to save time.
         Set to np.inf to always evaluate the fem (example: 500 | np.inf), default 1000
+    cache_geometry: bool
+        Weather to store the coil casing voxel volumes and the head distance field in the "fem_cache" subfolder
+        of the m2m folder and reuse them in later optimizations, default False
 
     run_global_optimization: bool
         Weather to run the global optimization, the global optimization will always run first
@@ -148,6 +152,9 @@ class TmsFlexOptimization:
     fem_evaluation_cutoff: float
     """If the penalty from the intersection and self intersection is greater than this cutoff value, the fem will not be evaluated to save time.
         Set to np.inf to always evaluate the fem (example: 500 | np.inf), default 1000"""
+    cache_geometry: bool
+    """Weather to store the coil casing voxel volumes and the head distance field in the "fem_cache" subfolder
+        of the m2m folder and reuse them in later optimizations, default False"""
 
     run_global_optimization: bool
     """Weather to run the global optimization, the global optimization will always run first"""
@@ -183,6 +190,7 @@ class TmsFlexOptimization:
 
         self.dither_skip = 6
         self.fem_evaluation_cutoff = 1000
+        self.cache_geometry = False
 
         self.run_global_optimization = True
         self.run_local_optimization = True
@@ -439,6 +447,15 @@ class TmsFlexOptimization:
 
         logger.log(26, f"Optimization options:{os.linesep}{self.to_str_formatted()}")
 
+        cache_dir = None
+        if self.cache_geometry:
+            if self.subpath is not None:
+                cache_dir = os.path.join(self.subpath, FEM_CACHE_DIRNAME)
+            else:
+                cache_dir = os.path.join(
+                    os.path.dirname(self.fnamehead), FEM_CACHE_DIRNAME
+                )
+
         logger.info(f"Running optimization ({self.method})")
         # Run simulations
         if self.method == "distance":
@@ -454,6 +471,7 @@ class TmsFlexOptimization:
                 self.run_local_optimization,
                 self.direct_args,
                 self.l_bfgs_b_args,
+                cache_dir=cache_dir,
             )
         elif self.method == "emag":
             initial_cost, optimized_cost, opt_matsimnibs, optimized_e_mag, direct, penalties = (
@@ -472,7 +490,8 @@ class TmsFlexOptimization:
                     self.direct_args,
                     self.l_bfgs_b_args,
                     self.solver_options,
-                    cpus=cpus
+                    cpus=cpus,
+                    cache_dir=cache_dir,
                 )
             )
         else:
@@ -906,6 +925,7 @@ def optimize_distance(
     local_optimization: bool = True,
     direct_args: dict | None = None,
     l_bfgs_b_args: dict | None = None,
+    cache_dir: str | None = None,
 ) -> tuple[float, float, npt.NDArray[np.float_], list, dict]:
     """Optimizes the deformations of the coil elements as well as the global transformation to minimize the distance between the optimization_surface
     and the min distance points (if not present, the coil casing points) while preventing intersections of the
@@ -932,6 +952,9 @@ def optimize_distance(
     dither_skip : int, optional
         How many voxel positions should be skipped when creating the coil volume representation.
         Used to speed up the optimization. When set to 0, no dithering will be applied, by default 0
+    cache_dir : str | None, optional
+        Directory where the coil casing voxel volumes and the head distance field are cached on disk.
+        If None, they are always recalculated, by default None
 
     Returns
     -------
@@ -1000,7 +1023,7 @@ def optimize_distance(
         coil, coil_rotation_ranges, coil_translation_ranges
     )
 
-    optimization_surface = _prepare_skin_surface(head_mesh)
+    cache = None if cache_dir is None else FEMCache(cache_dir)
 
     (
         element_voxel_volume,
@@ -1008,13 +1031,12 @@ def optimize_distance(
         element_voxel_dither_factors,
         element_voxel_affine,
         self_intersection_elements,
-    ) = get_voxel_volume(coil, global_deformations, dither_skip=dither_skip)
+    ) = get_voxel_volume(coil, global_deformations, dither_skip=dither_skip, cache=cache)
     (
         target_distance_function,
         target_voxel_distance,
         target_voxel_affine,
-        cost_surface_tree,
-    ) = optimization_surface.get_min_distance_on_grid(distance_offset=distance - 0.5)
+    ) = get_skin_distance_on_grid(head_mesh, distance_offset=distance - 0.5, cache=cache)
     target_voxel_distance_inside = np.minimum(target_voxel_distance, 0) * -1
 
     coil_deformation_ranges = coil.get_deformation_ranges()
@@ -1124,7 +1146,11 @@ def optimize_distance(
 
 
 def get_voxel_volume(
-    coil: TmsCoil, global_deformations: list[TmsCoilDeformation], dither_skip: int = 0
+    coil: TmsCoil,
+    global_deformations: list[TmsCoilDeformation],
+    dither_skip: int = 0,
+    cache: FEMCache | None = None,
+    resolution: float = 1.0,
 ) -> tuple[
     dict[TmsCoilElements, npt.NDArray[np.bool_]],
     dict[TmsCoilElements, npt.NDArray[np.int_]],
@@ -1141,6 +1167,10 @@ def get_voxel_volume(
     dither_skip : int, optional
         How many voxel positions should be skipped when creating the coil volume representation.
         Used to speed up the optimization. When set to 0, no dithering will be applied, by default 0
+    cache : FEMCache | None, optional
+        On-disk cache used to store and load the voxel volume of each casing, by default None
+    resolution : float, optional
+        The resolution of the voxel grid, by default 1.0
 
     Returns
     -------
@@ -1172,8 +1202,7 @@ def get_voxel_volume(
             element_voxel_affine[base_element],
             element_voxel_indexes[base_element],
             element_voxel_dither_factors[base_element],
-            _,
-        ) = coil.casing.mesh.get_voxel_volume(dither_skip=dither_skip)
+        ) = _get_casing_voxel_volume(coil.casing.mesh, dither_skip, cache, resolution)
     self_intersection_elements = []
     for self_intersection_group in coil.self_intersection_test:
         self_intersection_elements.append([])
@@ -1191,8 +1220,7 @@ def get_voxel_volume(
                 element_voxel_affine[element],
                 element_voxel_indexes[element],
                 element_voxel_dither_factors[element],
-                _,
-            ) = element.casing.mesh.get_voxel_volume(dither_skip=dither_skip)
+            ) = _get_casing_voxel_volume(element.casing.mesh, dither_skip, cache, resolution)
 
     return (
         element_voxel_volume,
@@ -1203,6 +1231,107 @@ def get_voxel_volume(
     )
 
 
+def _get_casing_voxel_volume(
+    casing_mesh: Msh,
+    dither_skip: int = 0,
+    cache: FEMCache | None = None,
+    resolution: float = 1.0,
+) -> tuple[
+    npt.NDArray[np.bool_], npt.NDArray[np.float_], npt.NDArray[np.int_], npt.NDArray[np.float_]
+]:
+    """Voxel volume of a casing mesh, loaded from the cache if available
+
+    Returns
+    -------
+    volume, affine, indexes, dither_factors
+        See Msh.get_voxel_volume
+    """
+    if cache is not None:
+        key = FEMCache.array_key(
+            "casing_voxel_volume",
+            casing_mesh.nodes.node_coord,
+            casing_mesh.elm.node_number_list,
+            float(resolution),
+            dither_skip,
+        )
+        arrays = cache.load_arrays(None, key)
+        if arrays is not None:
+            return (
+                arrays["volume"],
+                arrays["affine"],
+                arrays["indexes"],
+                arrays["dither_factors"],
+            )
+
+    volume, affine, indexes, dither_factors, _ = casing_mesh.get_voxel_volume(
+        resolution=resolution, dither_skip=dither_skip
+    )
+    if cache is not None:
+        cache.save_arrays(
+            None,
+            key,
+            volume=volume,
+            affine=affine,
+            indexes=indexes,
+            dither_factors=dither_factors,
+        )
+    return volume, affine, indexes, dither_factors
+
+
+def get_skin_distance_on_grid(
+    head_mesh: Msh,
+    distance_offset: float = 0.0,
+    cache: FEMCache | None = None,
+    resolution: float = 1.0,
+) -> tuple[Callable, npt.NDArray[np.float_], npt.NDArray[np.float_]]:
+    """Generates the signed distance field to the closed skin surface of the head mesh on a grid
+
+    Parameters
+    ----------
+    head_mesh : Msh
+        The head mesh
+    distance_offset : float, optional
+        A distance offset that is subtracted from the actual distance, by default 0.0
+    cache : FEMCache | None, optional
+        On-disk cache used to store and load the distance field. The distance field is cached without
+        the offset, so that it can be reused for all distances, by default None
+    resolution : float, optional
+        The resolution of the grid, by default 1.0
+
+    Returns
+    -------
+    min_distance_on_grid : Callable
+        The signed gridded distance field function (inside is negative)
+    grid : npt.NDArray[np.float_]
+        The voxelized surface distance
+    affine : npt.NDArray[np.float_]
+        The affine transformation from voxel to world coordinates
+    """
+    arrays = None
+    if cache is not None:
+        key = FEMCache.array_key(
+            "skin_distance",
+            head_mesh.nodes.node_coord,
+            head_mesh.elm.node_number_list,
+            head_mesh.elm.tag1,
+            float(resolution),
+        )
+        arrays = cache.load_arrays(None, key)
+
+    if arrays is None:
+        optimization_surface = _prepare_skin_surface(head_mesh)
+        _, grid, affine, _ = optimization_surface.get_min_distance_on_grid(
+            resolution=resolution
+        )
+        if cache is not None:
+            cache.save_arrays(None, key, grid=grid, affine=affine)
+    else:
+        grid, affine = arrays["grid"], arrays["affine"]
+
+    grid = grid - distance_offset
+    return mesh_io.grid_distance_function(grid, affine), grid, affine
+
+
 def add_global_deformations(
     coil,
     coil_rotation_ranges: npt.NDArray[np.float_] | None = None,
@@ -1320,6 +1449,7 @@ def optimize_e_mag(
     solver_options = "pardiso",
     cpus = 1,
     debug: bool = False,
+    cache_dir: str | None = None,
 ) -> tuple[float, float, npt.NDArray[np.float_], npt.NDArray[np.float_], list, dict]:
     """Optimizes the deformations of the coil elements as well as the global transformation to maximize the mean e-field magnitude in the ROI while preventing intersections of the
     scalp surface and the coil casing
@@ -1350,6 +1480,9 @@ def optimize_e_mag(
     fem_evaluation_cutoff : float, optional
         If the penalty from the intersection and self intersection is greater than this cutoff value, the fem will not be evaluated to save time.
         Set to np.inf to always evaluate the fem, by default 1000
+    cache_dir : str | None, optional
+        Directory where the coil casing voxel volumes and the head distance field are cached on disk.
+        If None, they are always recalculated, by default None
 
     Returns
     -------
@@ -1419,7 +1552,7 @@ def optimize_e_mag(
     global_deformations = add_global_deformations(
         coil_sampled, coil_rotation_ranges, coil_translation_ranges
     )
-    optimization_surface = _prepare_skin_surface(head_mesh)
+    cache = None if cache_dir is None else FEMCache(cache_dir)
 
     (
         element_voxel_volume,
@@ -1427,13 +1560,12 @@ def optimize_e_mag(
         element_voxel_dither_factors,
         element_voxel_affine,
         self_intersection_elements,
-    ) = get_voxel_volume(coil_sampled, global_deformations, dither_skip=dither_skip)
+    ) = get_voxel_volume(coil_sampled, global_deformations, dither_skip=dither_skip, cache=cache)
     (
         target_distance_function,
         target_voxel_distance,
         target_voxel_affine,
-        cost_surface_tree,
-    ) = optimization_surface.get_min_distance_on_grid(distance_offset=distance - 0.5)
+    ) = get_skin_distance_on_grid(head_mesh, distance_offset=distance - 0.5, cache=cache)
     target_voxel_distance_inside = np.minimum(target_voxel_distance, 0) * -1
 
     coil_deformation_ranges = coil_sampled.get_deformation_ranges()
@@ -1457,14 +1589,12 @@ def optimize_e_mag(
     best_f = np.inf
     best_x = None
 
-    def cost_f_x0_w(x):
-        if debug:
-            deformations = []
-
+    def set_deformations(x):
         for coil_deformation, deformation_setting in zip(coil_deformation_ranges, x):
-            if debug:
-                deformations.append(deformation_setting)
             coil_deformation.current = deformation_setting
+
+    def penalty_f(x):
+        set_deformations(x)
         (
             intersection_penalty,
             self_intersection_penalty,
@@ -1480,15 +1610,9 @@ def optimize_e_mag(
         )
         penalties["intersection_penalty"] = intersection_penalty
         penalties["self_intersection_penalty"] = self_intersection_penalty
+        return intersection_penalty + self_intersection_penalty
 
-        penalty = intersection_penalty + self_intersection_penalty
-        if penalty > fem_evaluation_cutoff:
-            return penalty
-
-        roi_e_field = fem.update_field(matsimnibs=affine)
-
-        f = penalty - 100 * np.mean(roi_e_field)
-
+    def track(x, f):
         nonlocal best_f
         if f < best_f:
             nonlocal best_x
@@ -1496,10 +1620,49 @@ def optimize_e_mag(
             best_f = f
 
         if debug:
-            tracking_deformations.append(deformations)
+            tracking_deformations.append(list(x))
             fs.append(f)
+
+    def cost_f_x0_w(x):
+        penalty = penalty_f(x)
+        if penalty > fem_evaluation_cutoff:
+            return penalty
+
+        roi_e_field = fem.update_field(matsimnibs=affine)
+
+        f = penalty - 100 * np.mean(roi_e_field)
+        track(x, f)
         return f
 
+    def cost_and_gradient_f_x0_w(x):
+        """Cost and forward difference gradient. The E-fields at x and at all
+        stencil points are solved together as one block of right-hand sides"""
+        step = l_bfgs_b_args["options"].get("eps", 1e-8)
+        stencil = np.tile(np.asarray(x, dtype=float), (len(x) + 1, 1))
+        for i, coil_deformation in enumerate(coil_deformation_ranges):
+            if x[i] + step <= coil_deformation.range[1]:
+                stencil[i + 1, i] += step
+            else:
+                stencil[i + 1, i] -= step
+
+        # evaluate x last, so that penalties holds its values
+        f = np.array([penalty_f(x_s) for x_s in stencil[::-1]])[::-1]
+
+        evaluate = np.where(f <= fem_evaluation_cutoff)[0]
+        if len(evaluate) > 0:
+            e_fields = fem.update_field(
+                matsimnibs=np.repeat(affine[:, :, None], len(evaluate), axis=2),
+                block_size=len(evaluate),
+                set_coil_state=lambda i: set_deformations(stencil[evaluate[i]]),
+            )
+            for j, e_field in zip(evaluate, e_fields):
+                f[j] -= 100 * np.mean(e_field)
+                track(stencil[j], f[j])
+
+        set_deformations(x)
+        gradient = (f[1:] - f[0]) / np.diag(stencil[1:] - stencil[0])
+        return f[0], gradient
+
     initial_cost = cost_f_x0_w(initial_deformation_settings)
 
     opt_results = []
@@ -1527,8 +1690,13 @@ def optimize_e_mag(
         initial_deformation_settings = np.array(
             [coil_deformation.current for coil_deformation in coil_deformation_ranges]
         )
+        if "jac" in l_bfgs_b_args:
+            local_cost_f = cost_f_x0_w
+        else:
+            local_cost_f = cost_and_gradient_f_x0_w
+            l_bfgs_b_args = dict(l_bfgs_b_args, jac=True)
         local_opt = opt.minimize(
-            cost_f_x0_w,
+            local_cost_f,
             x0=initial_deformation_settings,
             bounds=[deform.range for deform in coil_deformation_ranges],
             method="L-BFGS-B",
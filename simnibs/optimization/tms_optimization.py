@@ -521,6 +521,7 @@ class TMSoptimize:
             post_pro=postpro,
             solver_options=self.solver_options,
             n_workers=cpus,
+            warm_start=True,
         )
         # Read the fields
         with h5py.File(fn_hdf5, "a") as f:
@@ -4,7 +4,11 @@
 '''
 
 import gc
+import os
+import concurrent.futures
 import multiprocessing
+import queue
+import threading
 import time
 import copy
 import warnings
@@ -13,6 +17,7 @@ import h5py
 import logging
 import numpy as np
 import scipy.sparse as sparse
+import scipy.spatial
 from simnibs.mesh_tools import gmsh_view
 from simnibs.simulation.tms_coil.tms_coil import TmsCoil
 
@@ -25,6 +30,7 @@ from ..utils.simnibs_logger import logger
 
 from petsc4py import PETSc
 from simnibs.simulation import pardiso
+from simnibs.simulation.fem_cache import FEMCache
 
 
 '''
@@ -49,22 +55,72 @@ from simnibs.simulation import pardiso
 '''
 
 VALID_SOLVER_OPTIONS = {"hypre", "pardiso", "mumps", "petsc_pardiso"}
+# Upper limit (in bytes) for the dense right-hand side blocks used when solving
+# many simulations at once
+MAX_RHS_BLOCK_MEMORY = 2 * 1024**3
+
+# On-disk cache of FEM matrices, disabled by default. See set_fem_cache
+_fem_cache = None
+# Parsed coil files, keyed by (path, mtime, size). See _read_coil
+_coil_cache = {}
+_coil_cache_lock = threading.Lock()
+# Maximum number of coils kept in the cache of each process
+COIL_CACHE_SIZE = 4
+
+
+def set_fem_cache(directory=None, max_size=10 * 1024**3):
+    ''' Enables the on-disk cache of assembled FEM matrices and of solver
+    reorderings (PARDISO only) for all FEM systems created afterwards.
+
+    Parameters
+    ----------
+    directory: str or None (optional)
+        Directory where the cache is stored. If None, the cache is stored in the
+        "fem_cache" subfolder of the m2m folder of each head mesh. Default: None
+    max_size: int (optional)
+        Maximum size of the cache in bytes. The least recently used entries
+        are removed when exceeded. Default: 10 GB
+
+    Returns
+    -------
+    cache: FEMCache
+        The cache object
+    '''
+    global _fem_cache
+    _fem_cache = FEMCache(directory, max_size)
+    return _fem_cache
+
+
+def disable_fem_cache():
+    ''' Disables the on-disk cache of FEM matrices '''
+    global _fem_cache
+    _fem_cache = None
+
 
 class KSPSolver:
-    def __init__(self, A, ksp_type, pc_type, factor_solver_type=None, rtol=1e-10, log_level=20) -> None:
+    def __init__(self, A, ksp_type, pc_type, factor_solver_type=None, rtol=1e-10, log_level=20,
+                 warm_start=False) -> None:
         """Simple interface to setup PETSc KSP object with very limited flexibility.
 
         when pc_type = hypre the, the following options are hardcoded:
             - HYPRE type = boomeramg
             - BoomerAMG coarsen type = HMIS
 
-
+        With warm_start = True, iterative solvers start from the solution of
+        the previous call to solve instead of from zero.
         """
 
         self.log_level = log_level
         self.set_system_matrix(A)
         self.setup_ksp(ksp_type, pc_type, factor_solver_type, rtol)
         self.initialize_system_vectors()
+        self.set_warm_start(warm_start)
+
+    def set_warm_start(self, warm_start=True):
+        """Use the previous solution as the initial guess of the next solve.
+        Has no effect on direct solvers."""
+        self.warm_start = bool(warm_start) and self.ksp.getType() != "preonly"
+        self.ksp.setInitialGuessNonzero(self.warm_start)
 
     def set_system_matrix(self, S):
         S = S.tocsr()
@@ -78,6 +134,26 @@ class KSPSolver:
 
         A.assemble()
         self.A = A
+        self._pattern = (S.indptr.copy(), S.indices.copy())
+
+    def refactorize(self, S):
+        """Updates the values of the system matrix and sets up the
+        preconditioner again. When the sparsity pattern is unchanged, the
+        matrix is updated in-place, so that PETSc re-uses the symbolic
+        factorization of direct solvers."""
+        start = time.perf_counter()
+        S = S.tocsr()
+        S.sort_indices()
+        if _same_pattern(self._pattern, (S.indptr, S.indices)):
+            self.A.setValuesCSR(S.indptr, S.indices, S.data)
+            self.A.assemble()
+        else:
+            logger.debug("Sparsity pattern changed, setting up the matrix again")
+            self.set_system_matrix(S)
+            self.initialize_system_vectors()
+        self.ksp.setOperators(self.A)
+        self.ksp.setUp()
+        logger.log(self.log_level, f"Time to refactorize: {time.perf_counter()-start:8.4f} s")
 
     def initialize_system_vectors(self):
         """Create vectors to hold RHS and solution."""
@@ -120,15 +196,39 @@ class KSPSolver:
     def _solve_single(self, b):
         start = time.perf_counter()
         self._b[:] = b
+        # With warm start, self._x still holds the previous solution
         self.ksp.solve(self._b, self._x)
-        logger.log(self.log_level,f"Time to solve: {time.perf_counter()-start:8.4f} s")
+        logger.log(
+            self.log_level,
+            f"Time to solve: {time.perf_counter()-start:8.4f} s "
+            f"({self.ksp.getIterationNumber()} iterations)"
+        )
         return self._x[:]
 
+    def _solve_block(self, b):
+        """Solve all columns of b in a single call. Only used with direct
+        solvers, where the factors are then traversed once for the whole block.
+        """
+        start = time.perf_counter()
+        B = PETSc.Mat().createDense(
+            size=b.shape, array=np.asfortranarray(b, dtype=float), comm=self.A.getComm()
+        )
+        B.assemble()
+        X = B.duplicate()
+        self.ksp.matSolve(B, X)
+        x = np.array(X.getDenseArray(), copy=True)
+        B.destroy()
+        X.destroy()
+        logger.log(self.log_level, f"Time to solve {b.shape[1]} systems: {time.perf_counter()-start:8.4f} s")
+        return x
+
     def solve(self, b: np.ndarray):
         if b.ndim == 1:
             x = self._solve_single(b)
         else:
             assert b.ndim == 2
+            if self.ksp.getType() == "preonly" and b.shape[1] > 1:
+                return self._solve_block(b)
             x = np.zeros_like(b)
             for i in range(b.shape[1]):
                 x[:, i] = self._solve_single(b[:, i])
@@ -137,17 +237,34 @@ class KSPSolver:
 class MUMPS_Solver:
     def __init__(self, A=None, isSymmetric=True, log_level=20):
         self.log_level = log_level
+        self._isSymmetric = isSymmetric
         start = time.time()
         self.ctx = mumps.Context()
         self.ctx.set_matrix(A, symmetric=isSymmetric)
         logger.log(self.log_level, f'{time.time()-start:.2f} seconds to init solver')
         start = time.time()
         self.ctx.analyze()
+        self._pattern = _sparsity_pattern(A)
         logger.log(self.log_level, f'{time.time()-start:.2f} seconds to analyze matrix')
         start = time.time()
         self.ctx.factor()
         logger.log(self.log_level, f'{time.time()-start:.2f} seconds to factorize matrix')
 
+    def refactorize(self, A):
+        ''' Numeric factorization of a new matrix. The analysis (ordering and
+        symbolic factorization) is re-used if the sparsity pattern did not change '''
+        start = time.time()
+        self.ctx.set_matrix(A, symmetric=self._isSymmetric)
+        pattern = _sparsity_pattern(A)
+        if _same_pattern(self._pattern, pattern):
+            self.ctx.factor(reuse_analysis=True)
+        else:
+            logger.debug('Sparsity pattern changed, analyzing matrix again')
+            self.ctx.analyze()
+            self._pattern = pattern
+            self.ctx.factor()
+        logger.log(self.log_level, f'{time.time()-start:.2f} seconds to refactorize matrix')
+
     def solve(self, b):
         start = time.time()
         x = self.ctx._solve_dense(b)
@@ -155,6 +272,96 @@ class MUMPS_Solver:
         return x
 
 
+class _LockedSolver:
+    ''' Serializes the calls to a solver shared by several threads. The
+    solvers are multithreaded themselves, but their internal buffers can not be
+    used by concurrent calls '''
+    def __init__(self, solver):
+        self._solver = solver
+        self._lock = threading.Lock()
+
+    def solve(self, b):
+        with self._lock:
+            return self._solver.solve(b)
+
+    def refactorize(self, A):
+        with self._lock:
+            self._solver.refactorize(A)
+
+    def set_warm_start(self, warm_start=True):
+        if hasattr(self._solver, 'set_warm_start'):
+            with self._lock:
+                self._solver.set_warm_start(warm_start)
+
+
+def _sparsity_pattern(A):
+    ''' Column pointers and sorted row indices of a sparse matrix in CSC format '''
+    A = sparse.csc_matrix(A)
+    if not A.has_sorted_indices:
+        A = A.sorted_indices()
+    return A.indptr.copy(), A.indices.copy()
+
+
+def _same_pattern(pattern1, pattern2):
+    ''' Whether two (indptr, indices) sparsity patterns are the same '''
+    return all(
+        len(p1) == len(p2) and np.array_equal(p1, p2)
+        for p1, p2 in zip(pattern1, pattern2)
+    )
+
+
+def _share_solver_between_threads(S):
+    ''' Prepares the solver of the FEMSystem S once, so that it can be used by
+    all threads of a _run_in_threads call '''
+    if S._solver is None:
+        S.prepare_solver()
+    if not isinstance(S._solver, _LockedSolver):
+        S._solver = _LockedSolver(S._solver)
+
+
+def _apply_args(func_args):
+    ''' Calls func(*args) for a (func, args) tuple. Used with Pool.imap_unordered '''
+    func, args = func_args
+    return func(*args)
+
+
+def _run_in_threads(n_workers, func, args_list, callback=None):
+    ''' Runs func(*args) for all args in args_list using a pool of threads.
+
+    All threads share the memory of this process, so large objects such as
+    the mesh, the gradient matrices and the factorized system are held only
+    once. At most 2*n_workers calls are in flight at any time, so that
+    results do not accumulate in memory.
+
+    Parameters
+    ----------
+    n_workers: int
+        Number of threads
+    func: callable
+        Function to be called
+    args_list: iterable of tuples
+        Arguments of each call
+    callback: callable (optional)
+        Called in this thread with the return value of each call, in order of
+        completion
+    '''
+    def _collect(done):
+        for future in done:
+            result = future.result()
+            if callback is not None:
+                callback(result)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=n_workers) as executor:
+        pending = set()
+        for args in args_list:
+            pending.add(executor.submit(func, *args))
+            if len(pending) >= 2 * n_workers:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                _collect(done)
+        _collect(concurrent.futures.as_completed(pending))
+
+
 def calc_fields(potentials, fields, cond=None, dadt=None, units='mm', E=None):
     ''' Given a mesh and the electric potentials at the nodes,
     calculates the fields
@@ -187,7 +394,8 @@ def calc_fields(potentials, fields, cond=None, dadt=None, units='mm', E=None):
     Returns
     -------
     mesh: simnibs.msh.mesh_io.Msh
-        Mesh object with the calculated fields
+        Mesh object with the calculated fields. The nodes and elements are
+        shared with the mesh of the potentials, only the fields are new
     '''
     if units == 'mm':
         scaling_factor = 1e3
@@ -209,7 +417,8 @@ def calc_fields(potentials, fields, cond=None, dadt=None, units='mm', E=None):
             ('The number of elements in the mesh and of data points in the'
              ' conductivity field does not match')
 
-    out_mesh = copy.deepcopy(mesh)
+    # The geometry is not modified, so there is no need to copy it
+    out_mesh = copy.copy(mesh)
     out_mesh.elmdata = []
     out_mesh.nodedata = []
     if 'v' in fields:
@@ -300,7 +509,7 @@ def calc_fields(potentials, fields, cond=None, dadt=None, units='mm', E=None):
                 j = np.linalg.norm(J.value, axis=1)
                 out_mesh.elmdata.append(
                     mesh_io.ElementData(
-                        j, name='magnJ', mesh=mesh))
+                        j, name='magnJ', mesh=out_mesh))
 
     return out_mesh
 
@@ -606,7 +815,8 @@ class FEMSystem(object):
 
     Notes
     -----
-    Once created, do NOT change the attributes of this class.
+    Once created, do NOT change the attributes of this class. To solve the
+    same system with different conductivities, use update_conductivity
 
     '''
     def __init__(
@@ -625,24 +835,31 @@ class FEMSystem(object):
             raise ValueError('Invalid unit: {0}'.format(units))
         self.solver_loglevel = solver_loglevel
         self._mesh = mesh
-        if isinstance(cond, mesh_io.ElementData):
-            cond = cond.value.squeeze()
-            if cond.ndim == 2:
-                cond = cond.reshape(-1, 3, 3)
-        if self.mesh.elm.nr != len(cond):
-            raise ValueError('Please define one conductivity for each element')
-        self._cond = cond
+        self._cond = self._check_cond(cond)
         self._dirichlet = dirichlet
         self._dof_map = dofMap(mesh.nodes.node_number)
         self._A = None
         self._solver = None
         self._G = None # Gradient operator
         self._D = None # Gradient matrix
+        self._cache_key = None # Key in the FEM cache
+        self._stiffness = None # Re-assembly of A for new conductivities
+        self._free_dofs = None # DOFs in the reduced system, see _set_dirichlet_maps
+        self._warm_start = False # Initial guess of iterative solvers, see set_warm_start
         solver_options = "hypre" if solver_options is None else solver_options
         assert solver_options in VALID_SOLVER_OPTIONS # or isinstance(solver_options, PETSc.KSP)
         self._solver_options = solver_options
         self.assemble_fem_matrix(store_G=store_G)
 
+    def _check_cond(self, cond):
+        if isinstance(cond, mesh_io.ElementData):
+            cond = cond.value.squeeze()
+            if cond.ndim == 2:
+                cond = cond.reshape(-1, 3, 3)
+        if self.mesh.elm.nr != len(cond):
+            raise ValueError('Please define one conductivity for each element')
+        return cond
+
     @property
     def mesh(self):
         return self._mesh
@@ -671,13 +888,22 @@ class FEMSystem(object):
         msh = self.mesh
         cond = self.cond[msh.elm.elm_type == 4]
         th_nodes = msh.elm.node_number_list[msh.elm.elm_type == 4]
-        G = _gradient_operator(msh)
-        if store_G:
-            self._G = G  # stores the operator in case we need it later (TMS)
-        vols = _vol(msh)
-        dof_map = self.dof_map
-        self._A = _assemble_matrix(vols, G, th_nodes, cond, dof_map,
-                                   units=self.units)
+        A = None
+        if _fem_cache is not None:
+            self._cache_key = _fem_cache.matrix_key(msh, self.cond, self.units)
+            A = _fem_cache.load_matrix(msh, self._cache_key)
+        if A is None or store_G:
+            G = _gradient_operator(msh)
+            if store_G:
+                self._G = G  # stores the operator in case we need it later (TMS)
+        if A is None:
+            vols = _vol(msh)
+            dof_map = self.dof_map
+            A = _assemble_matrix(vols, G, th_nodes, cond, dof_map,
+                                 units=self.units)
+            if _fem_cache is not None:
+                _fem_cache.save_matrix(msh, self._cache_key, A)
+        self._A = A
         if np.any(np.diff(self.A.indptr) == 0):
             raise ValueError('Found a column of zeros in the stiffness matrix'
                              ' disconected nodes?')
@@ -700,7 +926,19 @@ class FEMSystem(object):
             A, dof_map = self.dirichlet.apply_to_matrix(A, dof_map)
             
         if self._solver_options == 'pardiso':
-            self._solver = pardiso.Solver(A, log_level=self.solver_loglevel)
+            # Reuse the fill-reducing permutation if it is in the cache
+            perm = None
+            solver_key = None
+            if _fem_cache is not None and self._cache_key is not None:
+                solver_key = _fem_cache.solver_key(
+                    self._cache_key, self.dirichlet, self._solver_options)
+                perm = _fem_cache.load_perm(self.mesh, solver_key)
+            self._solver = pardiso.Solver(
+                A, log_level=self.solver_loglevel,
+                perm=perm, compute_perm=solver_key is not None
+            )
+            if solver_key is not None and perm is None:
+                _fem_cache.save_perm(self.mesh, solver_key, self._solver.perm)
         elif self._solver_options == 'petsc_pardiso':
             self._solver = KSPSolver(A, "preonly", "cholesky", "mkl_pardiso", 
                                      log_level=self.solver_loglevel)
@@ -709,15 +947,98 @@ class FEMSystem(object):
             # or with PETSc (only on MacOS)
             # self._solver = KSPSolverSimple(A, "preonly", "cholesky", "mumps")
         elif self._solver_options == "hypre":
-            self._solver = KSPSolver(A, "cg", "hypre", log_level=self.solver_loglevel)
+            self._solver = KSPSolver(A, "cg", "hypre", log_level=self.solver_loglevel,
+                                     warm_start=self._warm_start)
         else:
             raise ValueError(f"Invalid solver (got {self._solver_options})")
+        self._set_dirichlet_maps()
 
             # assume KSP object
             # self._solver = self._solver_options
             # self._solver.setUp
             # self._initialize_system_vectors()
 
+    def set_warm_start(self, warm_start=True):
+        '''Starts the iterative solvers from the previous solution
+
+        When many similar systems are solved in sequence, e.g. for nearby coil
+        positions, the previous potential is a good initial guess and reduces
+        the number of CG iterations. The preconditioner is not set up again.
+        Direct solvers are not affected.
+
+        Parameters
+        ----------
+        warm_start: bool (optional)
+            Whether to use the previous solution as the initial guess.
+            Default: True
+        '''
+        self._warm_start = bool(warm_start)
+        if hasattr(self._solver, 'set_warm_start'):
+            self._solver.set_warm_start(self._warm_start)
+
+    def update_conductivity(self, cond):
+        '''Changes the conductivities of the system
+
+        The sparsity pattern of A does not depend on the conductivities. The
+        first call stores the element gradients and volumes and the position of
+        the element matrix entries in A, so that A is re-assembled with a single
+        scatter of the element matrices. Entries which happen to be zero are
+        kept, so that all updated matrices have the same pattern. If the solver
+        is already prepared, only the numeric factorization is repeated (PARDISO
+        phase 22, MUMPS factorization with the previous analysis, PETSc direct
+        solvers with the same nonzero pattern), except in the first call if the
+        initial matrix had entries which were zero. With hypre, the
+        preconditioner is set up again.
+
+        Parameters
+        ----------
+        cond: ndarray or mesh_io.ElementData
+            New conductivity of each element
+        '''
+        self._cond = self._check_cond(cond)
+        msh = self.mesh
+        tetra = msh.elm.elm_type == 4
+        start = time.time()
+        if self._stiffness is None:
+            G = _gradient_operator(msh) if self._G is None else self._G
+            self._stiffness = _ParametricStiffness(
+                G, _vol(msh), msh.elm.node_number_list[tetra], self.dof_map)
+        self._A = self._stiffness.assemble(self.cond[tetra], units=self.units)
+        # The cached reordering depends only on the sparsity pattern, which
+        # the solver already has
+        self._cache_key = None
+        logger.info(f'{time.time() - start:.2f} s to re-assemble FEM matrix')
+        if self._solver is not None:
+            self._set_dirichlet_maps()
+            A = self._A
+            if self._free_dofs is not None:
+                # unlike DirichletBC.apply_to_matrix, keeps the zero entries
+                A = A.tocsr()[self._free_dofs].tocsc()[:, self._free_dofs]
+            A = sparse.csc_matrix(A, copy=True)
+            A.sort_indices()
+            self._solver.refactorize(A)
+
+    def _set_dirichlet_maps(self):
+        ''' Computes once the positions of the free and the Dirichlet DOFs and
+        the contribution of the Dirichlet values to the right-hand side, so that
+        the solves do not need to re-map the DOFs '''
+        self._free_dofs = None
+        self._bc_dofs = None
+        self._bc_values = None
+        self._bc_rhs = None
+        if self.dirichlet is None:
+            return
+        if np.any(~np.isin(self.dirichlet.nodes, self.dof_map.inverse)):
+            raise ValueError('BC node indices not found in dof_map')
+        self._bc_dofs = self.dof_map[self.dirichlet.nodes]
+        stay = np.ones(self.dof_map.nr, dtype=bool)
+        stay[self._bc_dofs] = False
+        self._free_dofs = np.flatnonzero(stay)
+        self._bc_values = np.asarray(self.dirichlet.values, dtype=float)
+        if np.any(self._bc_values != 0):
+            A = sparse.csc_matrix(self.A)
+            self._bc_rhs = A[:, self._bc_dofs].dot(self._bc_values)[self._free_dofs]
+
 
     def solve(self, b=None):
         ''' Solves the FEM system
@@ -740,23 +1061,50 @@ class FEMSystem(object):
         if b is None:
             b = np.zeros(self.dof_map.nr, dtype=float)
         else:
-            b = np.copy(b)
+            b = np.asarray(b)
+        x = np.empty(b.shape, dtype=float)
+        self.solve_into(b, x)
+        return np.squeeze(x)
 
-        if self._solver is None:
-            self.prepare_solver()
+    def solve_into(self, b, out):
+        ''' Solves the FEM system, writing the solution into a given array
 
-        # We also need the A matrix here because the DOFs change
-        dof_map = copy.deepcopy(self.dof_map)
-        if self.dirichlet is not None:
-            b, dof_map = self.dirichlet.apply_to_rhs(self.A, b, dof_map)
+        The Dirichlet DOFs are removed from b and inserted in the solution using
+        index maps computed once in prepare_solver.
 
-        x = self._solver.solve(b)
+        Parameters
+        ----------
+        b: np.ndarray
+            Right-hand side, (n_dofs) or (n_dofs x n_rhs), in the order of dof_map
+        out: np.ndarray
+            Array with the same shape as b, where the solution is written
 
-        if self.dirichlet is not None:
-            x, dof_map = self.dirichlet.apply_to_solution(x, dof_map)
-        dof_map, x = dof_map.order_like(self.dof_map, array=x)
+        Returns
+        -------
+        out: np.ndarray
+            The array with the solution
 
-        return np.squeeze(x)
+        Notes
+        -----
+        After running this method, do NOT change any attributes of the class!
+        '''
+        if out.shape != b.shape:
+            raise ValueError(
+                f'out has shape {out.shape}, but b has shape {b.shape}')
+        if self._solver is None:
+            self.prepare_solver()
+
+        if self._free_dofs is None:
+            out[...] = np.reshape(self._solver.solve(b), b.shape)
+            return out
+
+        b_reduced = np.take(b, self._free_dofs, axis=0).astype(float, copy=False)
+        if self._bc_rhs is not None:
+            b_reduced -= self._bc_rhs.reshape((-1,) + (1,) * (b.ndim - 1))
+        x = self._solver.solve(b_reduced)
+        out[self._free_dofs] = np.reshape(x, b_reduced.shape)
+        out[self._bc_dofs] = self._bc_values.reshape((-1,) + (1,) * (b.ndim - 1))
+        return out
 
 
     def calc_gradient(self, v):
@@ -1330,6 +1678,71 @@ def _assemble_matrix(vols, G, th_nodes, cond, dof_map, units='mm'):
     return A
 
 
+class _ParametricStiffness:
+    ''' Assembles the stiffness matrix of a mesh for different conductivities
+
+    The position of each entry of the element matrices in the data array of
+    the CSC matrix is computed once, so that each assembly is a single scatter
+    with a fixed sparsity pattern. Entries which are zero for a given
+    conductivity are kept, so that the pattern does not depend on it
+
+    Parameters
+    ----------
+    G: ndarray
+        Gradient operator (n_th x 4 x 3)
+    vols: ndarray
+        Volume of the tetrahedra
+    th_nodes: ndarray
+        Nodes of the tetrahedra (n_th x 4)
+    dof_map: dofMap
+        Mapping between nodes and rows/columns of the matrix
+    '''
+    def __init__(self, G, vols, th_nodes, dof_map):
+        self.G = G
+        self.vols = vols
+        n = dof_map.nr
+        self.shape = (n, n)
+        dofs = dof_map[th_nodes].astype(np.int64)
+        # Sorting by column and row gives the order of the CSC data array
+        entries, scatter = np.unique(
+            (dofs[:, None, :] * n + dofs[:, :, None]).reshape(-1),
+            return_inverse=True
+        )
+        del dofs
+        self._scatter = scatter.reshape(-1).astype(np.int32)
+        del scatter
+        self.indices = (entries % n).astype(np.int32)
+        self.indptr = np.searchsorted(entries // n, np.arange(n + 1)).astype(np.int32)
+
+    def assemble(self, cond, units='mm'):
+        ''' Assembles the matrix
+
+        Parameters
+        ----------
+        cond: ndarray
+            Conductivity of each tetrahedron, scalar (n_th) or tensor (n_th x 3 x 3)
+        units: {'mm' or 'm'}
+            Units of the mesh nodes
+
+        Returns
+        -------
+        A: scipy.sparse.csc_matrix
+            Stiffness matrix
+        '''
+        if cond.ndim == 1:
+            vGc = self.vols[:, None, None]*self.G*cond[:, None, None]
+        elif cond.ndim == 3:
+            vGc = self.vols[:, None, None]*np.einsum('aij, ajk -> aik', self.G, cond)
+        else:
+            raise ValueError('Invalid cond array')
+        K = np.einsum('aik, ajk -> aij', vGc, self.G)
+        data = np.bincount(self._scatter, K.reshape(-1), minlength=len(self.indices))
+        if units == 'mm':
+            data *= 1e-3  # * 1e6 from the gradiend operator, 1e-9 from the volume
+        return sparse.csc_matrix(
+            (data, self.indices.copy(), self.indptr.copy()), shape=self.shape)
+
+
 def grad_matrix(msh, G=None, split=False):
     ''' Matrix that calculates the gradients at the elements
 
@@ -1400,8 +1813,208 @@ def _vol(msh, volume_tag=None):
     return np.abs(np.linalg.det(th[:, 1:] - th[:, 0, None])) / 6.
 
 
+def _rhs_blocks(n_sims, n_dof, block_size=1):
+    ''' Splits the simulation indices in blocks, the right-hand sides of each
+    block are solved together. The block size is capped such that the dense
+    right-hand side and solution blocks fit in MAX_RHS_BLOCK_MEMORY
+
+    Parameters
+    ----------
+    n_sims: int
+        Number of simulations
+    n_dof: int
+        Number of degrees of freedom in the FEM system
+    block_size: int
+        Requested block size
+
+    Returns
+    -------
+    blocks: list of ndarray
+        Indices of the simulations in each block
+    '''
+    max_block_size = max(1, MAX_RHS_BLOCK_MEMORY // (2 * 8 * n_dof))
+    block_size = int(min(max(block_size, 1), max_block_size))
+    return [
+        np.arange(i, min(i + block_size, n_sims))
+        for i in range(0, n_sims, block_size)
+    ]
+
+
+def _order_positions(matsimnibs_list, angle_scale=10.):
+    '''Orders coil positions such that consecutive positions are close
+
+    Greedy nearest-neighbour path starting from the first position. The
+    distance between two positions combines the distance between the coil
+    centers and the change in the coil orientation. Used with warm starts of
+    iterative solvers, so that each solve starts from the solution of a nearby
+    position. The nearest unvisited position is searched in a KD-tree, which
+    is rebuilt with the unvisited positions when the closest ones in the tree
+    were all visited.
+
+    Parameters
+    ----------
+    matsimnibs_list: list of ndarray
+        List of 4x4 coil position matrices
+    angle_scale: float (optional)
+        Distance, in the units of the matrices, equivalent to turning the
+        coil by one radian. Default: 10
+
+    Returns
+    -------
+    order: ndarray of int
+        Indices of the positions in the order they are to be simulated
+    '''
+    n = len(matsimnibs_list)
+    if n < 3:
+        return np.arange(n)
+    mats = np.asarray(matsimnibs_list, dtype=float)[:, :3]
+    features = np.hstack([
+        mats[:, :, 3],
+        angle_scale * mats[:, :, 0],
+        angle_scale * mats[:, :, 1]
+    ])
+    order = np.empty(n, dtype=int)
+    visited = np.zeros(n, dtype=bool)
+    in_tree = np.arange(n)
+    tree = scipy.spatial.cKDTree(features)
+    current = 0
+    for k in range(n):
+        order[k] = current
+        visited[current] = True
+        if k == n - 1:
+            break
+        _, neighbours = tree.query(features[current], k=min(16, len(in_tree)))
+        neighbours = in_tree[np.atleast_1d(neighbours)]
+        unvisited = neighbours[~visited[neighbours]]
+        if len(unvisited) == 0:
+            in_tree = np.where(~visited)[0]
+            tree = scipy.spatial.cKDTree(features[in_tree])
+            _, nearest = tree.query(features[current])
+            unvisited = in_tree[[nearest]]
+        current = unvisited[0]
+    return order
+
+
+class LeadfieldWriter:
+    ''' Writes simulation results to an HDF5 dataset while keeping the file open
+
+    The dataset is chunked with one simulation per chunk, so that each write
+    touches (and compresses) a single chunk. Optionally, the compression and
+    writing are done in a background thread, so that the next simulation can
+    start right away.
+
+    Parameters
+    ----------
+    fn_hdf5: str
+        Name of the HDF5 file. Opened in append mode
+    dataset: str
+        Name of the dataset to be created
+    shape: tuple
+        Shape of the dataset. The first dimension is the number of simulations
+    dtype: numpy dtype (optional)
+        Data type of the dataset. Default: float
+    compression: None, 'lzf', 'gzip' or int (optional)
+        Compression filter. An integer in the range 0-9 sets the gzip
+        compression level. Default: 'gzip'
+    threaded: bool (optional)
+        Whether to write in a background thread. Default: False
+    max_queue: int (optional)
+        Maximum number of results waiting to be written by the background
+        thread. Limits the memory used by pending writes. Default: 4
+    '''
+    def __init__(self, fn_hdf5, dataset, shape, dtype=float, compression='gzip',
+                 threaded=False, max_queue=4):
+        if not (compression is None or compression in ('lzf', 'gzip') or
+                (isinstance(compression, int) and not isinstance(compression, bool)
+                 and 0 <= compression <= 9)):
+            raise ValueError(
+                "compression should be None, 'lzf', 'gzip' or an integer "
+                f"between 0 and 9 (got {compression})")
+        self.fn_hdf5 = fn_hdf5
+        self.dataset = dataset
+        self._f = h5py.File(fn_hdf5, 'a')
+        try:
+            self._dset = self._f.create_dataset(
+                dataset, shape, dtype=dtype,
+                chunks=(1,) + tuple(shape[1:]) if len(shape) > 1 else None,
+                compression=compression
+            )
+        except Exception:
+            self._f.close()
+            raise
+        self._error = None
+        self._queue = None
+        self._thread = None
+        if threaded:
+            self._queue = queue.Queue(maxsize=max_queue)
+            self._thread = threading.Thread(target=self._write_loop, daemon=True)
+            self._thread.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if self._error is None:
+                try:
+                    self._dset[item[0]] = item[1]
+                except Exception as e:
+                    self._error = e
+
+    def _check_error(self):
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise error
+
+    def write(self, i, value):
+        ''' Writes the result of simulation i
+
+        Parameters
+        ----------
+        i: int
+            Index of the simulation
+        value: ndarray
+            Value to be written. Should not be modified after the call when
+            writing in a background thread
+        '''
+        self._check_error()
+        if self._thread is None:
+            self._dset[i] = value
+        else:
+            self._queue.put((i, value))
+
+    def close(self, raise_error=True):
+        ''' Finishes pending writes and closes the file
+
+        Parameters
+        ----------
+        raise_error: bool (optional)
+            Whether to raise errors from the background thread. Default: True
+        '''
+        try:
+            if self._thread is not None:
+                self._queue.put(None)
+                self._thread.join()
+                self._thread = None
+        finally:
+            if self._f:
+                self._f.close()
+        if raise_error:
+            self._check_error()
+        elif self._error is not None:
+            logger.warning(f'Error writing to {self.fn_hdf5}: {self._error}')
+            self._error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Do not mask an exception which is already propagating
+        self.close(raise_error=exc_type is None)
+
+
 def tdcs(mesh, cond, currents, electrode_surface_tags, n_workers=1, units='mm',
-         solver_options=None):
+         solver_options=None, fem_systems=None):
     ''' Simulates a tDCS electric potential.
 
     Parameters
@@ -1415,6 +2028,12 @@ def tdcs(mesh, cond, currents, electrode_surface_tags, n_workers=1, units='mm',
     electrode_surface_tags: list
         A list of the indices of the surfaces where the dirichlet BC is to be
         applied.
+    fem_systems: dict (optional)
+        Dictionary where the FEM system of each electrode pair is kept between
+        calls on the same mesh. The systems from previous calls are updated
+        with the new conductivities, re-using their sparsity pattern and
+        symbolic factorization (see FEMSystem.update_conductivity). Only used
+        if n_workers=1. Default: None (always set up new systems)
 
     Returns
     -------
@@ -1438,7 +2057,8 @@ def tdcs(mesh, cond, currents, electrode_surface_tags, n_workers=1, units='mm',
     if n_workers == 1:
         for el_surf, el_c in zip(electrode_surface_tags[1:], currents[1:]):
             total_p += _sim_tdcs_pair(
-                mesh, cond, ref_electrode, el_surf, el_c, units, solver_options)
+                mesh, cond, ref_electrode, el_surf, el_c, units, solver_options,
+                fem_systems)
     else:
         with multiprocessing.Pool(processes=n_workers) as pool:
             sims = []
@@ -1455,11 +2075,14 @@ def tdcs(mesh, cond, currents, electrode_surface_tags, n_workers=1, units='mm',
     return mesh_io.NodeData(total_p, 'v', mesh=mesh)
 
 
-def _sim_tdcs_pair(mesh, cond, ref_electrode, el_surf, el_c, units, solver_options):
+def _sim_tdcs_pair(mesh, cond, ref_electrode, el_surf, el_c, units, solver_options,
+                   fem_systems=None):
     logger.info('Simulating electrode pair {0} - {1}'.format(
         ref_electrode, el_surf))
 
-    s = TDCSFEMDirichlet(mesh, cond,  [ref_electrode, el_surf], [0., 1.], solver_options)
+    s = _get_fem_system(
+        fem_systems, (ref_electrode, el_surf), cond,
+        lambda: TDCSFEMDirichlet(mesh, cond,  [ref_electrode, el_surf], [0., 1.], solver_options))
     v = s.solve()
 
     v = mesh_io.NodeData(v, name='v', mesh=mesh)
@@ -1483,6 +2106,21 @@ def _sim_tdcs_pair(mesh, cond, ref_electrode, el_surf, el_c, units, solver_optio
     return el_c / current * v.value
 
 
+def _get_fem_system(fem_systems, key, cond, set_up):
+    ''' Returns the system stored in fem_systems[key] with updated
+    conductivities. Systems not yet in fem_systems are set up by calling
+    set_up() and stored. If fem_systems is None, always calls set_up() '''
+    if fem_systems is None:
+        return set_up()
+    s = fem_systems.get(key)
+    if s is None:
+        s = set_up()
+        fem_systems[key] = s
+    else:
+        s.update_conductivity(cond)
+    return s
+
+
 def _calc_flux_electrodes(v, cond, el_volume, scalp_tag=[ElementTags.SCALP, ElementTags.SCALP_TH_SURFACE], units='mm'):
     # Set-up a mesh with a mesh
     m = copy.deepcopy(v.mesh)
@@ -1529,7 +2167,7 @@ def _calc_flux_electrodes(v, cond, el_volume, scalp_tag=[ElementTags.SCALP, Elem
     return flux
 
 
-def tms_dadt(mesh, cond, dAdt, solver_options=None):
+def tms_dadt(mesh, cond, dAdt, solver_options=None, fem_systems=None):
     ''' Simulates a TMS electric potential from a dA/dt field.
 
     Parameters
@@ -1540,13 +2178,20 @@ def tms_dadt(mesh, cond, dAdt, solver_options=None):
         An ElementData field with conductivity information
     dAdt: simnibs.msh.mesh_io.NodeData or simnibs.msh.mesh_io.ElementData
         dAdt information
+    fem_systems: dict (optional)
+        Dictionary where the FEM system is kept between calls on the same mesh.
+        The system from a previous call is updated with the new
+        conductivities, re-using its sparsity pattern and symbolic
+        factorization (see FEMSystem.update_conductivity).
+        Default: None (always set up a new system)
 
     Returns
     -------
     v:  simnibs.msh.mesh_io.NodeData
         NodeData instance with potential at the nodes
     '''
-    s = TMSFEM(mesh, cond, solver_options)
+    s = _get_fem_system(
+        fem_systems, 'tms', cond, lambda: TMSFEM(mesh, cond, solver_options))
     b = s.assemble_rhs(dAdt)
     v = s.solve(b)
 
@@ -1556,7 +2201,8 @@ def tms_dadt(mesh, cond, dAdt, solver_options=None):
 
 
 def tms_coil(mesh, cond, cond_list, fn_coil, fields, matsimnibs_list, didt_list,
-             output_names, geo_names=None, solver_options=None, n_workers=1):
+             output_names, geo_names=None, solver_options=None, n_workers=1,
+             use_threads=False):
     '''Simulates TMS fields using a coil + matsimnibs + dIdt definition.
 
     Parameters
@@ -1581,6 +2227,12 @@ def tms_coil(mesh, cond, cond_list, fn_coil, fields, matsimnibs_list, didt_list,
         Options for the solver
     n_workers: int
         Number of workers to use
+    use_threads: bool (optional)
+        If True and n_workers > 1, the workers are threads sharing a single
+        copy of the mesh and of the factorized system instead of processes
+        each holding their own copy. The calls to the solver are serialized,
+        the remaining work (dA/dt, post-processing, output) runs in parallel.
+        Default: False
     fn_stl: string
         Name of stl-file for coil visualization
 
@@ -1605,6 +2257,19 @@ def tms_coil(mesh, cond, cond_list, fn_coil, fields, matsimnibs_list, didt_list,
                 mesh, cond, cond_list, fn_coil, fields,
                 matsimnibs, didt, fn_out, fn_geo)
         _finalize_global_solver()
+    elif use_threads:
+        _share_solver_between_threads(S)
+        _set_up_global_solver(S)
+        # calc_fields changes the conductivity field, so each simulation
+        # gets its own copy
+        _run_in_threads(
+            n_workers, _run_tms,
+            ((mesh, _copy_cond(cond), cond_list, fn_coil, fields,
+              matsimnibs, didt, fn_out, fn_geo)
+             for matsimnibs, didt, fn_out, fn_geo in zip(
+                matsimnibs_list, didt_list, output_names, geo_names))
+        )
+        _finalize_global_solver()
     else:
         with multiprocessing.Pool(processes=n_workers,
                                   initializer=_set_up_global_solver,
@@ -1621,6 +2286,15 @@ def tms_coil(mesh, cond, cond_list, fn_coil, fields, matsimnibs_list, didt_list,
             pool.join()
 
 
+def _copy_cond(cond):
+    ''' Copy of a conductivity field which does not share its values '''
+    if not isinstance(cond, mesh_io.Data):
+        return np.array(cond, copy=True)
+    cond_copy = copy.copy(cond)
+    cond_copy.value = np.array(cond.value, copy=True)
+    return cond_copy
+
+
 def _set_up_global_solver(S):
     global tms_global_solver
     tms_global_solver = S
@@ -1654,7 +2328,7 @@ def _run_tms(mesh, cond, cond_list, fn_coil, fields, matsimnibs, didt, fn_out, f
             visible_tags=[ElementTags.GM_TH_SURFACE.value],
             visible_fields=['magnE'],
             cond_list=cond_list)
-        TmsCoil.from_file(fn_coil).append_simulation_visualization(v, fn_geo, skin_mesh, matsimnibs)
+        _read_coil(fn_coil).append_simulation_visualization(v, fn_geo, skin_mesh, matsimnibs)
 
         mesh_io.write_geo_triangles(skin_mesh.elm.node_number_list - 1,
                                         skin_mesh.nodes.node_coord, fn_geo,
@@ -1677,18 +2351,115 @@ def _run_tms(mesh, cond, cond_list, fn_coil, fields, matsimnibs, didt, fn_out, f
     del dAdt, v, b
     gc.collect()
 
-def _get_da_dt_from_coil(fn_coil, mesh, didt, matsimnibs):
+def _read_coil(fn_coil):
+    ''' Reads a coil file once per process
+
+    The parsed coil is cached, keyed by the absolute path, modification time
+    and size of the file, so that a modified file is read again. Do NOT modify
+    the returned coil, use _coil_with_didt to change the dI/dt values.
+
+    Parameters
+    ----------
+    fn_coil: str
+        Name of the coil file
+
+    Returns
+    -------
+    tms_coil: TmsCoil
+        Coil shared by all callers in the process
+    '''
+    fn = os.path.abspath(fn_coil)
+    st = os.stat(fn)
+    key = (fn, st.st_mtime_ns, st.st_size)
+    with _coil_cache_lock:
+        tms_coil = _coil_cache.get(key)
+    if tms_coil is not None:
+        return tms_coil
     tms_coil = TmsCoil.from_file(fn_coil)
+    with _coil_cache_lock:
+        # Drop older versions of the file and the oldest coils
+        for k in [k for k in _coil_cache if k[0] == fn]:
+            del _coil_cache[k]
+        while len(_coil_cache) >= COIL_CACHE_SIZE:
+            del _coil_cache[next(iter(_coil_cache))]
+        _coil_cache[key] = tms_coil
+    return tms_coil
 
+
+def _clear_coil_cache():
+    with _coil_cache_lock:
+        _coil_cache.clear()
+
+
+def _coil_with_didt(tms_coil, didt):
+    ''' Copy of the coil with different stimulator dI/dt values
+
+    Only the coil, element and stimulator objects are copied, the element
+    data (dipoles, line segments, sampled grids) is shared with tms_coil, which
+    is not modified.
+
+    Parameters
+    ----------
+    tms_coil: TmsCoil
+        Coil
+    didt: float or list of float
+        dI/dt of all stimulators, or one value per stimulator
+
+    Returns
+    -------
+    coil_view: TmsCoil
+        Coil with the given dI/dt values
+    '''
+    stimulators = list(tms_coil.get_elements_grouped_by_stimulators().keys())
     didt = np.atleast_1d(didt)
     if len(didt) == 1:
-        for stimulator in tms_coil.get_elements_grouped_by_stimulators().keys():
-            stimulator.di_dt = didt
-    else:
-        for stimulator, stimulator_didt in zip(tms_coil.get_elements_grouped_by_stimulators().keys(), didt):
-            stimulator.di_dt = stimulator_didt
+        didt = np.repeat(didt, len(stimulators))
+    new_stimulators = {}
+    for stimulator, stimulator_didt in zip(stimulators, didt):
+        new_stimulators[id(stimulator)] = copy.copy(stimulator)
+        new_stimulators[id(stimulator)].di_dt = stimulator_didt
+    coil_view = copy.copy(tms_coil)
+    coil_view.elements = []
+    for element in tms_coil.elements:
+        element = copy.copy(element)
+        element.stimulator = new_stimulators.get(
+            id(element.stimulator), element.stimulator)
+        coil_view.elements.append(element)
+    return coil_view
+
+
+def _get_da_dt_from_coil(fn_coil, mesh, didt, matsimnibs):
+    tms_coil = _coil_with_didt(_read_coil(fn_coil), didt)
     return tms_coil.get_da_dt(mesh, matsimnibs).node_data2elm_data()
 
+
+def _get_da_dt_from_coil_batch(fn_coil, mesh, didt_list, matsimnibs_list):
+    ''' dA/dt at the elements for several coil positions. The A field of
+    each coil element is evaluated for all positions at once, see
+    TmsCoil.get_a_field_batch '''
+    tms_coil = _read_coil(fn_coil)
+    stimulators = list(tms_coil.get_elements_grouped_by_stimulators().keys())
+    # dI/dt of each stimulator for each position, as in _coil_with_didt
+    didt = np.empty((len(didt_list), len(stimulators)))
+    for i, d in enumerate(didt_list):
+        d = np.atleast_1d(d)
+        if len(d) == 1:
+            d = np.repeat(d, len(stimulators))
+        didt[i] = [
+            d[k] if k < len(d) else stimulator.di_dt
+            for k, stimulator in enumerate(stimulators)
+        ]
+    matsimnibs_list = np.asarray(matsimnibs_list, dtype=float)
+    dAdt = np.zeros((len(matsimnibs_list), mesh.nodes.nr, 3))
+    for element in tms_coil.elements:
+        k = stimulators.index(element.stimulator)
+        dAdt += didt[:, k, None, None] * element.get_a_field_batch(
+            mesh.nodes.node_coord, matsimnibs_list)
+    return [
+        mesh_io.NodeData(d, mesh=mesh).node_data2elm_data()
+        for d in dAdt
+    ]
+
 def _finalize_global_solver():
     global tms_global_solver
     del tms_global_solver
@@ -1730,7 +2501,8 @@ def tdcs_neumann(mesh, cond, currents, electrode_surface_tags):
 def tdcs_leadfield(mesh, cond, electrode_surface, fn_hdf5, dataset,
                    current=1., roi=None, post_pro=None, field='E',
                    solver_options=None, n_workers=1, input_type='tag',
-                   weigh_by_area=True):
+                   weigh_by_area=True, block_size=1, compression='gzip',
+                   use_threads=False):
     '''Simulates tDCS fields using Neumann boundary conditions and writes the
     output electric fields to an HDF5 file.
 
@@ -1774,6 +2546,20 @@ def tdcs_leadfield(mesh, cond, electrode_surface, fn_hdf5, dataset,
     weigh_by_area: bool
         Weigh current by node area. If `input_type == "tag"` this is ignored
         and area weighting is implied.
+    block_size: int (optional)
+        Number of simulations whose right-hand sides are solved together in a
+        single call to the solver. Larger blocks are faster with the direct
+        solvers (pardiso, mumps, petsc_pardiso), as the factorization only
+        needs to be traversed once per block. The block size is capped such
+        that the dense blocks take at most MAX_RHS_BLOCK_MEMORY bytes. Only
+        used when n_workers == 1. Default: 1
+    compression: None, 'lzf', 'gzip' or int (optional)
+        Compression of the HDF5 dataset. An integer in the range 0-9 sets the
+        gzip compression level. Default: 'gzip'
+    use_threads: bool (optional)
+        If True and n_workers > 1, the workers are threads sharing a single
+        copy of the mesh, gradient matrices and factorized system instead of
+        processes each holding their own copy. See tms_coil. Default: False
 
     Returns
     -------
@@ -1839,84 +2625,106 @@ def tdcs_leadfield(mesh, cond, electrode_surface, fn_hdf5, dataset,
     if post_pro is not None:
         n_out = len(post_pro(np.zeros((n_out, 3))))
 
-    # Create HDF5 dataset
-    with h5py.File(fn_hdf5, 'a') as f:
-        f.create_dataset(
-            dataset,
-            (len(electrode_surface) - 1, n_out, 3),
-            dtype=float, compression="gzip")
-
     n_sims = len(electrode_surface) - 1
     currents = [current]*n_sims if isinstance(current, float) else current
     assert len(currents) == n_sims, f"Number of currents ({len(currents)}) do not correspond to the number of simulations ({n_sims})"
 
+    # The HDF5 dataset is only created in the "with" statements closing it
+    def open_writer():
+        return LeadfieldWriter(
+            fn_hdf5, dataset, (n_sims, n_out, 3),
+            compression=compression, threaded=True
+        )
+
     # Run simulations (sequential)
     if n_workers == 1:
-        for i, (el_tag, current) in enumerate(zip(electrode_surface[1:], currents)):
-            logger.info(f'Running Simulation {i+1} of {n_sims}')
-            b = S.assemble_rhs([el_tag], [current])
-            v = S.solve(b)
+        with open_writer() as writer:
+            for block in _rhs_blocks(n_sims, S.dof_map.nr, block_size):
+                if len(block) == 1:
+                    logger.info(f'Running Simulation {block[0]+1} of {n_sims}')
+                else:
+                    logger.info(f'Running Simulations {block[0]+1} to {block[-1]+1} of {n_sims}')
+                b = np.stack(
+                    [S.assemble_rhs([electrode_surface[i+1]], [currents[i]]) for i in block],
+                    axis=1
+                )
+                v_block = S.solve(b).reshape(-1, len(block))
+                E_block = np.stack([-d.dot(v_block) for d in D], axis=-1) * 1e3
+
+                for j, i in enumerate(block):
+                    el_tag = electrode_surface[i+1]
+                    v = v_block[:, j]
+                    #TODO implement calibration error also for element/node defined electrodes
+                    # when input_type == "nodes"
+                    if input_type == "tag":
+                        # estimate calibration error
+                        ref_electrode = el_tag
+                        # other_electrodes = [x for x in electrode_surface if np.all(x!=ref_electrode)][0]
+                        other_electrodes = np.array([x for x in electrode_surface if x!=ref_electrode])
+
+                        v_ = mesh_io.NodeData(v, name='v', mesh=mesh)
+                        flux = np.array([
+                            _calc_flux_electrodes(v_, cond,
+                                                [other_electrodes - 1000, other_electrodes - 600,
+                                                other_electrodes - 2000, other_electrodes - 1600],
+                                                units='mm'),
+                            _calc_flux_electrodes(v_, cond,
+                                                [ref_electrode - 1000, ref_electrode - 600,
+                                                ref_electrode - 2000, ref_electrode - 1600],
+                                                units='mm')])
+                        current_ = np.average(np.abs(flux))
+                        error = np.abs(np.abs(flux[0]) - np.abs(flux[1])) / current_
+                        if error > 0.1:
+                            logger.warning(f'The current calibration error exceeded 10%! Estimated error value: {error*100:.2f}%')
+
+                    E = E_block[:, j]
+                    if field == 'E':
+                        out_field = E
+                    elif field == 'J':
+                        out_field = calc_J(E, cond_roi)
+                    else:
+                        raise ValueError
+                    if post_pro is not None:
+                        out_field = post_pro(out_field)
+                    writer.write(i, out_field)
+
+        del S, b, v_block, E_block
+        gc.collect()
 
-            #TODO implement calibration error also for element/node defined electrodes
-            # when input_type == "nodes"
+    # Run simulations (parallel)
+    # The workers return the results, which are written by a single writer in
+    # this process as they arrive
+    else:
+        sim_args = []
+        for i, (el_tag, current) in enumerate(zip(electrode_surface[1:], currents)):
             if input_type == "tag":
-                # estimate calibration error
                 ref_electrode = el_tag
-                # other_electrodes = [x for x in electrode_surface if np.all(x!=ref_electrode)][0]
                 other_electrodes = np.array([x for x in electrode_surface if x!=ref_electrode])
-
-                v_ = mesh_io.NodeData(v, name='v', mesh=mesh)
-                flux = np.array([
-                    _calc_flux_electrodes(v_, cond,
-                                        [other_electrodes - 1000, other_electrodes - 600,
-                                        other_electrodes - 2000, other_electrodes - 1600],
-                                        units='mm'),
-                    _calc_flux_electrodes(v_, cond,
-                                        [ref_electrode - 1000, ref_electrode - 600,
-                                        ref_electrode - 2000, ref_electrode - 1600],
-                                        units='mm')])
-                current_ = np.average(np.abs(flux))
-                error = np.abs(np.abs(flux[0]) - np.abs(flux[1])) / current_
-                if error > 0.1:
-                    logger.warning(f'The current calibration error exceeded 10%! Estimated error value: {error*100:.2f}%')
-
-            E = np.vstack([-d.dot(v) for d in D]).T * 1e3
-            if field == 'E':
-                out_field = E
-            elif field == 'J':
-                out_field = calc_J(E, cond_roi)
             else:
-                raise ValueError
-            if post_pro is not None:
-                out_field = post_pro(out_field)
-            with h5py.File(fn_hdf5, 'a') as f:
-                f[dataset][i] = out_field
-
-        del S, b, v
-        gc.collect()
-
-    # Run simulations (parallel)
-    else:
-        # Lock has to be passed through inheritance
-        S.lock = multiprocessing.Lock()
-        with multiprocessing.Pool(processes=n_workers,
-                                  initializer=_set_up_tdcs_global_solver,
-                                  initargs=(S, n_sims, D, post_pro, cond_roi, field)) as pool:
-            sims = []
-            for i, (el_tag, current) in enumerate(zip(electrode_surface[1:], currents)):
-                if input_type == "tag":
-                    ref_electrode = el_tag
-                    other_electrodes = np.array([x for x in electrode_surface if x!=ref_electrode])
-                else:
-                    ref_electrode = el_tag
-                    other_electrodes = [x for x in electrode_surface if np.all(x!=ref_electrode)][0]
-                sims.append(
-                    pool.apply_async(
-                        _run_tdcs_leadfield,
-                        (i, [el_tag], [current], fn_hdf5, dataset, input_type, mesh, cond, ref_electrode, other_electrodes)))
-            [s.get() for s in sims]
-            pool.close()
-            pool.join()
+                ref_electrode = el_tag
+                other_electrodes = [x for x in electrode_surface if np.all(x!=ref_electrode)][0]
+            sim_args.append(
+                (i, [el_tag], [current], input_type, mesh, cond, ref_electrode, other_electrodes))
+
+        if use_threads:
+            _share_solver_between_threads(S)
+            _set_up_tdcs_global_solver(S, n_sims, D, post_pro, cond_roi, field)
+            with open_writer() as writer:
+                _run_in_threads(
+                    n_workers, _run_tdcs_leadfield, sim_args,
+                    callback=lambda result: writer.write(*result))
+            _finalize_tdcs_global_solver()
+        else:
+            with open_writer() as writer, multiprocessing.Pool(
+                    processes=n_workers,
+                    initializer=_set_up_tdcs_global_solver,
+                    initargs=(S, n_sims, D, post_pro, cond_roi, field)) as pool:
+                # Written in this thread, so that writer errors reach the caller
+                for result in pool.imap_unordered(
+                        _apply_args, [(_run_tdcs_leadfield, args) for args in sim_args]):
+                    writer.write(*result)
+                pool.close()
+                pool.join()
 
 
 # ### Functions for running tDCS leadfields in parallel ####
@@ -1935,7 +2743,7 @@ def _set_up_tdcs_global_solver(S, n, D, post_pro, cond, field):
     tdcs_global_field = field
 
 
-def _run_tdcs_leadfield(i, el_tags, currents, fn_hdf5, dataset, input_type, mesh, cond, ref_electrode, other_electrodes):
+def _run_tdcs_leadfield(i, el_tags, currents, input_type, mesh, cond, ref_electrode, other_electrodes):
     global tdcs_global_solver
     global tdcs_global_nsims
     global tdcs_global_grad_matrix
@@ -1976,14 +2784,10 @@ def _run_tdcs_leadfield(i, el_tags, currents, fn_hdf5, dataset, input_type, mesh
 
     if tdcs_global_post_pro is not None:
         out_field = tdcs_global_post_pro(out_field)
-    # Write out
-    tdcs_global_solver.lock.acquire()
-    with h5py.File(fn_hdf5, 'a') as f:
-        f[dataset][i] = out_field
-    tdcs_global_solver.lock.release()
 
     del b, v
     gc.collect()
+    return i, out_field
 
 
 def _finalize_tdcs_global_solver():
@@ -2001,7 +2805,8 @@ def _finalize_tdcs_global_solver():
 def tms_many_simulations(
     mesh, cond, fn_coil, matsimnibs_list, didt_list,
     fn_hdf5, dataset, roi=None, field='E', post_pro=None,
-    solver_options=None, n_workers=1):
+    solver_options=None, n_workers=1, block_size=1, compression='gzip',
+    use_threads=False, warm_start=False):
     ''' Function for running a large amount of TMS simulations.
 
     Parameters
@@ -2035,6 +2840,22 @@ def tms_many_simulations(
         Options to be used by the solver. Default: Hypre solver
     n_workers: int
         Number of workers to use
+    block_size: int (optional)
+        Number of coil positions whose right-hand sides are solved together in
+        a single call to the solver. See tdcs_leadfield. Only used when
+        n_workers == 1. Default: 1
+    compression: None, 'lzf', 'gzip' or int (optional)
+        Compression of the HDF5 dataset. An integer in the range 0-9 sets the
+        gzip compression level. Default: 'gzip'
+    use_threads: bool (optional)
+        If True and n_workers > 1, the workers are threads sharing a single
+        copy of the mesh, gradient matrices and factorized system instead of
+        processes each holding their own copy. See tms_coil. Default: False
+    warm_start: bool (optional)
+        If True, the positions are simulated in a nearest-neighbour order and
+        the iterative solver (hypre) starts each solve from the potential of
+        the previous position. The results are still stored in the order of
+        matsimnibs_list. Has no effect on direct solvers. Default: False
     '''
     for f in field:
         if f not in 'EDJv':
@@ -2043,6 +2864,7 @@ def tms_many_simulations(
         raise ValueError("matsimnibs_list and didt_list should have the same length")
     D = grad_matrix(mesh, split=True)
     S = TMSFEM(mesh, cond, solver_options)
+    S.set_warm_start(warm_start)
     n_out = mesh.elm.nr
     # Separate out the part of the gradient that is in the ROI
     if roi is not None:
@@ -2065,69 +2887,97 @@ def tms_many_simulations(
         n_out = (n_roi, 3)
 
     n_sims = len(matsimnibs_list)
-    # Create HDF5 dataset
-    with h5py.File(fn_hdf5, 'a') as f:
-        f.create_dataset(
-            dataset,
-            (n_sims,) + n_out,
-            dtype=float, compression="gzip")
+    # Simulate nearby positions one after the other, so that each solve is
+    # started from a good initial guess
+    if warm_start:
+        order = _order_positions(matsimnibs_list)
+    else:
+        order = np.arange(n_sims)
+    # The HDF5 dataset is only created in the "with" statements closing it
+    def open_writer():
+        return LeadfieldWriter(
+            fn_hdf5, dataset, (n_sims,) + n_out,
+            compression=compression, threaded=True
+        )
 
     # Run sequentially
     if n_workers == 1:
-        for i, matsimnibs, didt in zip(range(n_sims), matsimnibs_list, didt_list):
-            logger.info(
-                f'Running Simulation {i+1} of {n_sims}')
-            dAdt = _get_da_dt_from_coil(fn_coil, mesh, didt, matsimnibs)
-            # b = S.assemble_tms_rhs(dAdt)
-            b = S.assemble_rhs(dAdt)
-            v = S.solve(b)
-            E = np.vstack([-d.dot(v) for d in D]).T * 1e3
-            dAdt = dAdt[roi]
-            E -= dAdt
-
-            # build output fields
-            out_field = []
-            if 'E' in field:
-                out_field.append(E)
-            if 'D' in field:
-                out_field.append(dAdt)
-            if 'J' in field:
-                out_field.append(calc_J(E, cond))
-            if 'v' in field:
-                out_field.append(v)
-            out_field = tuple(out_field)
-
-            # if only one field to output, un-tuple
-            if len(out_field) == 1:
-                out_field = out_field[0]
-            if post_pro is not None:
-                out_field = post_pro(out_field)
-            with h5py.File(fn_hdf5, 'a') as f:
-                f[dataset][i] = out_field
-
-            del b
-            gc.collect()
+        with open_writer() as writer:
+            for block in _rhs_blocks(n_sims, S.dof_map.nr, block_size):
+                if len(block) == 1:
+                    logger.info(f'Running Simulation {block[0]+1} of {n_sims}')
+                else:
+                    logger.info(f'Running Simulations {block[0]+1} to {block[-1]+1} of {n_sims}')
+                block = order[block]
+                if len(block) == 1:
+                    dAdt_block = [
+                        _get_da_dt_from_coil(
+                            fn_coil, mesh, didt_list[block[0]], matsimnibs_list[block[0]])
+                    ]
+                else:
+                    dAdt_block = _get_da_dt_from_coil_batch(
+                        fn_coil, mesh,
+                        [didt_list[i] for i in block],
+                        [matsimnibs_list[i] for i in block])
+                b = np.stack([S.assemble_rhs(dAdt) for dAdt in dAdt_block], axis=1)
+                v_block = S.solve(b).reshape(-1, len(block))
+                E_block = np.stack([-d.dot(v_block) for d in D], axis=-1) * 1e3
+
+                for j, i in enumerate(block):
+                    v = v_block[:, j]
+                    dAdt = dAdt_block[j][roi]
+                    E = E_block[:, j] - dAdt
+
+                    # build output fields
+                    out_field = []
+                    if 'E' in field:
+                        out_field.append(E)
+                    if 'D' in field:
+                        out_field.append(dAdt)
+                    if 'J' in field:
+                        out_field.append(calc_J(E, cond))
+                    if 'v' in field:
+                        out_field.append(v)
+                    out_field = tuple(out_field)
+
+                    # if only one field to output, un-tuple
+                    if len(out_field) == 1:
+                        out_field = out_field[0]
+                    if post_pro is not None:
+                        out_field = post_pro(out_field)
+                    writer.write(i, out_field)
+
+                del b, dAdt_block, v_block, E_block
+                gc.collect()
 
         del S
         gc.collect()
 
+    # Run in parallel using threads sharing the solver
+    elif use_threads:
+        _share_solver_between_threads(S)
+        _set_up_tms_many_global_solver(S, fn_coil, n_sims, D, post_pro, cond, field, roi)
+        with open_writer() as writer:
+            _run_in_threads(
+                n_workers, _run_tms_many_simulations,
+                ((i, matsimnibs_list[i], didt_list[i]) for i in order),
+                callback=lambda result: writer.write(*result))
+        _finalize_tms_many_simulations_global_solver()
+
     # Run in parallel
+    # The workers return the results, which are written by a single writer in
+    # this process as they arrive
     else:
-        # Lock has to be passed through inheritance
-        S.lock = multiprocessing.Lock()
-        with multiprocessing.Pool(
+        with open_writer() as writer, multiprocessing.Pool(
                 processes=n_workers,
                 initializer=_set_up_tms_many_global_solver,
                 initargs=(S, fn_coil, n_sims, D, post_pro, cond, field, roi)) as pool:
-            sims = []
-            for i, matsimnibs, didt in zip(
-                    range(n_sims), matsimnibs_list, didt_list):
-                sims.append(
-                    pool.apply_async(
-                        _run_tms_many_simulations,
-                        (i, matsimnibs, didt,
-                         fn_hdf5, dataset)))
-            [s.get() for s in sims]
+            # Written in this thread, so that writer errors reach the caller
+            for result in pool.imap_unordered(
+                    _apply_args,
+                    [(_run_tms_many_simulations, (i, matsimnibs_list[i], didt_list[i]))
+                     for i in order]):
+                writer.write(*result)
             pool.close()
             pool.join()
 
@@ -2152,7 +3002,7 @@ def _set_up_tms_many_global_solver(S, fn_coil, n, D, post_pro, cond, field, roi)
     tms_many_global_roi = roi
 
 
-def _run_tms_many_simulations(i, matsimnibs, didt, fn_hdf5, dataset):
+def _run_tms_many_simulations(i, matsimnibs, didt):
     global tms_many_global_solver
     global tms_many_global_fn_coil
     global tms_many_global_nsims
@@ -2194,14 +3044,10 @@ def _run_tms_many_simulations(i, matsimnibs, didt, fn_hdf5, dataset):
 
     if tms_many_global_post_pro is not None:
         out_field = tms_many_global_post_pro(out_field)
-    # Write out
-    tms_many_global_solver.lock.acquire()
-    with h5py.File(fn_hdf5, 'a') as f:
-        f[dataset][i] = out_field
-    tms_many_global_solver.lock.release()
 
     del b
     gc.collect()
+    return i, out_field
 
 
 
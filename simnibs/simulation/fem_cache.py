@@ -0,0 +1,257 @@
+'''
+    On-disk cache of assembled FEM matrices, solver reorderings and other
+    geometry derived arrays
+
+    This program is part of the SimNIBS package.
+    Please check on www.simnibs.org how to cite our work in publications.
+
+    This program is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+'''
+
+import glob
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import scipy.sparse as sparse
+
+from ..utils.simnibs_logger import logger
+
+FEM_CACHE_DIRNAME = 'fem_cache'
+
+
+class FEMCache:
+    ''' Least-recently-used on-disk cache for FEM systems
+
+    Entries are keyed by a hash of the node coordinates, the tetrahedra, the
+    conductivities and the units (for the assembled matrix) and additionally
+    of the Dirichlet boundary conditions (for the fill-reducing permutation).
+
+    Parameters
+    ----------
+    directory: str or None
+        Directory where the cache is stored. If None, the cache is stored in
+        the "fem_cache" subfolder of the m2m folder of each mesh, which is
+        found from the mesh file name. Meshes without a file name are then not
+        cached.
+    max_size: int (optional)
+        Maximum size of the cache, in bytes. When exceeded, the least recently
+        used entries are removed. Default: 10 GB
+
+    Attributes
+    ----------
+    hits: int
+        Number of entries loaded from the cache
+    misses: int
+        Number of entries not found in the cache
+    '''
+    def __init__(self, directory=None, max_size=10 * 1024**3):
+        self.directory = directory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def get_directory(self, mesh):
+        ''' Directory of the cache for a given mesh. None if it can not be found '''
+        if self.directory is not None:
+            return self.directory
+        if not getattr(mesh, 'fn', None):
+            return None
+        return os.path.join(
+            os.path.dirname(os.path.abspath(mesh.fn)), FEM_CACHE_DIRNAME)
+
+    @staticmethod
+    def matrix_key(mesh, cond, units):
+        ''' Hash of the quantities defining the stiffness matrix
+
+        Parameters
+        ----------
+        mesh: simnibs.mesh_io.Msh
+            Mesh structure
+        cond: ndarray
+            Conductivity of each element
+        units: str
+            Units of the mesh
+
+        Returns
+        -------
+        key: str
+            Hexadecimal hash
+        '''
+        h = hashlib.blake2b(digest_size=20)
+        h.update(np.ascontiguousarray(mesh.nodes.node_coord, dtype=float))
+        h.update(np.ascontiguousarray(mesh.elm.elm_type, dtype=np.int64))
+        h.update(np.ascontiguousarray(mesh.elm.node_number_list, dtype=np.int64))
+        h.update(np.ascontiguousarray(cond, dtype=float))
+        h.update(units.encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def solver_key(matrix_key, dirichlet, solver_options):
+        ''' Hash of the matrix key, the Dirichlet boundary conditions and the solver '''
+        h = hashlib.blake2b(digest_size=20)
+        h.update(matrix_key.encode())
+        if dirichlet is not None:
+            h.update(np.ascontiguousarray(dirichlet.nodes, dtype=np.int64))
+        h.update(solver_options.encode())
+        return h.hexdigest()
+
+    @staticmethod
+    def array_key(name, *values):
+        ''' Hash of a name and a sequence of arrays, strings or numbers
+
+        Parameters
+        ----------
+        name: str
+            Name of the quantity being cached
+        *values: ndarray, str, int or float
+            Values defining the cached quantity
+
+        Returns
+        -------
+        key: str
+            Hexadecimal hash
+        '''
+        h = hashlib.blake2b(digest_size=20)
+        h.update(name.encode())
+        for v in values:
+            if isinstance(v, str):
+                h.update(v.encode())
+            else:
+                v = np.asarray(v)
+                h.update(str(v.dtype).encode())
+                h.update(str(v.shape).encode())
+                h.update(np.ascontiguousarray(v))
+        return h.hexdigest()
+
+    def _fn(self, mesh, key, suffix):
+        directory = self.get_directory(mesh)
+        if directory is None:
+            return None
+        return os.path.join(directory, key + suffix)
+
+    def _touch(self, fn):
+        try:
+            os.utime(fn)
+        except OSError:
+            pass
+
+    def load_matrix(self, mesh, key):
+        ''' Loads an assembled matrix. Returns None if not in the cache '''
+        fn = self._fn(mesh, key, '.A.npz')
+        if fn is None or not os.path.isfile(fn):
+            self.misses += 1
+            return None
+        try:
+            A = sparse.load_npz(fn).tocsc()
+        except (OSError, ValueError) as e:
+            logger.warning(f'Could not read FEM cache entry {fn}: {e}')
+            self.misses += 1
+            return None
+        self._touch(fn)
+        self.hits += 1
+        logger.info(f'Loaded FEM matrix from cache: {fn}')
+        return A
+
+    def save_matrix(self, mesh, key, A):
+        ''' Stores an assembled matrix '''
+        fn = self._fn(mesh, key, '.A.npz')
+        if fn is not None:
+            self._write(fn, lambda f: sparse.save_npz(f, sparse.csc_matrix(A), compressed=False))
+
+    def load_perm(self, mesh, key):
+        ''' Loads a fill-reducing permutation. Returns None if not in the cache '''
+        fn = self._fn(mesh, key, '.perm.npy')
+        if fn is None or not os.path.isfile(fn):
+            self.misses += 1
+            return None
+        try:
+            perm = np.load(fn)
+        except (OSError, ValueError) as e:
+            logger.warning(f'Could not read FEM cache entry {fn}: {e}')
+            self.misses += 1
+            return None
+        self._touch(fn)
+        self.hits += 1
+        logger.info(f'Loaded solver reordering from cache: {fn}')
+        return perm
+
+    def save_perm(self, mesh, key, perm):
+        ''' Stores a fill-reducing permutation '''
+        fn = self._fn(mesh, key, '.perm.npy')
+        if fn is not None:
+            self._write(fn, lambda f: np.save(f, perm))
+
+    def load_arrays(self, mesh, key):
+        ''' Loads a dictionary of arrays. Returns None if not in the cache '''
+        fn = self._fn(mesh, key, '.arrays.npz')
+        if fn is None or not os.path.isfile(fn):
+            self.misses += 1
+            return None
+        try:
+            with np.load(fn) as f:
+                arrays = {k: f[k] for k in f.files}
+        except (OSError, ValueError) as e:
+            logger.warning(f'Could not read FEM cache entry {fn}: {e}')
+            self.misses += 1
+            return None
+        self._touch(fn)
+        self.hits += 1
+        logger.info(f'Loaded arrays from cache: {fn}')
+        return arrays
+
+    def save_arrays(self, mesh, key, **arrays):
+        ''' Stores a set of arrays, given as keyword arguments '''
+        fn = self._fn(mesh, key, '.arrays.npz')
+        if fn is not None:
+            self._write(fn, lambda f: np.savez(f, **arrays))
+
+    def _write(self, fn, write_func):
+        ''' Writes atomically, so that concurrent runs never read partial
+        entries, and evicts old entries afterwards '''
+        directory = os.path.dirname(fn)
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=directory, delete=False) as f:
+                write_func(f)
+            os.replace(f.name, fn)
+        except OSError as e:
+            logger.warning(f'Could not write FEM cache entry {fn}: {e}')
+            return
+        self.evict(directory)
+
+    def evict(self, directory):
+        ''' Removes the least recently used entries in the directory until its
+        size is below max_size '''
+        entries = []
+        for fn in glob.glob(os.path.join(directory, '*.A.npz')) + \
+                glob.glob(os.path.join(directory, '*.perm.npy')) + \
+                glob.glob(os.path.join(directory, '*.arrays.npz')):
+            try:
+                st = os.stat(fn)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, fn))
+        entries.sort()
+        total_size = sum(e[1] for e in entries)
+        for _, size, fn in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(fn)
+                total_size -= size
+                logger.debug(f'Removed FEM cache entry {fn}')
+            except OSError:
+                pass
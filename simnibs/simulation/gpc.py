@@ -20,6 +20,8 @@
 
 '''
 from __future__ import print_function
+import functools
+import multiprocessing
 import os
 
 import h5py
@@ -522,7 +524,7 @@ def run_tms_gpc(poslist, fn_simu, cpus=1, tissues=[ElementTags.GM], eps=1e-2,
     fn_simu: str
         Output name
     cpus: int (optional)
-        Number of CPUs to use
+        Number of processes used to run the simulations of each gPC iteration
     tissues: list (Optional)
         List of tissue tags where to evaluate the electric field. Default: [2]
     eps: float (optional)
@@ -541,10 +543,6 @@ def run_tms_gpc(poslist, fn_simu, cpus=1, tissues=[ElementTags.GM], eps=1e-2,
     '''
     poslist._prepare()
     fn_simu = os.path.abspath(os.path.expanduser(fn_simu))
-    if cpus > 1:
-        logger.warning("Can't run GPC with multiprocessing (for now)")
-        logger.warning("Setting cpus=1")
-        cpus = 1
 
     logger.info('Running a gPC expansion with tolerance: {0:1e}'.format(eps))
     # run simulations
@@ -564,15 +562,19 @@ def run_tms_gpc(poslist, fn_simu, cpus=1, tissues=[ElementTags.GM], eps=1e-2,
             poslist.fnamecoil, matsimnibs, p.didt,
             roi=tissues)
         sampler.create_hdf5()
-        reg, phi = pygpc.adaptive.run_reg_adaptive_grid(
-            pdf_type, pdfshape, limits,
-            sampler.run_simulation,
-            data_poly_ratio=data_poly_ratio,
-            max_iter=max_iter,
-            eps=eps,
-            n_cpus=cpus,
-            print_function=logger.info,
-            min_iter=min_iter)
+        try:
+            reg, phi = pygpc.adaptive.run_reg_adaptive_grid(
+                pdf_type, pdfshape, limits,
+                functools.partial(sampler.run_simulations, n_cpus=cpus),
+                data_poly_ratio=data_poly_ratio,
+                max_iter=max_iter,
+                eps=eps,
+                n_cpus=cpus,
+                print_function=logger.info,
+                min_iter=min_iter,
+                vectorized=True)
+        finally:
+            sampler.close_pool()
         gpc_reg = gPC_regression(random_vars,
                                  pdf_type, pdfshape, limits, reg.poly_idx,
                                  reg.grid.coords_norm, 'TMS',
@@ -597,7 +599,7 @@ def run_tcs_gpc(poslist, fn_simu, cpus=1, tissues=[2], eps=1e-2,
     fn_simu: str
         Output name
     cpus: int (optional)
-        Number of CPUs to use
+        Number of processes used to run the simulations of each gPC iteration
     tissues: list (Optional)
         List of tissue tags where to evaluate the electric field. Default: [2]
     eps: float (optional)
@@ -616,10 +618,6 @@ def run_tcs_gpc(poslist, fn_simu, cpus=1, tissues=[2], eps=1e-2,
     '''
     poslist._prepare()
     fn_simu = os.path.abspath(os.path.expanduser(fn_simu))
-    if cpus > 1:
-        logger.warning("Can't run GPC with multiprocessing (for now)")
-        logger.warning("Setting cpus=1")
-        cpus = 1
     logger.info('Running a gPC expansion with tolerance: {0:1e}'.format(eps))
     fn_hdf5 = fn_simu+'_gpc.hdf5'
     if os.path.isfile(fn_hdf5):
@@ -638,16 +636,20 @@ def run_tcs_gpc(poslist, fn_simu, cpus=1, tissues=[2], eps=1e-2,
         electrode_surfaces, poslist.currents,
         roi=tissues)
     sampler.create_hdf5()
-    reg, phi = pygpc.adaptive.run_reg_adaptive_grid(
-        pdf_type, pdfshape, limits,
-        sampler.run_simulation,
-        data_poly_ratio=data_poly_ratio,
-        max_iter=max_iter,
-        eps=eps,
-        regularization_factors=regularization_factors,
-        n_cpus=cpus,
-        print_function=logger.info,
-        min_iter=min_iter)
+    try:
+        reg, phi = pygpc.adaptive.run_reg_adaptive_grid(
+            pdf_type, pdfshape, limits,
+            functools.partial(sampler.run_simulations, n_cpus=cpus),
+            data_poly_ratio=data_poly_ratio,
+            max_iter=max_iter,
+            eps=eps,
+            regularization_factors=regularization_factors,
+            n_cpus=cpus,
+            print_function=logger.info,
+            min_iter=min_iter,
+            vectorized=True)
+    finally:
+        sampler.close_pool()
     gpc_reg = gPC_regression(random_vars,
                              pdf_type, pdfshape, limits, reg.poly_idx,
                              reg.grid.coords_norm, 'TCS',
@@ -704,6 +706,18 @@ class gPCSampler(object):
         self._gpc_vars = prep_gpc(poslist)
         self.identifiers = self._gpc_vars[0]
         self.qoi_function = OrderedDict([('E', self._calc_E)])
+        # FEM systems kept between samples, only the conductivities change
+        self._fem_systems = {}
+        self._pool = None
+        self._pool_size = 0
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # solvers and pools can not be sent to other processes
+        state['_fem_systems'] = {}
+        state['_pool'] = None
+        state['_pool_size'] = 0
+        return state
 
     def create_hdf5(self):
         '''Creates an HDF5 file to store the data '''
@@ -729,7 +743,7 @@ class gPCSampler(object):
             roi = f['roi'][()].tolist()
         return cls(mesh, poslist, fn_hdf5, roi)
 
-    def record_data_matrix(self, data, name, group):
+    def record_data_matrix(self, data, name, group, batch=False):
         ''' Appends or create data to the HDF5 file 
 
         Parameters:
@@ -740,26 +754,129 @@ class gPCSampler(object):
             Name of data seet
         group: str
             Group where to place data set
+        batch: bool (optional)
+            If True, data contains several samples along the first dimension,
+            which are appended with a single resize. Default: False
         '''
-        data = np.array(data).squeeze()
-        data = np.atleast_1d(data)
+        if batch:
+            data = np.asarray(data)
+        else:
+            data = np.atleast_1d(np.array(data).squeeze())[None, ...]
         with h5py.File(self.fn_hdf5, 'a') as f:
-            try:
-                g = f.create_group(group)
-            except:
-                g = f[group]
-            if name not in g.keys():
-                g.create_dataset(name,
-                                 shape=(0, ) + data.shape,
-                                 maxshape=(None, ) + data.shape,
-                                 dtype=data.dtype,
-                                 chunks=(1, ) + data.shape)
-
-            dset = g[name]
-            dset.resize((dset.shape[0] + 1, ) + data.shape)
-            dset[-1, ...] = data
+            self._append_data(f, data, name, group)
+
+    @staticmethod
+    def _append_data(f, data, name, group):
+        ''' Appends the rows of data to a dataset in the open HDF5 file f '''
+        try:
+            g = f.create_group(group)
+        except:
+            g = f[group]
+        if name not in g.keys():
+            g.create_dataset(name,
+                             shape=(0, ) + data.shape[1:],
+                             maxshape=(None, ) + data.shape[1:],
+                             dtype=data.dtype,
+                             chunks=(1, ) + data.shape[1:])
+
+        dset = g[name]
+        n = dset.shape[0]
+        dset.resize((n + data.shape[0], ) + data.shape[1:])
+        dset[n:, ...] = data
+
+    def _record_samples(self, samples):
+        ''' Writes the data of a batch of samples, as returned by _simulate,
+        opening the HDF5 file once '''
+        with h5py.File(self.fn_hdf5, 'a') as f:
+            for i, (name, group, _) in enumerate(samples[0][1]):
+                data = np.stack([
+                    np.atleast_1d(np.array(s[1][i][2]).squeeze())
+                    for s in samples
+                ])
+                self._append_data(f, data, name, group)
 
     def run_simulation(self, random_vars):
+        ''' Runs a simulation and records the results in the HDF5 file
+
+        Parameters
+        ----------
+        random_vars: list
+            Value of the random variables
+
+        Returns
+        -------
+        qoi: np.ndarray
+            First QOI, flattened
+        '''
+        return self.run_simulations([random_vars])[0]
+
+    def run_simulations(self, random_vars, n_cpus=1):
+        ''' Runs simulations for a batch of random variable values
+
+        With n_cpus > 1 the simulations are run in a pool of processes, which
+        is kept open between calls (see close_pool). The results are written
+        to the HDF5 file by the calling process only, in the order of
+        random_vars, as soon as each simulation finishes.
+
+        Parameters
+        ----------
+        random_vars: np.ndarray
+            Value of the random variables for each simulation (N_samples x N_vars)
+        n_cpus: int (optional)
+            Number of processes. Default: 1
+
+        Returns
+        -------
+        qoi: np.ndarray
+            First QOI of each simulation, flattened (N_samples x N_out)
+        '''
+        random_vars = np.atleast_2d(random_vars)
+        self._prepare_simulations()
+        if n_cpus > 1 and len(random_vars) > 1:
+            samples = self._get_pool(n_cpus).imap(
+                _simulate_global_sampler, list(random_vars))
+        else:
+            samples = (self._simulate(x) for x in random_vars)
+        # Record each sample as it arrives, so that only one sample is kept in
+        # memory at a time
+        qoi = []
+        for sample in samples:
+            self._record_samples([sample])
+            qoi.append(sample[0])
+        return np.vstack(qoi)
+
+    def _get_pool(self, n_cpus):
+        if self._pool is None or self._pool_size != n_cpus:
+            self.close_pool()
+            self._pool = multiprocessing.Pool(
+                processes=n_cpus,
+                initializer=_set_up_global_sampler,
+                initargs=(self,))
+            self._pool_size = n_cpus
+        return self._pool
+
+    def close_pool(self):
+        ''' Closes the pool of processes opened by run_simulations '''
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+            self._pool_size = 0
+
+    def _prepare_simulations(self):
+        ''' Quantities shared by all simulations, set-up before they run '''
+        pass
+
+    def _simulate(self, random_vars):
+        ''' Runs a simulation without writing to the HDF5 file
+
+        Returns
+        -------
+        qoi: np.ndarray
+            First QOI, flattened
+        records: list of tuples
+            (name, group, data) of each data set to be recorded
+        '''
         raise NotImplementedError('This method is to be implemented in a subclass!')
 
     def _calc_E(self, v, random_vars, dAdt=None):
@@ -786,6 +903,29 @@ class gPCSampler(object):
             logger.info('Running simulation {0} out of {1}'.format(i + 1, N))
             self.run_simulation(x)
 
+    def run_N_random_simulations_parallel(self, N, n_cpus):
+        ''' Runs N random simulations in a pool of n_cpus processes, see
+        run_simulations '''
+        grid = pygpc.randomgrid(pdftype=self._gpc_vars[1],
+                                gridshape=self._gpc_vars[2],
+                                limits=self._gpc_vars[3],
+                                N=N)
+        logger.info(f'Running {N} simulations in {n_cpus} processes')
+        try:
+            self.run_simulations(grid.coords, n_cpus=n_cpus)
+        finally:
+            self.close_pool()
+
+
+def _set_up_global_sampler(sampler):
+    global global_sampler
+    global_sampler = sampler
+
+
+def _simulate_global_sampler(random_vars):
+    global global_sampler
+    return global_sampler._simulate(random_vars)
+
 
 class TDCSgPCSampler(gPCSampler):
     ''' Object used by pygpc to sample a tDCS problem
@@ -854,12 +994,14 @@ class TDCSgPCSampler(gPCSampler):
             s.mesh, s.poslist, s.fn_hdf5, el_tags, el_currents,
             roi=s.roi)
 
-    def run_simulation(self, random_vars):
+    def _simulate(self, random_vars):
         poslist = self._update_poslist(random_vars)
         cond = poslist.cond2elmdata(self.mesh)
         v = fem.tdcs(
             self.mesh, cond, self.el_currents,
-            self.el_tags, units='mm')
+            self.el_tags, units='mm',
+            solver_options=self.poslist.solver_options,
+            fem_systems=self._fem_systems)
 
 
         self.mesh.nodedata = [v]
@@ -871,19 +1013,20 @@ class TDCSgPCSampler(gPCSampler):
         for qoi_name, qoi_f in self.qoi_function.items():
             qois.append(qoi_f(v_c, random_vars))
 
-        self.record_data_matrix(random_vars, 'random_var_samples', '/')
-        self.record_data_matrix(v.value, 'v_samples', 'mesh/data_matrices')
-        self.record_data_matrix(v_c.value, 'v_samples', 'mesh_roi/data_matrices')
+        records = [
+            ('random_var_samples', '/', random_vars),
+            ('v_samples', 'mesh/data_matrices', v.value),
+            ('v_samples', 'mesh_roi/data_matrices', v_c.value)]
         for qoi_name, qoi_v in zip(self.qoi_function.keys(), qois):
-            self.record_data_matrix(
-                qoi_v, qoi_name + '_samples', 'mesh_roi/data_matrices')
+            records.append(
+                (qoi_name + '_samples', 'mesh_roi/data_matrices', qoi_v))
 
         del cropped
         del cond
         del v
         del v_c
 
-        return np.atleast_1d(qois[0]).reshape(-1)
+        return np.atleast_1d(qois[0]).reshape(-1), records
 
 
 class TMSgPCSampler(gPCSampler):
@@ -956,38 +1099,43 @@ class TMSgPCSampler(gPCSampler):
             s.mesh, s.poslist, s.fn_hdf5, fnamecoil,
             matsimnibs, didt, roi=s.roi)
 
-    def run_simulation(self, random_vars):
+    def _prepare_simulations(self):
+        ''' Calculates dA/dt and writes it to the HDF5 file '''
+        if not self.constant_dAdt:
+            raise NotImplementedError
+        if hasattr(self, 'dAdt') and hasattr(self, 'dAdt_roi'):
+            return
+        tms_coil = TmsCoil.from_file(self.fnamecoil)
+        didt = np.atleast_1d(self.didt)
+        if len(didt) == 1:
+            for stimulator in tms_coil.get_elements_grouped_by_stimulators().keys():
+                stimulator.di_dt = didt
+        else:
+            for stimulator, stimulator_didt in zip(tms_coil.get_elements_grouped_by_stimulators().keys(), didt):
+                stimulator.di_dt = stimulator_didt 
+        dAdt = tms_coil.get_da_dt(self.mesh, self.matsimnibs)
+        if isinstance(dAdt, mesh_io.NodeData):
+            dAdt = dAdt.node_data2elm_data()
+        dAdt.field_name = 'dAdt'
+        dAdt.write_hdf5(self.fn_hdf5, 'mesh/elmdata/')
+        self.dAdt = dAdt
+        self.mesh.elmdata = [dAdt]
+        cropped = self.mesh.crop_mesh(self.roi)
+        dAdt_roi = cropped.elmdata[0]
+        dAdt_roi.write_hdf5(self.fn_hdf5, 'mesh_roi/elmdata/')
+        self.mesh.elmdata = []
+        self.dAdt_roi = dAdt_roi
+
+    def _simulate(self, random_vars):
         poslist = self._update_poslist(random_vars)
         cond = poslist.cond2elmdata(self.mesh)
-        if self.constant_dAdt:
-            try:
-                dAdt = self.dAdt
-                dAdt_roi = self.dAdt_roi
-            except AttributeError:
-                tms_coil = TmsCoil.from_file(self.fnamecoil)
-                didt = np.atleast_1d(self.didt)
-                if len(didt) == 1:
-                    for stimulator in tms_coil.get_elements_grouped_by_stimulators().keys():
-                        stimulator.di_dt = didt
-                else:
-                    for stimulator, stimulator_didt in zip(tms_coil.get_elements_grouped_by_stimulators().keys(), didt):
-                        stimulator.di_dt = stimulator_didt 
-                dAdt = tms_coil.get_da_dt(self.mesh, self.matsimnibs)
-                if isinstance(dAdt, mesh_io.NodeData):
-                    dAdt = dAdt.node_data2elm_data()
-                dAdt.field_name = 'dAdt'
-                dAdt.write_hdf5(self.fn_hdf5, 'mesh/elmdata/')
-                self.dAdt = dAdt
-                self.mesh.elmdata = [dAdt]
-                cropped = self.mesh.crop_mesh(self.roi)
-                dAdt_roi = cropped.elmdata[0]
-                dAdt_roi.write_hdf5(self.fn_hdf5, 'mesh_roi/elmdata/')
-                self.mesh.elmdata = []
-                self.dAdt_roi = dAdt_roi
-        else:
-            raise NotImplementedError
+        dAdt = self.dAdt
+        dAdt_roi = self.dAdt_roi
 
-        v = fem.tms_dadt(self.mesh, cond, dAdt)
+        v = fem.tms_dadt(
+            self.mesh, cond, dAdt,
+            solver_options=self.poslist.solver_options,
+            fem_systems=self._fem_systems)
         self.mesh.nodedata = [v]
         cropped = self.mesh.crop_mesh(self.roi)
         v_c = cropped.nodedata[0]
@@ -997,16 +1145,16 @@ class TMSgPCSampler(gPCSampler):
         for qoi_name, qoi_f in self.qoi_function.items():
             qois.append(qoi_f(v_c, random_vars, dAdt_roi))
 
-        self.record_data_matrix(random_vars, 'random_var_samples', '/')
-        self.record_data_matrix(v.value, 'v_samples', 'mesh/data_matrices')
-        self.record_data_matrix(v_c.value, 'v_samples',
-                                'mesh_roi/data_matrices')
+        records = [
+            ('random_var_samples', '/', random_vars),
+            ('v_samples', 'mesh/data_matrices', v.value),
+            ('v_samples', 'mesh_roi/data_matrices', v_c.value)]
         for qoi_name, qoi_v in zip(self.qoi_function.keys(), qois):
-            self.record_data_matrix(
-                qoi_v, qoi_name + '_samples', 'mesh_roi/data_matrices')
+            records.append(
+                (qoi_name + '_samples', 'mesh_roi/data_matrices', qoi_v))
 
         del cropped
         del cond
         del v
 
-        return np.atleast_1d(qois[0]).reshape(-1)
+        return np.atleast_1d(qois[0]).reshape(-1), records
@@ -17,7 +17,7 @@ import numpy as np
 
 @njit(fastmath=True,parallel=True,nogil=True,cache=True)
 def map_coord_lin(x, coords):
-    ijk = np.floor(coords).astype(np.int16) #add np.floor for better behavior
+    ijk = np.floor(coords).astype(np.int32) #add np.floor for better behavior
     fijk = (coords - ijk)
     n = ijk.shape[0]
     out = empty((n,3), dtype=np.float64)
@@ -77,7 +77,7 @@ def map_coord_lin_trans(x, coords, M1, t, M2):
     coords[:,0] += t[0]
     coords[:,1] += t[1]
     coords[:,2] += t[2]
-    ijk = np.floor(coords).astype(np.int16) #can be speeded up by avoiding np.floor
+    ijk = np.floor(coords).astype(np.int32) #can be speeded up by avoiding np.floor
     fijk = (coords - ijk)
     n = ijk.shape[0]
     out = empty((n,3), dtype=np.float64)
@@ -131,6 +131,68 @@ def map_coord_lin_trans(x, coords, M1, t, M2):
                 )
     return (M2@out.T)
 
+@njit(fastmath=True,nogil=True,cache=True,inline='always')
+def _cubic_weights(f):
+    # Catmull-Rom weights of the 4 samples around a point at fraction f
+    return (((-0.5*f + 1.0)*f - 0.5)*f,
+            (1.5*f - 2.5)*f*f + 1.0,
+            ((-1.5*f + 2.0)*f + 0.5)*f,
+            (0.5*f - 0.5)*f*f)
+
+@njit(fastmath=True,parallel=True,nogil=True,cache=True)
+def map_coord_trans_into(x, coords, M1, t, M2, out, order=1):
+    '''
+    Interpolates the vector field x (3 x nx x ny x nz, float32 or float64) at
+    the points coords (n x 3), which are mapped to voxel coordinates by
+    M1 @ c + t, rotates the result by M2 and writes it into out (n x 3).
+    Unlike map_coord_lin_trans, no temporary arrays of the size of coords
+    are allocated. order=1 is trilinear and order=3 tricubic (Catmull-Rom)
+    interpolation. Tricubic interpolation falls back to trilinear next to
+    the border of the grid. Points outside of the grid are set to zero.
+    '''
+    n = coords.shape[0]
+    bx, by, bz = x.shape[1]-1, x.shape[2]-1, x.shape[3]-1
+    for l in prange(n):
+        ci = M1[0,0]*coords[l,0] + M1[0,1]*coords[l,1] + M1[0,2]*coords[l,2] + t[0]
+        cj = M1[1,0]*coords[l,0] + M1[1,1]*coords[l,1] + M1[1,2]*coords[l,2] + t[1]
+        ck = M1[2,0]*coords[l,0] + M1[2,1]*coords[l,1] + M1[2,2]*coords[l,2] + t[2]
+        v0 = v1 = v2 = 0.0
+        if not (ci >= 0 and cj >= 0 and ck >= 0 and ci <= bx and cj <= by and ck <= bz):
+            out[l,0] = out[l,1] = out[l,2] = 0.0
+            continue
+        i0 = np.int32(np.floor(ci))
+        j0 = np.int32(np.floor(cj))
+        k0 = np.int32(np.floor(ck))
+        fi = ci - i0
+        fj = cj - j0
+        fk = ck - k0
+        if order == 3 and i0 >= 1 and j0 >= 1 and k0 >= 1 and \
+                i0 + 2 <= bx and j0 + 2 <= by and k0 + 2 <= bz:
+            wi = _cubic_weights(fi)
+            wj = _cubic_weights(fj)
+            wk = _cubic_weights(fk)
+            for a in range(4):
+                for b in range(4):
+                    wab = wi[a]*wj[b]
+                    for c in range(4):
+                        w = wab*wk[c]
+                        v0 += w*x[0, i0-1+a, j0-1+b, k0-1+c]
+                        v1 += w*x[1, i0-1+a, j0-1+b, k0-1+c]
+                        v2 += w*x[2, i0-1+a, j0-1+b, k0-1+c]
+        elif i0 + 1 <= bx and j0 + 1 <= by and k0 + 1 <= bz:
+            for a in range(2):
+                wa = fi if a == 1 else 1 - fi
+                for b in range(2):
+                    wab = wa*(fj if b == 1 else 1 - fj)
+                    for c in range(2):
+                        w = wab*(fk if c == 1 else 1 - fk)
+                        v0 += w*x[0, i0+a, j0+b, k0+c]
+                        v1 += w*x[1, i0+a, j0+b, k0+c]
+                        v2 += w*x[2, i0+a, j0+b, k0+c]
+        out[l,0] = M2[0,0]*v0 + M2[0,1]*v1 + M2[0,2]*v2
+        out[l,1] = M2[1,0]*v0 + M2[1,1]*v1 + M2[1,2]*v2
+        out[l,2] = M2[2,0]*v0 + M2[2,1]*v1 + M2[2,2]*v2
+
 @njit(parallel=True,fastmath=True,nogil=True,cache=True)
 def sumf(x, y, z):
     for j in prange(x.shape[1]):
@@ -187,6 +249,37 @@ def postp_mag(g, v, dadt, idx1, idx2):#, A, iA, jA, out2):
         out2[i,0] = sqrt(out2[i,0])
     return out2
 
+@njit(parallel=True,fastmath=True,nogil=True,cache=True)
+def postp_block(g, v, dadt, idx1):
+    # v: (n_nodes, n_sim), dadt: (n_elm, 3, n_sim) at the elements in g
+    out = empty((g.shape[0], v.shape[1], g.shape[2]), dtype=v.dtype)
+    for i in prange(g.shape[0]):
+        for l in range(v.shape[1]):
+            for k in range(g.shape[2]):
+                out[i,l,k] = -dadt[i,k,l]
+            for j in range(g.shape[1]):
+                vv = -1000.0 * v[idx1[i,j],l]
+                for k in range(g.shape[2]):
+                    out[i,l,k] += g[i,j,k] * vv
+    return out
+
+@njit(parallel=True,fastmath=True,nogil=True,cache=True)
+def postp_mag_block(g, v, dadt, idx1):
+    out = zeros((g.shape[0], v.shape[1], 1), dtype=v.dtype)
+    for i in prange(g.shape[0]):
+        e = empty(g.shape[2], dtype=v.dtype)
+        for l in range(v.shape[1]):
+            for k in range(g.shape[2]):
+                e[k] = -dadt[i,k,l]
+            for j in range(g.shape[1]):
+                vv = -1000.0 * v[idx1[i,j],l]
+                for k in range(g.shape[2]):
+                    e[k] += g[i,j,k] * vv
+            for k in range(g.shape[2]):
+                out[i,l,0] += e[k]**2
+            out[i,l,0] = sqrt(out[i,l,0])
+    return out
+
 # parallel sparse matrix multiplication, note that the array is incremented
 # multiple runs will there sum up not reseting the array in-between
 @njit(parallel=True,fastmath=True,nogil=True,cache=True)
@@ -16,7 +16,7 @@ from simnibs.utils import simnibs_logger
 from simnibs.utils.simnibs_logger import logger
 from simnibs.utils.file_finder import Templates, SubjectFiles
 
-from .fem import get_dirichlet_node_index_cog, TDCSFEMNeumann, TMSFEM
+from .fem import get_dirichlet_node_index_cog, TDCSFEMNeumann, TMSFEM, _rhs_blocks
 from .sim_struct import SimuList
 
 # TODO: import here as numba interacts badly with pyqt (GUI). remove comment
@@ -206,7 +206,7 @@ class OnlineFEM:
         raise ValueError(f"log_fn {log_fn}: has to be string or bool")
 
     def update_field(self, electrode=None, matsimnibs=None, didt=1e6, fn_electrode_txt=None,
-                     dirichlet_correction=False):
+                     dirichlet_correction=False, block_size=16, set_coil_state=None):
         """
         Calculating and updating electric field for given coil position (matsimnibs) for TMS or electrode position (TES)
 
@@ -227,6 +227,12 @@ class OnlineFEM:
             Note: Will be only used if dirichlet_correction == True
         dirichlet_correction : bool, optional, default: False
             Apply iterative Dirichlet correction to ensure same voltage over the whole electrode when solving.
+        block_size : int, optional, default: 16
+            TMS only: number of coil positions whose right-hand sides are assembled and solved together
+            and whose fields are evaluated together in the ROIs. Use 1 to solve the positions one by one.
+        set_coil_state : callable, optional, default: None
+            TMS only: function called with the index of each simulation before its right-hand side is assembled.
+            Can be used to change the coil (e.g. its deformations) between the simulations of a block.
 
         Returns
         -------
@@ -246,6 +252,11 @@ class OnlineFEM:
 
         self.e = [[0 for _ in range(self.n_roi)] for _ in range(n_sim)]
 
+        if self.method == "TMS" and n_sim > 1 and block_size > 1:
+            self._update_field_tms_blocks(matsimnibs=matsimnibs, didt=didt, block_size=block_size,
+                                          set_coil_state=set_coil_state)
+            return self.e
+
         # loop over simulation conditions (multiple coil positions or separate electrode configurations)
         for i_sim in range(n_sim):
             start = time.time()
@@ -253,6 +264,8 @@ class OnlineFEM:
             # determine RHS
             ############################################################################################################
             if self.method == "TMS":
+                if set_coil_state is not None:
+                    set_coil_state(i_sim)
                 self.b = self.set_rhs(matsimnibs=matsimnibs[:, :, i_sim])
 
             elif self.method == "TES":
@@ -286,6 +299,64 @@ class OnlineFEM:
 
         return self.e
 
+    def _update_field_tms_blocks(self, matsimnibs, didt, block_size, set_coil_state=None):
+        """
+        Calculating and updating the TMS electric field for many coil positions. The dA/dt fields of each
+        block of positions are calculated together (unless set_coil_state changes the coil between them),
+        the right-hand sides are solved in a single call and the fields in the ROIs are evaluated together.
+
+        Parameters
+        ----------
+        matsimnibs : np.array of float [4 x 4 x n_sim]
+            Tensor containing the coil positions and orientations in SimNIBS space for multiple simulations.
+        didt : float
+            Rate of change of coil current (A/s) (e.g. 1 A/us = 1e6 A/s)
+        block_size : int
+            Number of coil positions in each block
+        set_coil_state : callable, optional, default: None
+            Function called with the index of each simulation before its right-hand side is assembled
+        """
+        n_sim = matsimnibs.shape[2]
+
+        for block in _rhs_blocks(n_sim, self.mesh.nodes.nr, block_size):
+            start = time.time()
+
+            # determine RHS and keep dA/dt only in the tetrahedra needed by the ROIs
+            ############################################################################################################
+            b = []
+            dadt_roi = [np.empty((len(r.idx), 3, len(block))) for r in self.roi]
+            if set_coil_state is None:
+                da_dt = self.coil.get_da_dt_batch(self.coordinates.T,
+                                                  np.moveaxis(matsimnibs[:, :, list(block)], 2, 0))
+            for j, i_sim in enumerate(block):
+                if set_coil_state is None:
+                    b.append(self._set_rhs_tms(da_dt[j]))
+                else:
+                    set_coil_state(i_sim)
+                    b.append(self.set_rhs(matsimnibs=matsimnibs[:, :, i_sim]))
+                for i_roi, r in enumerate(self.roi):
+                    dadt_roi[i_roi][:, :, j] = self.dadt[r.idx]
+            b = np.stack(b, axis=1)
+
+            # solve for potential
+            ############################################################################################################
+            v = self.solve(b=b).reshape(-1, len(block))
+
+            # calculate e-field
+            ############################################################################################################
+            for i_roi, r in enumerate(self.roi):
+                e = r.calc_fields_block(v=v, dadt=dadt_roi[i_roi], dataType=self.dataType[i_roi])
+                for j, i_sim in enumerate(block):
+                    self.e[i_sim][i_roi] = e[j] * didt
+
+            self.b = b[:, -1]
+            self.v = v[:, -1]
+
+            stop = time.time()
+
+            if self._logging:
+                logger.info(f"Finished simulations #{block[0] + 1}-{block[-1] + 1}/{n_sim} (time: {(stop-start):.3f}s).")
+
     def set_rhs(self, electrode=None, matsimnibs=None):
         """
         Set up right hand side (force vector) of equation system.
@@ -302,14 +373,11 @@ class OnlineFEM:
         b : np.array of float [n_nodes - 1]
             Right hand side of equation system (without Dirichlet node)
         """
-        # TODO: import here as numba interacts badly with pyqt (GUI). remove
-        # here once this is resolved.
-        from simnibs.simulation.numba_fem_utils import sumf2, node2elmf, sumf3
-
         if self.method == "TES":
             # gather electrode currents and associated node indices
             electrodes = []
             currents = []
+            weigh_by_area = self.fem.weigh_by_area
             for _electrode_array in electrode._electrode_arrays:
                 for _ele in _electrode_array.electrodes:
                     if _ele.node_current is not None:
@@ -320,32 +388,56 @@ class OnlineFEM:
                         self.fem.weigh_by_area = True
                     electrodes.append(_ele.node_idx + 1)
 
-            b = self.fem.assemble_rhs(electrodes=electrodes,       # list of node indices of electrodes
-                                      currents=currents)           # list of electrode currents
+            try:
+                b = self.fem.assemble_rhs(electrodes=electrodes,       # list of node indices of electrodes
+                                          currents=currents)           # list of electrode currents
+            finally:
+                self.fem.weigh_by_area = weigh_by_area
 
         elif self.method == "TMS":
             # determine magnetic vector potential
-            if self.useElements:
-                self.dadt = self.coil.get_da_dt_at_coordinates(self.coordinates.T, matsimnibs)
-            else:
-                da_dt = self.coil.get_da_dt_at_coordinates(self.coordinates.T, matsimnibs).T
-                #self.dadt = NodeData(da_dt, mesh=self.mesh).node_data2elm_data()[:]
+            b = self._set_rhs_tms(self.coil.get_da_dt_at_coordinates(self.coordinates.T, matsimnibs))
 
-                self.dadt = node2elmf(da_dt, self.reshaped_node_numbersT)
+        else:
+            raise NotImplementedError("Simulation method not implemented yet. Method is either 'TMS' or 'TES'.")
 
-            #reshaped_node_numbers=self.reshaped_node_numbersT,
-            #useElements=self.useElements
+        return b
 
-            # isotropic
-            if self.cond.ndim == 1:
-                b = sumf2(x=self.force_integrals, y=self.dadt, w=self.reshaped_node_numbers)
+    def _set_rhs_tms(self, da_dt):
+        """
+        Set up the TMS right hand side from the dA/dt field of the coil and store the dA/dt field
+        in the elements in self.dadt.
 
-            # anisotropic
-            elif self.cond.ndim == 3:
-                b = sumf3(v=self.volume, dadt=self.dadt, g=self.gradient, nn=(self.node_numbers-1).reshape(-1), c=self.cond)
+        Parameters
+        ----------
+        da_dt : np.array of float [n_coordinates x 3]
+            dA/dt field at the element centers (useElements) or at the nodes
 
+        Returns
+        -------
+        b : np.array of float [n_nodes - 1]
+            Right hand side of equation system (without Dirichlet node)
+        """
+        # TODO: import here as numba interacts badly with pyqt (GUI). remove
+        # here once this is resolved.
+        from simnibs.simulation.numba_fem_utils import sumf2, node2elmf, sumf3
+
+        if self.useElements:
+            self.dadt = da_dt
         else:
-            raise NotImplementedError("Simulation method not implemented yet. Method is either 'TMS' or 'TES'.")
+            #self.dadt = NodeData(da_dt, mesh=self.mesh).node_data2elm_data()[:]
+            self.dadt = node2elmf(da_dt.T, self.reshaped_node_numbersT)
+
+        #reshaped_node_numbers=self.reshaped_node_numbersT,
+        #useElements=self.useElements
+
+        # isotropic
+        if self.cond.ndim == 1:
+            b = sumf2(x=self.force_integrals, y=self.dadt, w=self.reshaped_node_numbers)
+
+        # anisotropic
+        elif self.cond.ndim == 3:
+            b = sumf3(v=self.volume, dadt=self.dadt, g=self.gradient, nn=(self.node_numbers-1).reshape(-1), c=self.cond)
 
         return b
 
@@ -443,9 +535,6 @@ class OnlineFEM:
 
         n_nodes_total = electrode._node_current.shape[0]
 
-        # update rhs
-        b = self.set_rhs(electrode=electrode)
-
         th_maxrelerr = 0.02
         th_wrong_current_sign = 0.02
 
@@ -498,6 +587,105 @@ class OnlineFEM:
                 # mean current over electrodes [n_channel]
                 I_mean[i_channel] = electrode._current_mean[i_channel]
 
+        if electrode.dirichlet_correction_detailed:
+            I, v, j = self._dirichlet_correction_iterative(
+                electrode, I, I_mean, n_nodes_total, th_maxrelerr, th_wrong_current_sign, maxiter)
+        else:
+            try:
+                I, v = self._dirichlet_correction_direct(electrode, I_mean)
+                self._set_electrode_currents(electrode, I)
+                j = 1
+            except np.linalg.LinAlgError:
+                if self._logging:
+                    logger.warning("Could not solve for the electrode currents directly, iterating instead")
+                I, v, j = self._dirichlet_correction_iterative(
+                    electrode, I, I_mean, n_nodes_total, th_maxrelerr, th_wrong_current_sign, maxiter)
+
+        # final number of iterations to determine optimal currents
+        self.n_iter_dirichlet_correction = j
+
+        masks_sign = [(np.sign(I[i_channel]) == I_sign[i_channel]) for i_channel in range(n_channel)]
+
+        # test if signs are correct return no solution
+        if not np.array([(masks_sign[i_channel]).all() for i_channel in range(n_channel)]).all():
+            masks_sign_not = copy.copy(masks_sign)
+            masks_sign_not[0] = np.logical_not(masks_sign[0])
+            masks_sign_not[1] = np.logical_not(masks_sign[1])
+
+            # ensure correct sign
+            I = [np.abs(I[i_channel]) * I_sign[i_channel] for i_channel in range(n_channel)]
+
+            # normalize currents again to match maximal channel current (we flipped currents before)
+            I = [I[i_channel] / np.sum(np.abs(I[i_channel])) * np.abs(I_total[i_channel]) for i_channel in range(n_channel)]
+
+            # write final currents in electrode
+            self._set_electrode_currents(electrode, I)
+
+            # apply current outlier correction
+            if electrode.current_outlier_correction:
+                electrode.apply_current_outlier_correction()
+
+            # update rhs
+            b = self.set_rhs(electrode=electrode)
+
+            # solve
+            v = self.solve(b)
+            v_nodes = v[electrode._node_idx]
+
+            # normalize
+            _v_norm, _ = self.normalize_solution(v_nodes=v_nodes,
+                                                 channel_id=electrode._node_channel_id,
+                                                 ele_id=electrode._node_ele_id,
+                                                 node_area=electrode._node_area,
+                                                 currents=I,
+                                                 electrode=electrode)
+
+            # final error
+            maxrelerr = np.max([np.max(np.abs(_v_norm[i_channel])) for i_channel in range(n_channel)])
+
+            if self._logging:
+                logger.debug(f"Correcting current signs (pos: {np.sum(masks_sign_not[0])}/{len(masks_sign_not[0])}, "
+                      f"neg: {np.sum(masks_sign_not[1])}/{len(masks_sign_not[1])}), final maxrelerr: {maxrelerr:3f}")
+
+        # add optimal currents to CurrentEstimator (training data) to improve estimation in further iterations
+        # this is done electrode wise and not node wise because the number of nodes changes depending on the
+        # electrode position
+        if electrode._current_estimator is not None:
+            electrode_pos = [_electrode_array.electrode_pos for _electrode_array in electrode._electrode_arrays]
+
+            I_ele = []
+            for i_channel, _channel_id in enumerate(electrode._channel_id_unique):
+                I_ele.append([])
+                for i_ele, _ele_id in enumerate(np.unique(electrode._node_ele_id[electrode._node_channel_id == _channel_id])):
+                    mask = (electrode._node_channel_id == _channel_id) * (electrode._node_ele_id == _ele_id)
+                    I_ele.append(np.sum(electrode._node_current[mask] * electrode._node_area[mask] / np.sum(electrode._node_area[mask])))
+
+            electrode._current_estimator.add_training_data(electrode_pos=np.hstack(electrode_pos),
+                                                           current=np.hstack(I_ele))
+
+        if fn_electrode_txt is not None:
+            np.savetxt(fn_electrode_txt, np.hstack((electrode._node_coords, electrode._node_current[:, np.newaxis])))
+
+        return np.squeeze(v)
+
+    def _dirichlet_correction_iterative(self, electrode, I, I_mean, n_nodes_total, th_maxrelerr,
+                                        th_wrong_current_sign, maxiter):
+        """
+        Corrects the input currents iteratively (secant steps) until the electrodes with the same channel ID
+        have the same potential.
+
+        Returns
+        -------
+        I : list of np.ndarray of float [n_channel][n_ele or n_nodes_channel]
+            Corrected currents
+        v : np.array of float [n_nodes]
+            Solution for the corrected currents
+        j : int
+            Number of iterations
+        """
+        n_channel = electrode._n_channel
+        b = self.set_rhs(electrode=electrode)
+
         # Solve iteratively until maxrelerr is reached
         # Iteration: 0
 
@@ -597,18 +785,7 @@ class OnlineFEM:
             # print(f"sum current: sum(I[0]) = {np.sum(I[0])}   sum(I[1]) = {np.sum(I[1])}")
 
             # write currents in electrodes
-            for i_channel, _channel_id in enumerate(electrode._channel_id_unique):
-                if electrode.dirichlet_correction_detailed:
-                    # write nodal current
-                    electrode._node_current[electrode._node_channel_id == _channel_id] = I[i_channel]
-                else:
-                    # calculate nodal current from total electrode current
-                    for i_ele, _ele_id in enumerate(np.unique(electrode._node_ele_id[electrode._node_channel_id == _channel_id])):
-                        mask = (electrode._node_channel_id == _channel_id) * (electrode._node_ele_id == _ele_id)
-                        electrode._node_current[mask] = I[i_channel][i_ele] * electrode._node_area[mask] / np.sum(electrode._node_area[mask])
-
-            # update electrodes from node arrays
-            electrode.update_electrode_from_node_arrays()
+            self._set_electrode_currents(electrode, I)
 
             # update rhs
             b = self.set_rhs(electrode=electrode)
@@ -633,111 +810,121 @@ class OnlineFEM:
             # update error
             maxrelerr = np.max([np.max(np.abs(v_norm[i_channel][-1])) for i_channel in range(n_channel)])
 
-        # final number of iterations to determine optimal currents
-        self.n_iter_dirichlet_correction = j
-
-        masks_sign = [(np.sign(I[i_channel]) == I_sign[i_channel]) for i_channel in range(n_channel)]
-
-        # test if signs are correct return no solution
-        if not np.array([(masks_sign[i_channel]).all() for i_channel in range(n_channel)]).all():
-            masks_sign_not = copy.copy(masks_sign)
-            masks_sign_not[0] = np.logical_not(masks_sign[0])
-            masks_sign_not[1] = np.logical_not(masks_sign[1])
-
-            # ensure correct sign
-            I = [np.abs(I[i_channel]) * I_sign[i_channel] for i_channel in range(n_channel)]
-
-            # normalize currents again to match maximal channel current (we flipped currents before)
-            I = [I[i_channel] / np.sum(np.abs(I[i_channel])) * np.abs(I_total[i_channel]) for i_channel in range(n_channel)]
-
-            # write final currents in electrode
-            for i_channel, _channel_id in enumerate(electrode._channel_id_unique):
-                if electrode.dirichlet_correction_detailed:
-                    # write nodal current
-                    electrode._node_current[electrode._node_channel_id == _channel_id] = I[i_channel]
-                else:
-                    # calculate nodal current from total electrode current
-                    for i_ele, _ele_id in enumerate(
-                            np.unique(electrode._node_ele_id[electrode._node_channel_id == _channel_id])):
-                        mask = (electrode._node_channel_id == _channel_id) * (electrode._node_ele_id == _ele_id)
-                        electrode._node_current[mask] = I[i_channel][i_ele] * electrode._node_area[mask] / np.sum(
-                            electrode._node_area[mask])
-
-            # update electrodes from node arrays
-            electrode.update_electrode_from_node_arrays()
-
-            # apply current outlier correction
-            if electrode.current_outlier_correction:
-                electrode.apply_current_outlier_correction()
+        return I, v, j
 
-            # update rhs
-            b = self.set_rhs(electrode=electrode)
+    def _dirichlet_correction_direct(self, electrode, I_mean):
+        """
+        Determines the electrode currents such that the electrodes with the same channel ID have the same
+        potential. The (area weighted) electrode potentials depend linearly on the electrode currents, so
+        the responses to a unit current in each electrode are solved as one block and the currents are
+        found from a small dense system:
 
-            # solve
-            v = self.solve(b)
-            v_nodes = v[electrode._node_idx]
+            P @ I - S @ V = 0        (electrode potentials equal the channel potentials V)
+            S.T @ I = I_channel      (prescribed total channel currents)
 
-            # normalize
-            _v_norm, _ = self.normalize_solution(v_nodes=v_nodes,
-                                                 channel_id=electrode._node_channel_id,
-                                                 ele_id=electrode._node_ele_id,
-                                                 node_area=electrode._node_area,
-                                                 currents=I,
-                                                 electrode=electrode)
-
-            # final error
-            maxrelerr = np.max([np.max(np.abs(_v_norm[i_channel])) for i_channel in range(n_channel)])
+        Parameters
+        ----------
+        electrode : CircularArray or ElectrodeArrayPair instance
+            Electrode
+        I_mean : np.ndarray of float [n_channel]
+            Mean current per electrode in each channel
 
-            if self._logging:
-                logger.debug(f"Correcting current signs (pos: {np.sum(masks_sign_not[0])}/{len(masks_sign_not[0])}, "
-                      f"neg: {np.sum(masks_sign_not[1])}/{len(masks_sign_not[1])}), final maxrelerr: {maxrelerr:3f}")
+        Returns
+        -------
+        I : list of np.ndarray of float [n_channel][n_ele]
+            Corrected electrode currents
+        v : np.array of float [n_nodes]
+            Solution for the corrected currents
+        """
+        masks = []
+        channel = []
+        for i_channel, _channel_id in enumerate(electrode._channel_id_unique):
+            channel_mask = electrode._node_channel_id == _channel_id
+            for _ele_id in np.unique(electrode._node_ele_id[channel_mask]):
+                masks.append(channel_mask * (electrode._node_ele_id == _ele_id))
+                channel.append(i_channel)
+        channel = np.array(channel)
+        n_ele = len(masks)
+        n_channel = electrode._n_channel
 
-        # add optimal currents to CurrentEstimator (training data) to improve estimation in further iterations
-        # this is done electrode wise and not node wise because the number of nodes changes depending on the
-        # electrode position
-        if electrode._current_estimator is not None:
-            electrode_pos = [_electrode_array.electrode_pos for _electrode_array in electrode._electrode_arrays]
+        # unit current in each electrode, distributed by node area
+        weigh_by_area = self.fem.weigh_by_area
+        self.fem.weigh_by_area = False
+        try:
+            b = np.stack([
+                self.fem.assemble_rhs(
+                    electrodes=[electrode._node_idx[mask] + 1],
+                    currents=[electrode._node_area[mask] / np.sum(electrode._node_area[mask])])
+                for mask in masks], axis=1)
+        finally:
+            self.fem.weigh_by_area = weigh_by_area
+        u = self.solve(b).reshape(-1, n_ele)
+
+        # area weighted potential of each electrode for the unit currents
+        P = np.empty((n_ele, n_ele))
+        for k, mask in enumerate(masks):
+            area = electrode._node_area[mask]
+            P[k] = area @ u[electrode._node_idx[mask]] / np.sum(area)
+
+        S = np.zeros((n_ele, n_channel))
+        S[np.arange(n_ele), channel] = 1
+        M = np.block([[P, -S], [S.T, np.zeros((n_channel, n_channel))]])
+        rhs = np.zeros(n_ele + n_channel)
+        rhs[n_ele:] = I_mean * np.bincount(channel, minlength=n_channel)
+        I_ele = np.linalg.solve(M, rhs)[:n_ele]
+
+        I = [I_ele[channel == i_channel] for i_channel in range(n_channel)]
+        return I, u @ I_ele
+
+    def _set_electrode_currents(self, electrode, I):
+        """
+        Writes the channel currents in the electrode (nodal or electrode currents distributed by node area)
 
-            I_ele = []
-            for i_channel, _channel_id in enumerate(electrode._channel_id_unique):
-                I_ele.append([])
+        Parameters
+        ----------
+        electrode : CircularArray or ElectrodeArrayPair instance
+            Electrode
+        I : list of np.ndarray of float [n_channel][n_ele or n_nodes_channel]
+            Currents
+        """
+        for i_channel, _channel_id in enumerate(electrode._channel_id_unique):
+            if electrode.dirichlet_correction_detailed:
+                # write nodal current
+                electrode._node_current[electrode._node_channel_id == _channel_id] = I[i_channel]
+            else:
+                # calculate nodal current from total electrode current
                 for i_ele, _ele_id in enumerate(np.unique(electrode._node_ele_id[electrode._node_channel_id == _channel_id])):
                     mask = (electrode._node_channel_id == _channel_id) * (electrode._node_ele_id == _ele_id)
-                    I_ele.append(np.sum(electrode._node_current[mask] * electrode._node_area[mask] / np.sum(electrode._node_area[mask])))
+                    electrode._node_current[mask] = I[i_channel][i_ele] * electrode._node_area[mask] / np.sum(electrode._node_area[mask])
 
-            electrode._current_estimator.add_training_data(electrode_pos=np.hstack(electrode_pos),
-                                                           current=np.hstack(I_ele))
-
-        if fn_electrode_txt is not None:
-            np.savetxt(fn_electrode_txt, np.hstack((electrode._node_coords, electrode._node_current[:, np.newaxis])))
+        # update electrodes from node arrays
+        electrode.update_electrode_from_node_arrays()
 
-        return np.squeeze(v)
-
-    def solve(self, b):
+    def solve(self, b, out=None):
         """
         Solve system of equations Ax=b and add Dirichlet node (V=0) to solution.
 
         Parameters
         ----------
-        b : np.array of float [n_nodes]
-            Right hand side of equation system (with Dirichlet node)
+        b : np.array of float [n_nodes] or [n_nodes x n_sim]
+            Right hand side(s) of equation system (with Dirichlet node)
+        out : np.array of float [n_nodes] or [n_nodes x n_sim], optional, default: None
+            Pre-allocated array where the solution is written. If None, a new array is created.
 
         Returns
         -------
-        v : np.array of float [n_nodes]
+        v : np.array of float [n_nodes] or [n_nodes x n_sim]
             Solution (including the Dirichlet node at the right position)
         """
+        b = np.asarray(b)
+        if out is None:
+            out = np.empty(b.shape, dtype=float)
 
-        # remove dirichlet node
-        b_reduced = np.delete(b, self.dirichlet_node-1)
+        # the FEM system removes the Dirichlet node and sets it to 0 in the solution
+        # using index maps computed when preparing the solver
+        self.fem.solve_into(b, out)
 
-        # solve equation system
-        x = self.solver.solve(b_reduced)
-
-        # add Dirichlet node to solution
-        v = np.insert(x, self.dirichlet_node-1, 0)
-
-        return np.squeeze(v)
+        return np.squeeze(out)
 
     def _set_matrices_and_prepare_solver(self):
         """
@@ -1173,6 +1360,56 @@ class FemTargetPointCloud:
 
         return e
 
+    def calc_fields_block(self, v, dadt=None, dataType=0):
+        """
+        Calculate electric field on target points for several simulations at once
+
+        Parameters
+        ----------
+        v : np.ndarray of float [n_nodes_total x n_sim]
+            Electric potential in each node in the whole head model for each simulation
+        dadt : np.ndarray of float [n_idx x 3 x n_sim], optional, default: None
+            Magnetic vector potential in the tetrahedra self.idx for each simulation (for TMS)
+        dataType : int, optional, default: 0
+            Return magnitude of electric field (dataType = 0) otherwise return x, y, z components
+
+        Returns
+        -------
+        e : np.ndarray of float [n_sim x n_center x 1] or [n_sim x n_center x 3]
+            Electric field in the target positions for each simulation
+        """
+        # TODO: import here as numba interacts badly with pyqt (GUI). remove
+        # here once this is resolved.
+        from simnibs.simulation.numba_fem_utils import postp_block, postp_mag_block, spmatmul
+
+        v = np.ascontiguousarray(v, dtype=float)
+        n_sim = v.shape[1]
+        if dadt is None:
+            dadt = np.zeros((len(self.idx), 3, n_sim))
+        dadt = np.ascontiguousarray(dadt, dtype=float)
+
+        # get the E field in the tetrahedra (n_idx x n_sim x n_components)
+        ################################################################################################################
+        if dataType == 0:
+            fields = postp_mag_block(self.gradient, v, dadt, self.node_index_list)
+        else:
+            fields = postp_block(self.gradient, v, dadt, self.node_index_list)
+        n_comp = fields.shape[2]
+
+        # Calculate field in ROI
+        ################################################################################################################
+        if self.sF is not None:
+            # interpolate all simulations with a single pass over the sF matrix
+            e = np.zeros((self.n_center, n_sim * n_comp))
+            spmatmul(self.sF.data, self.sF.indptr, self.sF.indices, fields.reshape(fields.shape[0], -1), e)
+            e = e.reshape(self.n_center, n_sim, n_comp)
+        else:
+            e = fields
+            if not self.fill_nearest and self.any_outside:
+                e[~self.inside] = 0
+
+        return np.ascontiguousarray(e.transpose(1, 0, 2))
+
     def _get_sF_matrix(self, msh, center, fill_nearest, tags=None):
         """
         Create a sparse matrix for SPR interpolation from element data to arbitrary positions (here: the surface nodes)
@@ -79,8 +79,16 @@ class Solver:
     mtype (optional): int
         Type of matrix. Please see
         https://software.intel.com/en-us/mkl-developer-reference-fortran-pardiso
+    perm (optional): ndarray of int
+        Fill-reducing permutation to be used instead of computing one (iparm[4]=1),
+        for example from a previous factorization of a matrix with the same
+        sparsity pattern
+    compute_perm (optional): bool
+        Whether to return the fill-reducing permutation computed during the
+        factorization in the attribute `perm` (iparm[4]=2). Ignored if perm is set.
     """
-    def __init__(self, A, mtype=2, isSymmetric=True, log_level=20):
+    def __init__(self, A, mtype=2, isSymmetric=True, log_level=20, perm=None,
+                 compute_perm=False):
 
         self._libmkl = get_libmkl()
         self._mkl_pardiso = self._libmkl.pardiso
@@ -97,14 +105,47 @@ class Solver:
         self._perm = np.zeros(0, dtype=np.int32)
 
         self._mtype = mtype
+        self._isSymmetric = isSymmetric
         self._msglvl = False
         self._solve_transposed = False
 
-        if isSymmetric:
+        if perm is not None:
+            self._set_default_iparm()
+            self._iparm[4] = 1
+            self._perm = np.ascontiguousarray(perm, dtype=np.int32)
+        elif compute_perm:
+            self._set_default_iparm()
+            self._iparm[4] = 2
+            self._perm = np.zeros(A.shape[0], dtype=np.int32)
+
+        self._factorize(self._prepare_A(A))
+
+    def _prepare_A(self, A):
+        if self._isSymmetric:
             # get the upper triangular part of the A matrix
-            self._factorize(sp.triu(A).tocsr())
+            return sp.triu(A).tocsr()
         else:
-            self._factorize(A.tocsr())
+            return A.tocsr()
+
+    def _set_default_iparm(self):
+        """ Sets the default iparm values explicitly. Needed when any of the
+        iparm values is changed, as iparm[0] = 0 resets all of them
+        """
+        self._iparm[0] = 1  # do not use the default values
+        self._iparm[1] = 2  # METIS fill-in reducing ordering
+        self._iparm[9] = 13 if self._mtype == 11 else 8  # pivoting perturbation
+        self._iparm[10] = 1 if self._mtype == 11 else 0  # scaling
+        self._iparm[12] = 1 if self._mtype == 11 else 0  # weighted matching
+        self._iparm[17] = -1  # report number of non-zeros in the factors
+        self._iparm[20] = 1  # Bunch-Kaufman pivoting
+
+    @property
+    def perm(self):
+        """ Fill-reducing permutation used in the factorization, if it was
+        given or computed (see compute_perm). Otherwise None """
+        if self._iparm[4] in (1, 2):
+            return self._perm
+        return None
 
     def _factorize(self, A):
         """
@@ -125,6 +166,33 @@ class Solver:
         self._call_pardiso(b, 12)     
         logger.log(self.log_level, f'{time.time()-start:.2f} seconds to factorize matrix')
 
+    def refactorize(self, A):
+        """
+        Numerical factorization of a new matrix A (phase 22). The fill-reducing
+        ordering and the symbolic factorization of the previous matrix are
+        re-used, so A must have the same sparsity pattern. Otherwise, a full
+        factorization is done.
+
+        Parameters
+        -------------
+        A: scipy.sparse csr or csc
+            Spase square matrix
+        """
+        A = self._prepare_A(A)
+        self._check_A(A)
+        if (A.shape != self._A.shape or
+                not np.array_equal(A.indptr, self._A.indptr) or
+                not np.array_equal(A.indices, self._A.indices)):
+            logger.debug('Sparsity pattern changed, running a full factorization')
+            self._factorize(A)
+            return
+        self._A = A.copy()
+        logger.log(self.log_level, 'Refactorizing matrix using MKL PARDISO')
+        start = time.time()
+        b = np.zeros((A.shape[0], 1))
+        self._call_pardiso(b, 22)
+        logger.log(self.log_level, f'{time.time()-start:.2f} seconds to refactorize matrix')
+
     def solve(self, b):
         """ solve Ax=b for x
 
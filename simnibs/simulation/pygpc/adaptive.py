@@ -170,7 +170,8 @@ def run_reg_adaptive_grid(pdftype, pdfshape, limits, func, args=(),
                           data_poly_ratio=2, max_iter=1000,
                           order_max=None, interaction_max=None,
                           eps=1E-3, regularization_factors=np.logspace(-5, 3, 9),
-                          min_iter=0, n_cpus=1, print_function=None):
+                          min_iter=0, n_cpus=1, print_function=None,
+                          vectorized=False):
     """  
     Adaptive regression approach based on leave one out cross validation error
     estimation
@@ -211,6 +212,11 @@ def run_reg_adaptive_grid(pdftype, pdfshape, limits, func, args=(),
         Number of cpus to evaluate "func". Default: 1
     print_function : function
         A function to print convergence information. Default: Does not print
+    vectorized: bool, optional
+        If True, "func" is called once per iteration with all new grid points
+        (func(X, *args), X of size [N_new x DIM]) and returns the function
+        values [N_new x N_out]. "func" is then responsible for using n_cpus.
+        Default: False
 
     Returns
     -------
@@ -235,7 +241,7 @@ def run_reg_adaptive_grid(pdftype, pdfshape, limits, func, args=(),
     if interaction_max is None:
         interaction_max = DIM
 
-    if n_cpus > 1:
+    if n_cpus > 1 and not vectorized:
         pool = multiprocessing.Pool(processes=n_cpus)
 
     while i_iter < max_iter:
@@ -267,8 +273,20 @@ def run_reg_adaptive_grid(pdftype, pdfshape, limits, func, args=(),
         regobj.add_n_sampling_points(n)
 
         # run repeated simulations
+        # Vectorized version
+        if vectorized:
+            if regobj.grid.coords.shape[0] > i_samples:
+                if print_function:
+                    print_function("Performing simulations #{} to #{}".format(
+                        i_samples + 1, regobj.grid.coords.shape[0]))
+                res = np.atleast_2d(func(regobj.grid.coords[i_samples:, :], *args))
+                if i_samples == 0:
+                    RES = res
+                else:
+                    RES = np.vstack([RES, res])
+            s = regobj.grid.coords.shape[0] - 1
         # MP version
-        if n_cpus > 1:
+        elif n_cpus > 1:
             processes = []
             for s in range(i_samples, regobj.grid.coords.shape[0]):
                 if print_function:
@@ -309,7 +327,7 @@ def run_reg_adaptive_grid(pdftype, pdfshape, limits, func, args=(),
     if i_iter >= max_iter:
         raise ValueError('Maximum number of iterations reached')
 
-    if n_cpus > 1:
+    if n_cpus > 1 and not vectorized:
         pool.close()
         pool.join()
 
@@ -141,3 +141,15 @@ class TestAdaptive:
                 data_poly_ratio=2)
         assert reg.construct_gpc_matrix().shape == (8,4)
 
+    def test_adaptive_expand_vectorized(self,  uniform_dist):
+        np.random.seed(1)
+        pdftype, pdfshape, limits = uniform_dist
+        function = lambda X: np.array([(3 * x[0], 1 * x[1], 2 * x[0]**2) for x in X])
+        reg, res = adaptive.run_reg_adaptive_grid(
+                pdftype, pdfshape,
+                limits, function,
+                data_poly_ratio=2,
+                n_cpus=2,
+                vectorized=True)
+        assert reg.construct_gpc_matrix().shape == (8,4)
+        assert res.shape == (8, 3)
@@ -124,6 +124,14 @@ class TestPythonMUMPS:
         x_pd = solver.solve(b)
         np.testing.assert_allclose(x, x_pd, atol=1e-12)
 
+    def test_refactorize(self):
+        A, b, x = create_matrix(1000, .99)
+        solver = MUMPS_Solver(A)
+        A2 = A + sp.diags(A.diagonal())
+        solver.refactorize(A2)
+        x_pd = solver.solve(A2.dot(x))
+        np.testing.assert_allclose(x, x_pd, atol=1e-12)
+
 @pytest.mark.skipif(sys.platform=="darwin", reason="Intel MKL Pardiso not available on Mac OS X")
 class TestPythonPardiso:
     def test_solve(self):
@@ -145,4 +153,12 @@ class TestPythonPardiso:
         b = A.dot(x)
         solver = pardiso.Solver(A)
         x_pd = solver.solve(b)
-        np.testing.assert_allclose(x, x_pd, atol=1e-12)
\ No newline at end of file
+        np.testing.assert_allclose(x, x_pd, atol=1e-12)
+
+    def test_refactorize(self):
+        A, b, x = create_matrix(1000, .99)
+        solver = pardiso.Solver(A)
+        A2 = A + sp.diags(A.diagonal())
+        solver.refactorize(A2)
+        x_pd = solver.solve(A2.dot(x))
+        np.testing.assert_allclose(x, x_pd, atol=1e-12)
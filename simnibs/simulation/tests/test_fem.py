@@ -13,6 +13,9 @@ from ... import SIMNIBSDIR
 from .. import fem
 from .. import analytical_solutions
 from ...mesh_tools import mesh_io
+from ..tms_coil.tms_coil import TmsCoil
+from ..tms_coil.tms_coil_element import DipoleElements
+from ..tms_coil.tms_stimulator import TmsStimulator
 
 @pytest.fixture
 def sphere3_msh():
@@ -123,6 +126,17 @@ class Testcalc_fields:
         assert np.allclose(m.field['magnJ'].value,
                            np.linalg.norm(cond.value[:, None] * E.value, axis=1) * 1e3)
 
+    def test_calc_fields_shares_geometry(self, sphere3_msh):
+        sphere3_msh.elmdata = [mesh_io.ElementData(sphere3_msh.elm.tag1, 'tag')]
+        potential = mesh_io.NodeData(
+            sphere3_msh.nodes.node_coord[:, 0], mesh=sphere3_msh)
+        m = fem.calc_fields(potential, 'vE')
+        assert m.nodes is sphere3_msh.nodes
+        assert m.elm is sphere3_msh.elm
+        assert [d.field_name for d in m.nodedata + m.elmdata] == ['v', 'E']
+        assert len(sphere3_msh.elmdata) == 1
+        assert len(sphere3_msh.nodedata) == 0
+
     def test_calc_dadt(self, sphere3_msh):
         phi = sphere3_msh.nodes.node_coord[:, 0] + \
             2 * sphere3_msh.nodes.node_coord[:, 1] + \
@@ -259,6 +273,29 @@ class TestSolve:
         x = ksp.solve(b).squeeze()
         assert np.allclose(A.dot(x), b)
 
+    def test_multiple_rhs_block(self):
+        np.random.seed(0)
+        n = 5
+        A = np.random.random((n, n))
+        A += A.T + n * np.eye(n)
+        A = sparse.csr_matrix(A)
+        b = np.random.random((n, 3))
+        ksp = fem.KSPSolver(A, "preonly", "lu")
+        x = ksp.solve(b)
+        assert x.shape == (n, 3)
+        assert np.allclose(A.dot(x), b)
+
+    @pytest.mark.parametrize("block_size", [1, 3, 10])
+    def test_rhs_blocks(self, block_size):
+        blocks = fem._rhs_blocks(7, 100, block_size)
+        assert np.all(np.hstack(blocks) == np.arange(7))
+        assert all(len(b) <= block_size for b in blocks)
+
+    def test_rhs_blocks_memory(self):
+        n_dof = fem.MAX_RHS_BLOCK_MEMORY // 16 // 2
+        blocks = fem._rhs_blocks(5, n_dof, 5)
+        assert [len(b) for b in blocks] == [2, 2, 1]
+
 
 class TestAssemble:
     def test_gradient_operator(self, cube_msh):
@@ -412,6 +449,35 @@ class TestFEMSystem:
         assert rdm(sol, x.T) < .1
         assert np.abs(mag(x, sol)) < np.log(1.1)
 
+    def test_solve_into(self, cube_msh):
+        m = cube_msh
+        cond = np.ones(m.elm.nr)
+        cond[m.elm.tag1 > 5] = 1e3
+        S = fem.TDCSFEMDirichlet(m, cond, [1100, 1101], [1, -1])
+        x = S.solve()
+        out = np.empty(m.nodes.nr)
+        b = np.zeros(m.nodes.nr)
+        assert S.solve_into(b, out) is out
+        assert np.allclose(out, x)
+        assert np.all(b == 0)
+        out = np.empty((m.nodes.nr, 2))
+        S.solve_into(np.zeros((m.nodes.nr, 2)), out)
+        assert np.allclose(out, x[:, None])
+        with pytest.raises(ValueError):
+            S.solve_into(b, np.empty(m.nodes.nr + 1))
+
+    def test_warm_start(self, cube_msh):
+        m = cube_msh
+        cond = np.ones(m.elm.nr)
+        cond[m.elm.tag1 > 5] = 1e3
+        S = fem.TDCSFEMDirichlet(m, cond, [1100, 1101], [1, -1])
+        x = S.solve()
+        n_iter = S._solver.ksp.getIterationNumber()
+        S.set_warm_start()
+        assert S._solver.warm_start
+        assert np.allclose(S.solve(), x)
+        assert S._solver.ksp.getIterationNumber() < n_iter
+
     def test_solve_assemble_neumann_tag(self, cube_msh):
         m = cube_msh
         cond = np.ones(m.elm.nr)
@@ -496,6 +562,80 @@ class TestFEMSystem:
         assert np.allclose(grad[:, :, 1], [0, 3, 0])
         assert np.allclose(grad[:, :, 2], [0, 0, 1])
 
+    @pytest.mark.parametrize('aniso', [False, True])
+    def test_parametric_stiffness(self, aniso, sphere3_msh):
+        msh = sphere3_msh
+        th = msh.elm.elm_type == 4
+        if aniso:
+            cond = np.tile(np.diag([1., 2., 3.]), (np.sum(th), 1, 1))
+        else:
+            cond = np.random.rand(np.sum(th))
+        G = fem._gradient_operator(msh)
+        vols = fem._vol(msh)
+        th_nodes = msh.elm.node_number_list[th]
+        dof_map = fem.dofMap(msh.nodes.node_number)
+        if aniso:
+            vGc = vols[:, None, None]*np.einsum('aij, ajk -> aik', G, cond)
+        else:
+            vGc = vols[:, None, None]*G*cond[:, None, None]
+        K = np.einsum('aik, ajk -> aij', vGc, G)
+        dofs = dof_map[th_nodes]
+        A = sparse.coo_matrix(
+            (K.reshape(-1),
+             (np.repeat(dofs, 4, axis=1).reshape(-1),
+              np.tile(dofs, (1, 4)).reshape(-1))),
+            shape=(dof_map.nr, dof_map.nr)
+        ) * 1e-3
+        stiffness = fem._ParametricStiffness(G, vols, th_nodes, dof_map)
+        assert stiffness._scatter.dtype == np.int32
+        assert np.allclose(stiffness.assemble(cond).toarray(), A.toarray())
+        # the pattern does not depend on the conductivity
+        assert stiffness.assemble(np.zeros_like(cond)).nnz == stiffness.assemble(cond).nnz
+
+    @pytest.mark.parametrize('solver_options', [
+        'hypre',
+        pytest.param('pardiso', marks=pytest.mark.skipif(
+            sys.platform == 'darwin', reason='MKL PARDISO not available on Mac OS X'))
+    ])
+    def test_update_conductivity(self, solver_options, cube_msh):
+        m = cube_msh
+        cond = np.ones(m.elm.nr)
+        cond[m.elm.tag1 > 5] = 1e3
+        S = fem.TDCSFEMDirichlet(m, cond, [1100, 1101], [1, -1],
+                                 solver_options=solver_options)
+        S.solve()
+        cond[m.elm.tag1 == 5] = 2.
+        cond[m.elm.tag1 > 5] = 10.
+        S.update_conductivity(cond)
+        S_new = fem.TDCSFEMDirichlet(m, cond, [1100, 1101], [1, -1],
+                                     solver_options=solver_options)
+        assert np.allclose(S.A.toarray(), S_new.A.toarray())
+        assert np.allclose(S.solve(), S_new.solve())
+
+    @pytest.mark.skipif(sys.platform == 'darwin',
+                        reason='MKL PARDISO not available on Mac OS X')
+    def test_update_conductivity_refactorize(self, cube_msh):
+        m = cube_msh
+        cond = np.ones(m.elm.nr)
+        S = fem.TDCSFEMDirichlet(m, cond, [1100, 1101], [1, -1],
+                                 solver_options='pardiso')
+        S.prepare_solver()
+        phases = []
+        call_pardiso = fem.pardiso.Solver._call_pardiso
+
+        def spy(self, b, phase):
+            phases.append(phase)
+            return call_pardiso(self, b, phase)
+
+        cond[m.elm.tag1 > 5] = 10.
+        S.update_conductivity(cond)
+        with patch.object(fem.pardiso.Solver, '_call_pardiso', spy):
+            cond[m.elm.tag1 > 5] = 1e-3
+            S.update_conductivity(cond)
+            cond[m.elm.tag1 > 5] = 5.
+            S.update_conductivity(cond)
+        assert phases == [22, 22]
+
 
 class TestTDCS:
     def test_tdcs_petsc(self, cube_msh):
@@ -518,6 +658,24 @@ class TestTDCS:
         assert rdm(sol, x.value) < .1
         assert np.abs(mag(x.value, sol)) < np.log(1.1)
 
+    def test_tdcs_fem_systems(self, cube_msh):
+        m = cube_msh
+        cond = np.ones(m.elm.nr)
+        cond[m.elm.tag1 > 5] = 1e3
+        el_tags = [1100, 1101]
+        currents = [1, -1]
+        fem_systems = {}
+        fem.tdcs(m, mesh_io.ElementData(cond), currents, el_tags,
+                 fem_systems=fem_systems)
+        assert len(fem_systems) == 1
+        S = fem_systems[(1100, 1101)]
+        cond[m.elm.tag1 == 5] = 2.
+        x = fem.tdcs(m, mesh_io.ElementData(cond), currents, el_tags,
+                     fem_systems=fem_systems)
+        assert fem_systems[(1100, 1101)] is S
+        x_new = fem.tdcs(m, mesh_io.ElementData(cond), currents, el_tags)
+        assert np.allclose(x.value, x_new.value)
+
 
     def test_tdcs_petsc_3_el(self, cube_msh):
         m = cube_msh
@@ -637,6 +795,26 @@ class TestTMS:
             assert rdm(E, E_analytical) < .2
             assert np.abs(mag(E, E_analytical)) < np.log(1.1)
 
+    @patch.object(fem, '_get_da_dt_from_coil')
+    def test_tms_coil_threads(self, mock_set_up, tms_sphere):
+        m, cond, dAdt, E_analytical = tms_sphere
+        mock_set_up.return_value = dAdt.node_data2elm_data()
+        cond_value = cond.value.copy()
+        cond_mesh = cond.mesh
+        fn_out = [tempfile.NamedTemporaryFile(delete=False).name for i in range(4)]
+        fem.tms_coil(m, cond, None, 'coil.ccd',
+                     'EJ', 4*['MATSIMNIBS'],
+                     4*[6], fn_out, n_workers=2, use_threads=True)
+        assert mock_set_up.call_count == 4
+        # the workers do not change the conductivity passed in
+        assert cond.mesh is cond_mesh
+        np.testing.assert_equal(cond.value, cond_value)
+        for f in fn_out:
+            E = mesh_io.read_msh(f).field['E'].value
+            os.remove(f)
+            assert rdm(E, E_analytical) < .2
+            assert np.abs(mag(E, E_analytical)) < np.log(1.1)
+
 
 class TestLeadfield:
     @pytest.mark.parametrize('post_pro', [False, True])
@@ -713,6 +891,92 @@ class TestLeadfield:
 
         os.remove(fn_hdf5)
 
+    @pytest.mark.parametrize('input_type', ['tag', 'nodes'])
+    def test_leadfield_block(self, input_type, cube_msh):
+        m = cube_msh
+        cond = np.ones(m.elm.nr)
+        cond[m.elm.tag1 > 5] = 1e3
+        cond = mesh_io.ElementData(cond, mesh=m)
+        if input_type == 'tag':
+            el = [1100, 1101, 1101, 1100]
+        else:
+            el = [cube_msh_center_node_at_tag(m, i) for i in [1100, 1101, 1101, 1100]]
+
+        leadfields = []
+        for block_size in [1, 2]:
+            fn_hdf5 = tempfile.NamedTemporaryFile(delete=False).name
+            fem.tdcs_leadfield(
+                m, cond, el, fn_hdf5, 'leadfield',
+                roi=[5], input_type=input_type, block_size=block_size
+            )
+            with h5py.File(fn_hdf5, 'r') as f:
+                leadfields.append(f['leadfield'][:])
+            os.remove(fn_hdf5)
+
+        assert leadfields[1].shape == (3, np.sum(m.elm.tag1 == 5), 3)
+        assert np.allclose(leadfields[0], leadfields[1])
+
+
+    def test_leadfield_threads(self, cube_msh):
+        m = cube_msh
+        cond = np.ones(m.elm.nr)
+        cond[m.elm.tag1 > 5] = 1e3
+        cond = mesh_io.ElementData(cond, mesh=m)
+        el = [1100, 1101, 1101, 1100]
+
+        leadfields = []
+        for use_threads, n_workers in [(False, 1), (True, 2)]:
+            fn_hdf5 = tempfile.NamedTemporaryFile(delete=False).name
+            fem.tdcs_leadfield(
+                m, cond, el, fn_hdf5, 'leadfield', roi=[5],
+                n_workers=n_workers, use_threads=use_threads
+            )
+            with h5py.File(fn_hdf5, 'r') as f:
+                leadfields.append(f['leadfield'][:])
+            os.remove(fn_hdf5)
+
+        assert np.allclose(leadfields[0], leadfields[1])
+
+
+class TestLeadfieldWriter:
+    @pytest.mark.parametrize('threaded', [False, True])
+    @pytest.mark.parametrize('compression', [None, 'lzf', 'gzip', 4])
+    def test_write(self, compression, threaded):
+        fn_hdf5 = tempfile.NamedTemporaryFile(delete=False).name
+        data = np.random.random((5, 10, 3))
+        with fem.LeadfieldWriter(fn_hdf5, 'leadfield', data.shape,
+                                 compression=compression, threaded=threaded) as w:
+            for i in [3, 0, 4, 1, 2]:
+                w.write(i, data[i])
+        with h5py.File(fn_hdf5, 'r') as f:
+            assert f['leadfield'].chunks == (1, 10, 3)
+            assert np.allclose(f['leadfield'][:], data)
+        os.remove(fn_hdf5)
+
+    def test_invalid_compression(self):
+        fn_hdf5 = tempfile.NamedTemporaryFile(delete=False).name
+        with pytest.raises(ValueError):
+            fem.LeadfieldWriter(fn_hdf5, 'leadfield', (5, 10, 3), compression='bz2')
+        with pytest.raises(ValueError):
+            fem.LeadfieldWriter(fn_hdf5, 'leadfield', (5, 10, 3), compression=True)
+        os.remove(fn_hdf5)
+
+    def test_threaded_error(self):
+        fn_hdf5 = tempfile.NamedTemporaryFile(delete=False).name
+        w = fem.LeadfieldWriter(fn_hdf5, 'leadfield', (5, 10, 3), threaded=True)
+        w.write(0, np.zeros((11, 3)))
+        with pytest.raises(Exception):
+            w.close()
+        os.remove(fn_hdf5)
+
+    def test_error_not_masked(self):
+        fn_hdf5 = tempfile.NamedTemporaryFile(delete=False).name
+        with pytest.raises(KeyError):
+            with fem.LeadfieldWriter(fn_hdf5, 'leadfield', (5, 10, 3), threaded=True) as w:
+                w.write(0, np.zeros((11, 3)))
+                raise KeyError()
+        os.remove(fn_hdf5)
+
 
 class TestTMSMany:
     @pytest.mark.parametrize('post_pro', [False, True])
@@ -751,6 +1015,138 @@ class TestTMSMany:
                     assert mag(E, E_analytical[roi_select]) < np.log(1.1)
         os.remove(fn_hdf5)
 
+    @patch.object(fem, '_get_da_dt_from_coil')
+    def test_many_simulations_threads(self, mock_set_up, tms_sphere):
+        m, cond, dAdt, E_analytical = tms_sphere
+        mock_set_up.return_value = dAdt.node_data2elm_data()
+        fn_hdf5 = tempfile.NamedTemporaryFile(delete=False).name
+        fem.tms_many_simulations(
+            m, cond, 'coil.ccd',
+            5*[np.eye(4)], 5*[6],
+            fn_hdf5, 'leadfield', roi=[3],
+            n_workers=2, use_threads=True
+        )
+        roi_select = m.elm.tag1 == 3
+        with h5py.File(fn_hdf5, 'r') as f:
+            assert f['leadfield'].shape[0] == 5
+            for E in f['leadfield']:
+                assert rdm(E, E_analytical[roi_select]) < .3
+                assert mag(E, E_analytical[roi_select]) < np.log(1.1)
+        os.remove(fn_hdf5)
+
+    @patch.object(fem, '_get_da_dt_from_coil_batch')
+    @patch.object(fem, '_get_da_dt_from_coil')
+    def test_many_simulations_block(self, mock_set_up, mock_set_up_batch, tms_sphere):
+        m, cond, dAdt, E_analytical = tms_sphere
+        mock_set_up.return_value = dAdt.node_data2elm_data()
+        mock_set_up_batch.side_effect = \
+            lambda fn, mesh, didt, matsimnibs: len(didt) * [dAdt.node_data2elm_data()]
+        fn_hdf5 = tempfile.NamedTemporaryFile(delete=False).name
+        fem.tms_many_simulations(
+            m, cond, 'coil.ccd',
+            3*[np.eye(4)], 3*[6],
+            fn_hdf5, 'leadfield', roi=[3], block_size=2
+        )
+        roi_select = m.elm.tag1 == 3
+        with h5py.File(fn_hdf5, 'r') as f:
+            assert f['leadfield'].shape[0] == 3
+            for E in f['leadfield']:
+                assert rdm(E, E_analytical[roi_select]) < .3
+                assert mag(E, E_analytical[roi_select]) < np.log(1.1)
+        os.remove(fn_hdf5)
+
+    @patch.object(fem, '_get_da_dt_from_coil')
+    def test_many_simulations_warm_start(self, mock_set_up, tms_sphere):
+        m, cond, dAdt, E_analytical = tms_sphere
+        mock_set_up.side_effect = \
+            lambda fn, mesh, didt, matsimnibs: didt * dAdt.node_data2elm_data()
+        matsimnibs = [np.eye(4) for i in range(4)]
+        for i, x in enumerate([0., 30., 10., 20.]):
+            matsimnibs[i][0, 3] = x
+        didt = [1., 4., 2., 3.]
+        fn_hdf5 = tempfile.NamedTemporaryFile(delete=False).name
+        fem.tms_many_simulations(
+            m, cond, 'coil.ccd', matsimnibs, didt,
+            fn_hdf5, 'leadfield', roi=[3], warm_start=True
+        )
+        roi_select = m.elm.tag1 == 3
+        with h5py.File(fn_hdf5, 'r') as f:
+            for d, E in zip(didt, f['leadfield']):
+                assert rdm(E, d * E_analytical[roi_select]) < .3
+                assert mag(E, d * E_analytical[roi_select]) < np.log(1.1)
+        os.remove(fn_hdf5)
+
+    def test_order_positions(self):
+        matsimnibs = [np.eye(4) for i in range(5)]
+        for i, x in enumerate([0., 40., 10., 30., 20.]):
+            matsimnibs[i][0, 3] = x
+        assert np.all(fem._order_positions(matsimnibs) == [0, 2, 4, 3, 1])
+        # Rotating the coil also counts as a distance
+        matsimnibs[4][:3, :3] = -np.eye(3)
+        assert fem._order_positions(matsimnibs)[-1] == 4
+
+
+class TestCoilCache:
+    def _write_coil(self, fn, n_dipoles):
+        stimulators = [TmsStimulator('a'), TmsStimulator('b')]
+        elements = [
+            DipoleElements(
+                stim, np.arange(3 * n_dipoles).reshape(-1, 3) + 10 * i,
+                np.ones((n_dipoles, 3)))
+            for i, stim in enumerate(stimulators)
+        ]
+        TmsCoil(elements).write(fn)
+
+    def test_read_coil(self, tmp_path):
+        fn = str(tmp_path / 'coil.tcd')
+        self._write_coil(fn, 2)
+        fem._clear_coil_cache()
+        coil = fem._read_coil(fn)
+        assert fem._read_coil(fn) is coil
+        self._write_coil(fn, 3)
+        coil2 = fem._read_coil(fn)
+        assert coil2 is not coil
+        assert len(coil2.elements[0].points) == 3
+        assert len(fem._coil_cache) == 1
+        fem._clear_coil_cache()
+
+    def test_coil_with_didt(self, tmp_path):
+        fn = str(tmp_path / 'coil.tcd')
+        self._write_coil(fn, 2)
+        coil = fem._read_coil(fn)
+        pos = np.array([[100., 0., 0.], [0., 100., 0.]])
+        A = [e.get_da_dt(pos, np.eye(4)) for e in coil.elements]
+        view = fem._coil_with_didt(coil, [2., 3.])
+        assert np.allclose(
+            view.get_da_dt_at_coordinates(pos, np.eye(4)), 2 * A[0] + 3 * A[1])
+        view = fem._coil_with_didt(coil, 4.)
+        assert np.allclose(
+            view.get_da_dt_at_coordinates(pos, np.eye(4)), 4 * (A[0] + A[1]))
+        assert [e.stimulator.di_dt for e in coil.elements] == [1., 1.]
+        assert view.elements[0].points is coil.elements[0].points
+        fem._clear_coil_cache()
+
+
+    def test_get_da_dt_from_coil_batch(self, sphere3_msh, tmp_path):
+        stimulators = [TmsStimulator('a'), TmsStimulator('b')]
+        coil = TmsCoil([
+            DipoleElements(stimulators[0], [[0, 0, 100], [10, 0, 100]], [[0, 0, 1], [0, 0, -1]]),
+            DipoleElements(stimulators[1], [[0, 10, 100]], [[0, 1, 0]]),
+        ])
+        fn = str(tmp_path / 'coil.tcd')
+        coil.write(fn)
+        matsimnibs = [np.eye(4), np.eye(4)]
+        matsimnibs[1][:3, :3] = [[0, -1, 0], [1, 0, 0], [0, 0, 1]]
+        matsimnibs[1][:3, 3] = [0, 0, 10]
+        didt = [2., [3., 4.]]
+        dAdt = fem._get_da_dt_from_coil_batch(fn, sphere3_msh, didt, matsimnibs)
+        for d, mat, dAdt_batch in zip(didt, matsimnibs, dAdt):
+            assert np.allclose(
+                dAdt_batch.value,
+                fem._get_da_dt_from_coil(fn, sphere3_msh, d, mat).value)
+        fem._clear_coil_cache()
+
+
 class TestDipole:
     # st. venant fails with dipole [80,0,0], [1,0,0]!
     @pytest.mark.parametrize('source_model', ["partial integration"])#, "st. venant"])
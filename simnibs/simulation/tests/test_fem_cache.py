@@ -0,0 +1,71 @@
+import copy
+import os
+import time
+
+import numpy as np
+import pytest
+import scipy.sparse as sparse
+
+from .. import fem
+from ..fem_cache import FEMCache
+
+
+@pytest.fixture
+def fem_cache(tmp_path):
+    cache = fem.set_fem_cache(str(tmp_path))
+    yield cache
+    fem.disable_fem_cache()
+
+
+class TestFEMCache:
+    def test_matrix_key(self, sphere3_msh):
+        cond = np.ones(sphere3_msh.elm.nr)
+        key = FEMCache.matrix_key(sphere3_msh, cond, 'mm')
+        assert key == FEMCache.matrix_key(sphere3_msh, cond.copy(), 'mm')
+        assert key != FEMCache.matrix_key(sphere3_msh, 2 * cond, 'mm')
+        assert key != FEMCache.matrix_key(sphere3_msh, cond, 'm')
+
+    def test_directory_from_mesh(self, sphere3_msh):
+        cache = FEMCache()
+        assert cache.get_directory(sphere3_msh) == os.path.join(
+            os.path.dirname(os.path.abspath(sphere3_msh.fn)), 'fem_cache')
+        msh = copy.copy(sphere3_msh)
+        msh.fn = ''
+        assert cache.get_directory(msh) is None
+
+    def test_matrix_cached(self, sphere3_msh, fem_cache):
+        cond = np.ones(sphere3_msh.elm.nr)
+        S1 = fem.FEMSystem(sphere3_msh, cond)
+        assert fem_cache.misses == 1
+        S2 = fem.FEMSystem(sphere3_msh, cond)
+        assert fem_cache.hits == 1
+        assert np.allclose((S1.A - S2.A).data, 0)
+
+    def test_evict(self, tmp_path, sphere3_msh):
+        cache = FEMCache(str(tmp_path))
+        A = sparse.eye(10, format='csc')
+        cache.save_matrix(sphere3_msh, 'a', A)
+        cache.max_size = os.path.getsize(tmp_path / 'a.A.npz') + 1
+        time.sleep(0.01)
+        cache.save_matrix(sphere3_msh, 'b', A)
+        assert not os.path.isfile(tmp_path / 'a.A.npz')
+        assert cache.load_matrix(sphere3_msh, 'a') is None
+        assert cache.load_matrix(sphere3_msh, 'b') is not None
+
+    def test_load_save_perm(self, tmp_path, sphere3_msh):
+        cache = FEMCache(str(tmp_path))
+        perm = np.arange(1, 11, dtype=np.int32)
+        cache.save_perm(sphere3_msh, 'a', perm)
+        assert np.all(cache.load_perm(sphere3_msh, 'a') == perm)
+        assert cache.hits == 1
+
+    def test_load_save_arrays(self, tmp_path, sphere3_msh):
+        cache = FEMCache(str(tmp_path))
+        key = FEMCache.array_key('a', np.arange(3), 1.0, 'b')
+        assert key != FEMCache.array_key('a', np.arange(3), 2.0, 'b')
+        assert cache.load_arrays(sphere3_msh, key) is None
+        cache.save_arrays(sphere3_msh, key, x=np.arange(3), y=np.eye(2))
+        arrays = cache.load_arrays(sphere3_msh, key)
+        assert np.all(arrays['x'] == np.arange(3))
+        assert np.all(arrays['y'] == np.eye(2))
+        assert cache.hits == 1
@@ -241,6 +241,20 @@ class TestSampler:
             assert np.allclose(f['data/E'][0, ...], E1)
             assert np.allclose(f['data/E'][1, ...], E2)
 
+    def test_record_data_matrix_batch(self, sampler_args):
+        mesh, poslist, fn_hdf5, roi = sampler_args
+        S = simnibs_gpc.gPCSampler(mesh, poslist, fn_hdf5, roi)
+
+        E1 = np.random.rand(100, 3)
+        E2 = np.random.rand(2, 100, 3)
+        S.record_data_matrix(E1, 'E', 'data')
+        S.record_data_matrix(E2, 'E', 'data', batch=True)
+
+        with h5py.File(fn_hdf5, 'r') as f:
+            assert f['data/E'].shape == (3, 100, 3)
+            assert np.allclose(f['data/E'][0, ...], E1)
+            assert np.allclose(f['data/E'][1:, ...], E2)
+
     def test_calc_E(self, sampler_args):
         mesh, poslist, fn_hdf5, roi = sampler_args
         S = simnibs_gpc.gPCSampler(mesh, poslist, fn_hdf5, roi)
@@ -346,6 +360,28 @@ class TestSampler:
             assert np.allclose(f['mesh_roi/data_matrices/rand_samples'][:],[[1], [2]])
 
 
+    @patch.object(simnibs_gpc, 'fem')
+    def test_tdcs_run_simulations(self, mock_fem, sampler_args):
+        mesh, poslist, fn_hdf5, roi = sampler_args
+        v = mesh.nodes.node_coord[:, 0]
+        v_roi = mesh.crop_mesh(roi).nodes.node_coord[:, 0]
+
+        mock_fem.tdcs.side_effect = [
+            mesh_io.NodeData(v, mesh=mesh),
+            mesh_io.NodeData(-v, mesh=mesh)]
+
+        S = simnibs_gpc.TDCSgPCSampler(
+            mesh, poslist, fn_hdf5, [1101, 1102], [-1, 1], roi)
+
+        E = S.run_simulations([[1], [2]])
+        assert E.shape == (2, 3 * np.sum(mesh.elm.tag1 == 3))
+        assert np.allclose(E[0].reshape(-1, 3), [-1e3, 0, 0])
+        assert np.allclose(E[1].reshape(-1, 3), [1e3, 0, 0])
+        with h5py.File(fn_hdf5, 'r') as f:
+            assert np.allclose(f['random_var_samples'][()], [[1], [2]])
+            assert np.allclose(f['mesh_roi/data_matrices/v_samples'][0, :], v_roi)
+            assert np.allclose(f['mesh_roi/data_matrices/v_samples'][1, :],-v_roi)
+
     def test_tms_set_up(self, sampler_args):
         mesh, poslist, fn_hdf5, roi = sampler_args
         matsimnibs = np.eye(4)
@@ -298,6 +298,12 @@ class TestOnlineFEM:
         
         assert abs(avg_v1_l-avg_v2_l-6.66666) < 0.05
         assert abs(avg_v1_r-avg_v2_r-6.66666) < 0.05
+
+        if not dirichlet_correction_detailed:
+            # the electrode currents are solved for directly, the potentials are equal up to round-off
+            assert ofem.n_iter_dirichlet_correction == 1
+            assert np.isclose(avg_v1_l, avg_v1_r, rtol=1e-6)
+            assert np.isclose(avg_v2_l, avg_v2_r, rtol=1e-6)
         assert abs(avg_v1_l-avg_v1_r) < 0.05
         assert abs(avg_v2_l-avg_v2_r) < 0.05
     
@@ -394,4 +400,44 @@ class TestOnlineFEM:
                 assert ofem.roi[0].sF[-1, :].sum() == 1
                 assert ofem.roi[0].sF[-1, nearest_idx] == 1
         else:
-            assert np.all(E[-1, :] == 0)
\ No newline at end of file
+            assert np.all(E[-1, :] == 0)
+
+
+    @pytest.mark.parametrize("useElements", [False, True])
+    @pytest.mark.parametrize("nearest", [False, True])
+    @pytest.mark.parametrize("dataType", [0, 1])
+    def test_tms_sphere_blocks(self, tms_sphere, nearest, dataType, useElements):
+        m, cond, dAdt, E_analytical, coil = tms_sphere
+        center_points = m.elements_baricenters().value
+        point_cloud = onlinefem.FemTargetPointCloud(m, center_points, nearest_neighbor=nearest)
+        ofem = onlinefem.OnlineFEM(m, 'TMS', roi=[point_cloud], coil=coil, solver_options="hypre", cond=cond,
+                                   useElements=useElements)
+        ofem.dataType = [dataType]
+
+        matsimnibs = np.repeat(np.identity(4)[:, :, None], 5, axis=2)
+        matsimnibs[:3, 3, :] = np.random.uniform(-10, 10, (3, 5))
+        E_block = ofem.update_field(matsimnibs=matsimnibs, didt=1e6, block_size=2)
+        E_single = ofem.update_field(matsimnibs=matsimnibs, didt=1e6, block_size=1)
+        assert len(E_block) == 5
+        for e_b, e_s in zip(E_block, E_single):
+            assert e_b[0].shape == e_s[0].shape
+            assert np.allclose(e_b[0], e_s[0])
+
+    def test_tms_sphere_set_coil_state(self, tms_sphere):
+        m, cond, dAdt, E_analytical, coil = tms_sphere
+        center_points = m.elements_baricenters().value
+        point_cloud = onlinefem.FemTargetPointCloud(m, center_points)
+        ofem = onlinefem.OnlineFEM(m, 'TMS', roi=[point_cloud], coil=coil, solver_options="hypre", cond=cond)
+        ofem.dataType = [1]
+
+        values = coil.elements[0].values.copy()
+
+        def set_coil_state(i):
+            coil.elements[0].values = (i + 1) * values
+
+        matsimnibs = np.repeat(np.identity(4)[:, :, None], 3, axis=2)
+        for block_size in [1, 3]:
+            E = ofem.update_field(matsimnibs=matsimnibs, didt=1e6, block_size=block_size,
+                                  set_coil_state=set_coil_state)
+            for i in range(3):
+                assert np.allclose(E[i][0], (i + 1) * E[0][0])
@@ -1004,3 +1004,43 @@ class TestCasingGeneration:
                 tree = KDTree(element.points)
                 distances, _ = tree.query(element.casing.mesh.nodes.node_coord, k=1)
                 assert np.min(distances) + 0.3 > 10.0
+
+
+class TestAdaptiveSampling:
+    def test_get_target_limits(self):
+        targets = np.array([[-10.0, -10.0, 20.0], [10.0, 10.0, 40.0]])
+        affines = np.array([np.eye(4), np.eye(4)])
+        affines[1][:3, 3] = [0, 0, -10]
+        limits = TmsCoil.get_target_limits(targets, affines, margin=1.0)
+        np.testing.assert_allclose(limits, [[-11, 11], [-11, 11], [19, 51]])
+
+    def test_as_sampled_adaptive(self):
+        coil = TmsCoil(
+            [
+                DipoleElements(
+                    TmsStimulator(""),
+                    [[0, 0, -5], [10, 0, -5]],
+                    [[0, 0, 1], [0, 0, -1]],
+                )
+            ]
+        )
+        limits = np.array([[-40.0, 40.0], [-40.0, 40.0], [5.0, 60.0]])
+        sampled_coil, error = coil.as_sampled_adaptive(
+            limits, tolerance=1e-2, n_validation=1000
+        )
+        assert error <= 1e-2
+        assert isinstance(sampled_coil.elements[0], SampledGridPointElements)
+
+        c, s = np.cos(np.pi / 6), np.sin(np.pi / 6)
+        affine = np.array(
+            [[c, -s, 0, 5], [s, c, 0, -5], [0, 0, 1, 0], [0, 0, 0, 1]], dtype=float
+        )
+        targets_coil = np.random.default_rng(1).uniform(
+            limits[:, 0], limits[:, 1], (200, 3)
+        )
+        targets = targets_coil @ affine[:3, :3].T + affine[:3, 3]
+        A = coil.get_a_field(targets, affine)
+        A_sampled = sampled_coil.get_a_field(targets, affine)
+        assert np.max(np.linalg.norm(A - A_sampled, axis=1)) < 2e-2 * np.max(
+            np.linalg.norm(A, axis=1)
+        )
@@ -120,6 +120,93 @@ class TestCalcdAdt:
         np.testing.assert_allclose(da_dt[:, 1], 1e6, atol=1e-6)
         np.testing.assert_allclose(da_dt[:, 2], 3e6, atol=1e-6)
 
+    @pytest.mark.parametrize("dtype", [np.float64, np.float32])
+    @pytest.mark.parametrize("interpolation_order", [1, 3])
+    def test_sampled_elements_options(self, dtype, interpolation_order):
+        affine = np.array(
+            [
+                [2.0, 0.0, 0.0, -20],
+                [0.0, 2.0, 0.0, -20],
+                [0.0, 0.0, 2.0, -20],
+                [0.0, 0.0, 0.0, 1],
+            ]
+        )
+        grid = np.stack(
+            np.meshgrid(*(3 * [np.arange(21) * 2.0 - 20]), indexing="ij"), axis=-1
+        )
+        field = np.stack(
+            [np.sin(grid[..., 0] / 10), np.cos(grid[..., 1] / 10), grid[..., 2] / 10],
+            axis=-1,
+        )
+        sampled_elements = SampledGridPointElements(
+            TmsStimulator(None),
+            field,
+            affine,
+            dtype=dtype,
+            interpolation_order=interpolation_order,
+        )
+        assert sampled_elements._data.dtype == dtype
+
+        targets = np.random.default_rng(0).uniform(-15, 15, (1000, 3))
+        expected = np.stack(
+            [
+                np.sin(targets[:, 0] / 10),
+                np.cos(targets[:, 1] / 10),
+                targets[:, 2] / 10,
+            ],
+            axis=-1,
+        )
+        out = np.empty((1000, 3))
+        A = sampled_elements.get_a_field(targets, np.eye(4), out=out, chunk_size=300)
+        assert A is out
+        np.testing.assert_allclose(A, expected, atol=1e-2 if interpolation_order == 1 else 5e-4)
+        np.testing.assert_allclose(
+            sampled_elements.get_a_field(targets, np.eye(4)), A, rtol=1e-6
+        )
+
+    def test_sampled_elements_out_of_grid(self):
+        sampled_elements = SampledGridPointElements(
+            TmsStimulator(None), np.ones((4, 4, 4, 3)), np.eye(4), interpolation_order=3
+        )
+        A = sampled_elements.get_a_field(
+            np.array([[1.5, 1.5, 1.5], [0.5, 0.5, 0.5], [-1.0, 0.0, 0.0], [3.5, 0, 0]]),
+            np.eye(4),
+        )
+        np.testing.assert_allclose(A, [[1, 1, 1], [1, 1, 1], [0, 0, 0], [0, 0, 0]])
+        with pytest.raises(ValueError):
+            sampled_elements.get_a_field(np.zeros((2, 3)), np.eye(4), out=np.empty((3, 3)))
+
+
+class TestCalcAFieldBatch:
+    @pytest.mark.parametrize("element_type", ["dipoles", "line_segments"])
+    def test_batch_equals_single(self, element_type):
+        rng = np.random.default_rng(0)
+        points = rng.uniform(-20, 20, (400, 3))
+        values = rng.normal(size=(400, 3))
+        if element_type == "dipoles":
+            element = DipoleElements(TmsStimulator(""), points, values)
+        else:
+            element = LineSegmentElements(TmsStimulator(""), points, values)
+        element.deformations = [TmsCoilRotation(TmsCoilDeformationRange(20, [0, 40]), [0, 0, 0], [0, 1, 0])]
+
+        targets = rng.uniform(-50, 50, (100, 3)) + [0, 0, 100]
+        affines = []
+        for angle in [0.0, 0.5, 2.0]:
+            c, s = np.cos(angle), np.sin(angle)
+            affines.append(
+                [[c, -s, 0, angle], [s, c, 0, 0], [0, 0, 1, -angle], [0, 0, 0, 1]]
+            )
+        # Non-rigid transformation, evaluated one position at a time
+        affines.append(np.diag([1.0, 2.0, 1.0, 1.0]))
+
+        A_batch = element.get_a_field_batch(targets, affines, eps=1e-6)
+        assert A_batch.shape == (4, 100, 3)
+        for A, affine in zip(A_batch, affines):
+            A_single = element.get_a_field(targets, np.array(affine), eps=1e-6)
+            np.testing.assert_allclose(
+                A, A_single, atol=1e-4 * np.max(np.abs(A_single))
+            )
+
 
 class TestCalcBAdt:
     
@@ -2,6 +2,7 @@ import json
 import os
 import re
 import shutil
+import warnings
 from copy import deepcopy
 from typing import Optional
 
@@ -271,6 +272,69 @@ class TmsCoil(TcdElement):
             a_field += coil_element.get_a_field(points, coil_affine, eps)
 
         return a_field
+
+    def get_a_field_batch(
+        self,
+        points: npt.NDArray[np.float_],
+        coil_affines: npt.NDArray[np.float_],
+        eps: float = 1e-3,
+    ) -> npt.NDArray[np.float_]:
+        """Calculates the A field applied by the coil at each point for several coil positions.
+        Dipole and line segment elements evaluate all coil positions with as few FMM calls as possible.
+
+        Parameters
+        ----------
+        points : npt.NDArray[np.float_] (N x 3)
+            The points at which the A field should be calculated in mm
+        coil_affines : npt.NDArray[np.float_] (M x 4 x 4)
+            The affine transformations that are applied to the coil
+        eps : float, optional
+            The requested precision, by default 1e-3
+
+        Returns
+        -------
+        npt.NDArray[np.float_] (M x N x 3)
+            The A field at every point for every coil position in Tesla*meter
+        """
+        coil_affines = np.asarray(coil_affines, dtype=np.float64).reshape(-1, 4, 4)
+        a_field = np.zeros((len(coil_affines),) + np.shape(points))
+        for coil_element in self.elements:
+            a_field += coil_element.get_a_field_batch(points, coil_affines, eps)
+
+        return a_field
+
+    def get_da_dt_batch(
+        self,
+        coordinates: npt.NDArray[np.float_],
+        coil_affines: npt.NDArray[np.float_],
+        eps: float = 1e-3,
+    ) -> npt.NDArray[np.float_]:
+        """Calculate the dA/dt field applied by the coil at each coordinate for several coil positions.
+        The A field of each coil element is evaluated with get_a_field_batch and scaled with the
+        dI/dt of its stimulator.
+
+        Parameters
+        ----------
+        coordinates : npt.NDArray[np.float_] (N x 3)
+            The coordinates at which the dA/dt field should be calculated
+        coil_affines : npt.NDArray[np.float_] (M x 4 x 4)
+            The affine transformations that are applied to the coil
+        eps : float, optional
+            The requested precision, by default 1e-3
+
+        Returns
+        -------
+        npt.NDArray[np.float_] (M x N x 3)
+            The dA/dt field in V/m at every coordinate for every coil position
+        """
+        coil_affines = np.asarray(coil_affines, dtype=np.float64).reshape(-1, 4, 4)
+        da_dt = np.zeros((len(coil_affines),) + np.shape(coordinates))
+        for coil_element in self.elements:
+            da_dt += coil_element.stimulator.di_dt * coil_element.get_a_field_batch(
+                coordinates, coil_affines, eps
+            )
+
+        return da_dt
     
     def get_b_field(
         self,
@@ -1411,6 +1475,118 @@ class TmsCoil(TcdElement):
             )
         )
 
+    @staticmethod
+    def get_target_limits(
+        target_positions: npt.NDArray[np.float_],
+        coil_affines: npt.NDArray[np.float_],
+        margin: float = 2.0,
+    ) -> npt.NDArray[np.float_]:
+        """Returns limits in coil space that contain the target positions for all coil positions.
+        The limits are computed from the corners of the bounding box of the target positions, so they are conservative.
+
+        Parameters
+        ----------
+        target_positions : npt.NDArray[np.float_] (N x 3)
+            The target positions in mm, e.g. the nodes of the head mesh
+        coil_affines : npt.NDArray[np.float_] (4 x 4) or (M x 4 x 4)
+            The coil positions
+        margin : float, optional
+            Margin added to the limits in mm, by default 2.0
+
+        Returns
+        -------
+        npt.NDArray[np.float_] (3 x 2)
+            The limits in coil space in the format [[min(x), max(x)],[min(y), max(y)], [min(z), max(z)]]
+        """
+        target_positions = np.asarray(target_positions, dtype=np.float64)
+        coil_affines = np.asarray(coil_affines, dtype=np.float64).reshape(-1, 4, 4)
+        box = np.array([target_positions.min(axis=0), target_positions.max(axis=0)])
+        corners = np.array(
+            [[box[i, 0], box[j, 1], box[k, 2], 1.0] for i in range(2) for j in range(2) for k in range(2)]
+        )
+        corners_coil = np.einsum("mij,nj->mni", np.linalg.inv(coil_affines), corners)[..., :3]
+        corners_coil = corners_coil.reshape(-1, 3)
+        return np.array(
+            [corners_coil.min(axis=0) - margin, corners_coil.max(axis=0) + margin]
+        ).T
+
+    def as_sampled_adaptive(
+        self,
+        limits: Optional[npt.NDArray[np.float_]] = None,
+        tolerance: float = 1e-2,
+        resolution: float = 8.0,
+        min_resolution: float = 1.0,
+        n_validation: int = 10000,
+        seed: int = 0,
+    ) -> tuple["TmsCoil", float]:
+        """Turns every coil element into SampledGridPointElements, refining the sampling resolution until the
+        interpolated A field matches the field of the original elements up to a relative tolerance.
+
+        The error is measured at random validation points inside the limits, relative to the maximum A field
+        magnitude at these points. The resulting coil evaluates the A field for any coil position by linear
+        interpolation instead of an FMM evaluation.
+
+        Parameters
+        ----------
+        limits : Optional[npt.NDArray[np.float_]], optional
+            The sampling limits in coil space. Should cover the targets for all coil positions,
+            see get_target_limits. Overrides the limits set in the coil object, by default None
+        tolerance : float, optional
+            Maximum relative error of the interpolated A field, by default 1e-2
+        resolution : float, optional
+            Initial resolution in mm, halved until the tolerance is met, by default 8.0
+        min_resolution : float, optional
+            Finest resolution in mm, by default 1.0
+        n_validation : int, optional
+            Number of validation points, by default 10000
+        seed : int, optional
+            Seed of the validation points, by default 0
+
+        Returns
+        -------
+        tuple[TmsCoil, float]
+            The sampled coil and the estimated relative error of its A field
+
+        Raises
+        ------
+        ValueError
+            If the limits are not set in the coil object or as a parameter
+        """
+        limits = limits if limits is not None else self.limits
+        if limits is None:
+            raise ValueError("Limits needs to be set")
+        limits = np.asarray(limits, dtype=np.float64)
+
+        rng = np.random.default_rng(seed)
+        validation_points = rng.uniform(limits[:, 0], limits[:, 1], size=(n_validation, 3))
+        reference = [
+            coil_element.get_a_field(validation_points, np.eye(4), apply_deformation=False)
+            for coil_element in self.elements
+        ]
+        scale = [np.max(np.linalg.norm(a, axis=1)) for a in reference]
+
+        while True:
+            sampled_coil = self.as_sampled(limits, np.full(3, resolution))
+            error = 0.0
+            for coil_element, a, s in zip(sampled_coil.elements, reference, scale):
+                if s == 0:
+                    continue
+                a_interp = coil_element.get_a_field(
+                    validation_points, np.eye(4), apply_deformation=False
+                )
+                error = max(error, np.max(np.linalg.norm(a_interp - a, axis=1)) / s)
+            if error <= tolerance:
+                break
+            if resolution / 2 < min_resolution:
+                warnings.warn(
+                    f"Could not reach a relative error of {tolerance} with a resolution of {resolution} mm "
+                    f"(error: {error:.2e})"
+                )
+                break
+            resolution /= 2
+
+        return sampled_coil, error
+
     def as_sampled_squashed(
         self,
         limits: Optional[npt.NDArray[np.float_]] = None,
@@ -16,6 +16,10 @@ from simnibs.simulation.tms_coil.tms_coil_model import TmsCoilModel
 from .tms_coil_deformation import TmsCoilDeformation
 from .tms_stimulator import TmsStimulator
 
+# Maximum number of target positions evaluated in a single FMM call by
+# get_a_field_batch
+BATCH_MAX_TARGETS = 4_000_000
+
 
 class TmsCoilElements(ABC, TcdElement):
     """A representation of a stimulating element of a TMS coil
@@ -109,6 +113,39 @@ class TmsCoilElements(ABC, TcdElement):
             target_positions, coil_affine, eps
         )
 
+    def get_a_field_batch(
+        self,
+        target_positions: npt.NDArray[np.float_],
+        coil_affines: npt.NDArray[np.float_],
+        eps: float = 1e-3,
+        apply_deformation: bool = True,
+    ) -> npt.NDArray[np.float_]:
+        """Calculates the A field applied by the coil element at each target position for several coil positions.
+
+        Parameters
+        ----------
+        target_positions : npt.NDArray[np.float_] (N x 3)
+            The points at which the A field should be calculated (in mm)
+        coil_affines : npt.NDArray[np.float_] (M x 4 x 4)
+            The affine transformations that are applied to the coil
+        eps : float, optional
+            The requested precision, by default 1e-3
+        apply_deformation : bool, optional
+            Whether or not to apply the current coil element deformations, by default True
+
+        Returns
+        -------
+        npt.NDArray[np.float_] (M x N x 3)
+            The A field at every target positions for every coil position in Tesla*meter
+        """
+        coil_affines = np.asarray(coil_affines, dtype=np.float64).reshape(-1, 4, 4)
+        return np.stack(
+            [
+                self.get_a_field(target_positions, coil_affine, eps, apply_deformation)
+                for coil_affine in coil_affines
+            ]
+        )
+
     @abstractmethod
     def get_b_field(
         self,
@@ -526,6 +563,71 @@ class PositionalTmsCoilElements(TmsCoilElements, ABC):
         return self.values @ affine_matrix[:3, :3].T
 
 
+    def get_a_field_batch(
+        self,
+        target_positions: npt.NDArray[np.float_],
+        coil_affines: npt.NDArray[np.float_],
+        eps: float = 1e-3,
+        apply_deformation: bool = True,
+    ) -> npt.NDArray[np.float_]:
+        """Calculates the A field applied by the coil element at each target position for several coil positions.
+
+        For rigid coil transformations, the target positions of all coil positions are transformed into the
+        coordinate system of the element and evaluated together with as few FMM calls as possible.
+        The fields are then rotated back.
+
+        Parameters
+        ----------
+        target_positions : npt.NDArray[np.float_] (N x 3)
+            The points at which the A field should be calculated (in mm)
+        coil_affines : npt.NDArray[np.float_] (M x 4 x 4)
+            The affine transformations that are applied to the coil
+        eps : float, optional
+            The requested precision, by default 1e-3
+        apply_deformation : bool, optional
+            Whether or not to apply the current coil element deformations, by default True
+
+        Returns
+        -------
+        npt.NDArray[np.float_] (M x N x 3)
+            The A field at every target positions for every coil position in Tesla*meter
+        """
+        target_positions = np.asarray(target_positions, dtype=np.float64)
+        coil_affines = np.asarray(coil_affines, dtype=np.float64).reshape(-1, 4, 4)
+        if apply_deformation:
+            combined_affines = np.array(
+                [self.get_combined_transformation(a) for a in coil_affines]
+            )
+        else:
+            combined_affines = coil_affines
+        rotations = combined_affines[:, :3, :3]
+        is_rigid = np.allclose(
+            rotations @ rotations.transpose(0, 2, 1), np.eye(3), atol=1e-6
+        ) and np.all(np.linalg.det(rotations) > 0)
+        if not is_rigid:
+            return super().get_a_field_batch(
+                target_positions, coil_affines, eps, apply_deformation
+            )
+
+        n_targets = len(target_positions)
+        positions_per_call = max(1, BATCH_MAX_TARGETS // max(n_targets, 1))
+        A = np.empty((len(combined_affines), n_targets, 3), dtype=np.float64)
+        for start in range(0, len(combined_affines), positions_per_call):
+            stop = min(start + positions_per_call, len(combined_affines))
+            # x_element = R^T (x - t), written as row vectors
+            targets_element = np.concatenate(
+                [
+                    (target_positions - combined_affines[i, :3, 3]) @ rotations[i]
+                    for i in range(start, stop)
+                ]
+            )
+            A_element = self.get_a_field(
+                targets_element, np.eye(4), eps, apply_deformation=False
+            ).reshape(stop - start, n_targets, 3)
+            A[start:stop] = A_element @ rotations[start:stop].transpose(0, 2, 1)
+        return A
+
+
 class DipoleElements(PositionalTmsCoilElements):
     def get_a_field(
         self,
@@ -953,6 +1055,28 @@ class LineSegmentElements(PositionalTmsCoilElements):
 
 
 class SampledGridPointElements(TmsCoilElements):
+    """A representation of a TMS coil element given by the A field sampled on a regular grid
+
+    Parameters
+    ----------
+    stimulator : TmsStimulator
+        The stimulator used for this element
+    data : npt.ArrayLike (X x Y x Z x 3)
+        The sampled A field
+    affine : npt.ArrayLike (4 x 4)
+        The affine transformation from voxel indices to positions in mm
+    name : Optional[str], optional
+        The name of the element, by default None
+    casing : Optional[TmsCoilModel], optional
+        The casing of the element, by default None
+    deformations : Optional[list[TmsCoilDeformation]], optional
+        A list of all deformations of the element, by default None
+    dtype : npt.DTypeLike, optional
+        The data type used to store the sampled field, np.float64 or np.float32, by default np.float64
+    interpolation_order : int, optional
+        1 for trilinear and 3 for tricubic interpolation, by default 1
+    """
+
     def __init__(
         self,
         stimulator: TmsStimulator,
@@ -961,18 +1085,39 @@ class SampledGridPointElements(TmsCoilElements):
         name: Optional[str] = None,
         casing: Optional[TmsCoilModel] = None,
         deformations: Optional[list[TmsCoilDeformation]] = None,
+        dtype: npt.DTypeLike = np.float64,
+        interpolation_order: int = 1,
     ):
         super().__init__(stimulator, name, casing, deformations)
+        self.dtype = dtype
+        if interpolation_order not in (1, 3):
+            raise ValueError(
+                f"Expected 'interpolation_order' to be 1 or 3 but got {interpolation_order}"
+            )
+        self.interpolation_order = interpolation_order
         self.data = data
         self.affine = np.array(affine, dtype=np.float64)
 
+    @property
+    def dtype(self) -> np.dtype:
+        return self._dtype
+
+    @dtype.setter
+    def dtype(self, value: npt.DTypeLike):
+        value = np.dtype(value)
+        if value not in (np.float32, np.float64):
+            raise ValueError(f"Expected 'dtype' to be float32 or float64 but got {value}")
+        self._dtype = value
+        if hasattr(self, "_data"):
+            self._data = self._data.astype(value, order="F")
+
     @property
     def data(self) -> npt.NDArray[np.float_]:
         return np.transpose(self._data, (1, 2, 3, 0))
 
     @data.setter
     def data(self, value: npt.NDArray[np.float_]):
-        self._data = np.transpose(value, (3, 0, 1, 2)).astype(np.float64, order="F")
+        self._data = np.transpose(value, (3, 0, 1, 2)).astype(self.dtype, order="F")
 
     def get_a_field(
         self,
@@ -980,6 +1125,8 @@ class SampledGridPointElements(TmsCoilElements):
         coil_affine: npt.NDArray[np.float_],
         eps: float = 1e-3,
         apply_deformation: bool = True,
+        out: Optional[npt.NDArray[np.float_]] = None,
+        chunk_size: Optional[int] = None,
     ) -> npt.NDArray[np.float_]:
         """Calculates the A field interpolated from the sampled grid point elements at each target positions.
 
@@ -993,6 +1140,11 @@ class SampledGridPointElements(TmsCoilElements):
             The requested precision, by default 1e-3
         apply_deformation : bool, optional
             Whether or not to apply the current coil element deformations, by default True
+        out : Optional[npt.NDArray[np.float_]] (N x 3), optional
+            C-contiguous float64 array the A field is written into, by default None (a new array is allocated)
+        chunk_size : Optional[int], optional
+            Number of target positions converted to float64 and interpolated at once,
+            by default None (all at once)
 
         Returns
         -------
@@ -1001,7 +1153,7 @@ class SampledGridPointElements(TmsCoilElements):
         """
         # TODO: import here as numba interacts badly with pyqt (GUI). move to
         # start of file once this is resolved.
-        from simnibs.simulation.numba_fem_utils import map_coord_lin_trans
+        from simnibs.simulation.numba_fem_utils import map_coord_trans_into
 
         combined_affine = coil_affine
         if apply_deformation:
@@ -1022,10 +1174,35 @@ class SampledGridPointElements(TmsCoilElements):
         #    out[dim] = ndimage.map_coordinates(
         #        np.asanyarray(self.data)[..., dim], target_voxle_coordinates, order=1
         #    )
-        out = map_coord_lin_trans(self._data, target_positions.T, M1, t, M2)
+        n_targets = len(target_positions)
+        if out is None:
+            out = np.empty((n_targets, 3), dtype=np.float64)
+        elif (
+            out.shape != (n_targets, 3)
+            or out.dtype != np.float64
+            or not out.flags.c_contiguous
+        ):
+            raise ValueError(
+                f"Expected 'out' to be a C-contiguous float64 array of shape {(n_targets, 3)}"
+            )
+        if chunk_size is None:
+            chunk_size = max(n_targets, 1)
+
+        # Interpolates the values of the field in the given coordinates and
+        # rotates the field
+        for start in range(0, n_targets, chunk_size):
+            stop = min(start + chunk_size, n_targets)
+            map_coord_trans_into(
+                self._data,
+                np.ascontiguousarray(target_positions[start:stop], dtype=np.float64),
+                M1,
+                t,
+                M2,
+                out[start:stop],
+                self.interpolation_order,
+            )
 
-        # Rotates the field
-        return out.T  # @ combined_affine[:3, :3].T
+        return out
 
     def get_b_field(
         self,
@@ -1137,7 +1314,13 @@ class SampledGridPointElements(TmsCoilElements):
             )
 
         return SampledGridPointElements(
-            self.stimulator, data, combined_affine, self.name, frozen_casing
+            self.stimulator,
+            data,
+            combined_affine,
+            self.name,
+            frozen_casing,
+            dtype=self.dtype,
+            interpolation_order=self.interpolation_order,
         )
 
     def to_tcd(
@@ -564,7 +564,7 @@ def warp_volume(image_fn, m2m_folder, out_name,
         out_name = name + '_MNI' + end
 
     if os.path.splitext(image_fn)[1] == '.msh':
-        m = read_msh(image_fn)
+        m = read_msh(image_fn, mmap=True)
         if keep_tissues is not None:
             m = m.crop_mesh(tags=keep_tissues)
 
@@ -641,7 +641,7 @@ def interpolate_to_volume(fn_mesh, reference, fn_out, create_masks=False,
     if isinstance(fn_mesh, str):
         if not os.path.isfile(fn_mesh):
             raise IOError('Could not find mesh file: {0}'.format(fn_mesh))
-        mesh = read_msh(fn_mesh)
+        mesh = read_msh(fn_mesh, mmap=True)
     else:
         mesh = copy.deepcopy(fn_mesh)
 
@@ -1808,7 +1808,7 @@ def middle_gm_interpolation(
                 raise ValueError("Invalid quantity: {0}".format(q))
         return d
 
-    m = mesh_io.read_msh(mesh_fn)
+    m = mesh_io.read_msh(mesh_fn, mmap=True)
     _, sim_name = os.path.split(mesh_fn)
     sim_name = "." + os.path.splitext(sim_name)[0]
 